@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Stand-in kinit/klist/kdestroy for benchmarking krbticket without a KDC.
+
+The tool is selected by the name it is invoked as (argv[0]).  kinit writes a
+real MIT FILE ccache (version 4), so both klist and krbticket's native ccache
+reader see realistic data.
+
+Environment variables:
+
+- FAKE_KRB5_LATENCY: seconds to sleep before doing any work (default: 0)
+- FAKE_KRB5_FAILURE_RATE: probability in [0, 1] that kinit fails (default: 0)
+- FAKE_KRB5_LIFETIME: default ticket lifetime in seconds (default: 36000)
+- FAKE_KRB5_STORE: directory of the files emulating KEYRING, KCM and the other
+  ccache types (default: /tmp/fakekrb5_<uid>)
+"""
+import os
+import random
+import re
+import struct
+import sys
+import time
+
+REALM_SEP = '@'
+TKT_FLG_RENEWABLE = 0x00800000
+TKT_FLG_INITIAL = 0x00400000
+
+
+def fail(tool, message):
+    sys.stderr.write('{}: {}\n'.format(tool, message))
+    sys.exit(1)
+
+
+def parse_duration(value):
+    if re.match(r'^\d+$', value):
+        return int(value)
+    total = 0
+    for amount, unit in re.findall(r'(\d+)([smhd])', value):
+        total += int(amount) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[unit]
+    return total
+
+
+def ccache_path(name):
+    if name is None:
+        name = os.environ.get('KRB5CCNAME', '/tmp/krb5cc_{}'.format(os.getuid()))
+    if name.startswith('FILE:'):
+        name = name[len('FILE:'):]
+    elif name.startswith('DIR::'):
+        name = name[len('DIR::'):]
+    elif re.match(r'^[A-Z]+:', name):
+        # the other ccache types are emulated by files
+        store = os.environ.get('FAKE_KRB5_STORE', '/tmp/fakekrb5_{}'.format(os.getuid()))
+        os.makedirs(store, exist_ok=True)
+        name = os.path.join(store, re.sub(r'[^A-Za-z0-9_.-]', '_', name))
+    return name
+
+
+def display_name(name):
+    if name is None:
+        name = os.environ.get('KRB5CCNAME', '/tmp/krb5cc_{}'.format(os.getuid()))
+    if re.match(r'^[A-Z]+:', name) and not name.startswith('FILE:') and not name.startswith('DIR::'):
+        return name
+    return 'FILE:{}'.format(ccache_path(name))
+
+
+def pack_data(data):
+    return struct.pack('>I', len(data)) + data
+
+
+def pack_principal(name):
+    primary, realm = name.rsplit(REALM_SEP, 1)
+    components = primary.split('/')
+    out = struct.pack('>II', 1, len(components)) + pack_data(realm.encode())
+    for component in components:
+        out += pack_data(component.encode())
+    return out
+
+
+def unpack_data(buf, pos):
+    length, = struct.unpack_from('>I', buf, pos)
+    pos += 4
+    return buf[pos:pos + length], pos + length
+
+
+def unpack_principal(buf, pos):
+    _, count = struct.unpack_from('>II', buf, pos)
+    pos += 8
+    realm, pos = unpack_data(buf, pos)
+    components = []
+    for _ in range(count):
+        component, pos = unpack_data(buf, pos)
+        components.append(component.decode())
+    return '{}@{}'.format('/'.join(components), realm.decode()), pos
+
+
+def write_ccache(path, client, server, times, flags):
+    authtime, starttime, endtime, renew_till = times
+    cred = pack_principal(client) + pack_principal(server)
+    cred += struct.pack('>HI', 23, 16) + os.urandom(16)
+    cred += struct.pack('>IIII', authtime, starttime, endtime, renew_till)
+    cred += struct.pack('>BI', 0, flags)
+    cred += struct.pack('>II', 0, 0)
+    cred += pack_data(os.urandom(256)) + pack_data(b'')
+    header = struct.pack('>HHHH', 0x0504, 12, 1, 8) + struct.pack('>ii', 0, 0)
+    data = header + pack_principal(client) + cred
+
+    tmp = '{}.fake.{}'.format(path, os.getpid())
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_ccache(path):
+    with open(path, 'rb') as f:
+        buf = f.read()
+    pos = 2
+    header_len, = struct.unpack_from('>H', buf, pos)
+    pos += 2 + header_len
+    client, pos = unpack_principal(buf, pos)
+    creds = []
+    while pos < len(buf):
+        cred_client, pos = unpack_principal(buf, pos)
+        server, pos = unpack_principal(buf, pos)
+        _, pos = unpack_data(buf, pos + 2)
+        times = struct.unpack_from('>IIII', buf, pos)
+        pos += 16 + 1
+        flags, = struct.unpack_from('>I', buf, pos)
+        pos += 4 + 8
+        _, pos = unpack_data(buf, pos)
+        _, pos = unpack_data(buf, pos)
+        creds.append((server, times, flags))
+    return client, creds
+
+
+def kinit(argv):
+    lifetime = int(os.environ.get('FAKE_KRB5_LIFETIME', 36000))
+    renewable = None
+    ccache = None
+    keytab = None
+    use_keytab = False
+    renew = False
+    principal = None
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '-l':
+            lifetime = parse_duration(args.pop(0))
+        elif arg == '-r':
+            renewable = parse_duration(args.pop(0))
+        elif arg == '-c':
+            ccache = args.pop(0)
+        elif arg == '-t':
+            keytab = args.pop(0)
+        elif arg == '-k':
+            use_keytab = True
+        elif arg == '-R':
+            renew = True
+        else:
+            principal = arg
+
+    path = ccache_path(ccache)
+    now = int(time.time())
+    if renew:
+        try:
+            client, creds = read_ccache(path)
+        except (IOError, OSError):
+            fail('kinit', 'No credentials cache found while renewing credentials')
+        _, (authtime, starttime, endtime, renew_till), flags = creds[0]
+        if not flags & TKT_FLG_RENEWABLE or renew_till <= now or endtime <= now:
+            fail('kinit', 'Ticket expired while renewing credentials')
+        endtime = min(now + (endtime - starttime), renew_till)
+        realm = client.rsplit(REALM_SEP, 1)[1]
+        write_ccache(path, client, 'krbtgt/{0}@{0}'.format(realm),
+                     (authtime, now, endtime, renew_till), flags & ~TKT_FLG_INITIAL)
+        return
+
+    if use_keytab:
+        keytab = keytab or os.environ.get('KRB5_KTNAME', '/etc/krb5.keytab')
+        if keytab.startswith('FILE:'):
+            keytab = keytab[len('FILE:'):]
+        if not os.path.isfile(keytab):
+            fail('kinit', 'Key table file \'{}\' not found while getting initial credentials'.format(keytab))
+    rate = float(os.environ.get('FAKE_KRB5_FAILURE_RATE', 0))
+    if rate and random.random() < rate:
+        fail('kinit', 'Cannot contact any KDC for realm while getting initial credentials')
+    if REALM_SEP not in principal:
+        principal = '{}@EXAMPLE.COM'.format(principal)
+    realm = principal.rsplit(REALM_SEP, 1)[1]
+    flags = TKT_FLG_INITIAL
+    renew_till = 0
+    if renewable:
+        flags |= TKT_FLG_RENEWABLE
+        renew_till = now + renewable
+    write_ccache(path, principal, 'krbtgt/{0}@{0}'.format(realm),
+                 (now, now, now + lifetime, renew_till), flags)
+
+
+def klist(argv):
+    ccache = None
+    list_all = False
+    status_only = False
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '-c':
+            ccache = args.pop(0)
+        elif arg == '-A':
+            list_all = True
+        elif arg == '-s':
+            status_only = True
+
+    if status_only:
+        # exits w/ 1 unless the ccache has valid tickets
+        try:
+            _, creds = read_ccache(ccache_path(ccache))
+        except (IOError, OSError):
+            sys.exit(1)
+        sys.exit(0 if any(times[2] > time.time() for _, times, _ in creds) else 1)
+
+    if list_all:
+        # DIR collections only
+        collection = os.environ.get('KRB5CCNAME', '')
+        if not collection.startswith('DIR:') or collection.startswith('DIR::'):
+            fail('klist', 'unsupported collection: {}'.format(collection))
+        directory = collection[len('DIR:'):]
+        blocks = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith('tkt'):
+                path = os.path.join(directory, name)
+                blocks.append(klist_ccache('DIR::{}'.format(path), path))
+        sys.stdout.write('\n'.join(blocks))
+        return
+
+    sys.stdout.write(klist_ccache(display_name(ccache), ccache_path(ccache)))
+
+
+def klist_ccache(name, path):
+    try:
+        client, creds = read_ccache(path)
+    except (IOError, OSError):
+        fail('klist', 'No credentials cache found (filename: {})'.format(path))
+
+    def fmt(ts):
+        return time.strftime('%m/%d/%y %H:%M:%S', time.localtime(ts))
+
+    out = ['Ticket cache: {}'.format(name),
+           'Default principal: {}'.format(client),
+           '',
+           'Valid starting     Expires            Service principal']
+    for server, (authtime, starttime, endtime, renew_till), flags in creds:
+        out.append('{}  {}  {}'.format(fmt(starttime or authtime), fmt(endtime), server))
+        if flags & TKT_FLG_RENEWABLE and renew_till:
+            out.append('\trenew until {}'.format(fmt(renew_till)))
+    return '\n'.join(out) + '\n'
+
+
+def kdestroy(argv):
+    ccache = None
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '-c':
+            ccache = args.pop(0)
+    try:
+        os.remove(ccache_path(ccache))
+    except FileNotFoundError:
+        pass
+
+
+def main():
+    time.sleep(float(os.environ.get('FAKE_KRB5_LATENCY', 0)))
+    tool = os.path.basename(sys.argv[0])
+    {'kinit': kinit, 'klist': klist, 'kdestroy': kdestroy}[tool](sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
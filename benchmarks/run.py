@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+krbticket benchmark
+
+Measures latency and throughput of krbticket operations under N threads x M processes,
+for each ticket updater strategy. Each process runs the updater of the strategy in the
+background, and the update operation calls its update(). Kerberos commands are replaced by the stand-in
+commands in benchmarks/bin, so no KDC is required.
+
+usage: python benchmarks/run.py --threads 4 --processes 4 --latency 0.01
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from krbticket import KrbCommand, KrbConfig, KrbTicket, NoCredentialFound  # noqa: E402
+from krbticket import SimpleKrbTicketUpdater, MultiProcessKrbTicketUpdater, SingleProcessKrbTicketUpdater  # noqa: E402
+from krbticket import LeaderKrbTicketUpdater, KrbCCacheReaper  # noqa: E402
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+KEYTAB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'conf', 'krb5.keytab')
+
+STRATEGIES = {
+    'Simple': SimpleKrbTicketUpdater,
+    'MultiProcess': MultiProcessKrbTicketUpdater,
+    'SingleProcess': SingleProcessKrbTicketUpdater,
+    'Leader': LeaderKrbTicketUpdater,
+}
+
+
+def _get_by_config(config, ticket):
+    KrbTicket.get_by_config(config)
+
+
+def _update(config, ticket):
+    # the strategy's update, e.g. the lease of LeaderKrbTicketUpdater
+    ticket.updater().update()
+
+
+def _init_by_config(config, ticket):
+    KrbTicket.init_by_config(config)
+
+
+def _klist(config, ticket):
+    KrbCommand.klist(config)
+
+
+def _lock_shared(config, ticket):
+    with KrbCommand.lock(config).shared():
+        pass
+
+
+def _lock_exclusive(config, ticket):
+    with KrbCommand.lock(config).exclusive():
+        pass
+
+
+OPERATIONS = {
+    'get_by_config': _get_by_config,
+    'update': _update,
+    'init_by_config': _init_by_config,
+    'klist': _klist,
+    'lock_shared': _lock_shared,
+    'lock_exclusive': _lock_exclusive,
+}
+
+
+def _config(args, strategy):
+    return KrbConfig(
+        principal='user@EXAMPLE.COM',
+        keytab=KEYTAB,
+        kinit_bin=os.path.join(BIN_DIR, 'kinit'),
+        klist_bin=os.path.join(BIN_DIR, 'klist'),
+        kdestroy_bin=os.path.join(BIN_DIR, 'kdestroy'),
+        ticket_lifetime='1h',
+        ticket_renewable_lifetime='2h',
+        updater_class=STRATEGIES[strategy],
+        ccache_reader=args.ccache_reader,
+        fingerprint_cache=not args.no_fingerprint_cache,
+        atomic_update=args.atomic_update,
+        retry_options={
+            'wait_exponential_multiplier': 10,
+            'wait_exponential_max': 100,
+            'stop_max_attempt_number': 3})
+
+
+def _worker(args, strategy, operation, results):
+    config = _config(args, strategy)
+    try:
+        ticket = KrbTicket.get_by_config(config)
+    except NoCredentialFound:
+        ticket = KrbTicket.init_by_config(config)
+    updater = ticket.updater(interval=args.update_interval)
+    updater.start()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run():
+        for i in range(args.iterations):
+            started = time.perf_counter()
+            try:
+                OPERATIONS[operation](config, ticket)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=run) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    updater.stop()
+    if updater.is_alive():
+        # lets the running update finish before exit
+        updater.join()
+    # destroyed by the parent, since atexit handlers don't run in multiprocessing children
+    results.put((latencies, errors, config.ccache_name))
+
+
+def _percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench(args, strategy, operation):
+    config = _config(args, strategy)
+    KrbCommand.kdestroy(config)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_worker, args=(args, strategy, operation, results))
+                 for i in range(args.processes)]
+    started = time.perf_counter()
+    for p in processes:
+        p.start()
+    latencies, errors, ccache_names = [], [], set()
+    for p in processes:
+        (process_latencies, process_errors, ccache_name) = results.get()
+        latencies.extend(process_latencies)
+        errors.extend(process_errors)
+        ccache_names.add(ccache_name)
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    # per-process ccaches
+    for ccache_name in ccache_names - {config.ccache_name}:
+        KrbCCacheReaper.remove(ccache_name)
+
+    return {
+        'strategy': strategy,
+        'operation': operation,
+        'count': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p90_ms': _percentile(latencies, 90) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else float('nan'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=1, help='threads per process')
+    parser.add_argument('--processes', type=int, default=1, help='number of processes')
+    parser.add_argument('--iterations', type=int, default=100, help='iterations per thread')
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument('--operations', nargs='+', default=list(OPERATIONS), choices=list(OPERATIONS))
+    parser.add_argument('--update-interval', type=float, default=1, help='interval of the updaters in seconds')
+    parser.add_argument('--latency', type=float, default=0, help='latency of stand-in commands in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0, help='failure rate of stand-in kinit')
+    parser.add_argument('--ccache-reader', default='klist', choices=['klist', 'native'])
+    parser.add_argument('--no-fingerprint-cache', action='store_true')
+    parser.add_argument('--atomic-update', action='store_true')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args(argv)
+
+    os.environ['FAKE_KRB5_LATENCY'] = str(args.latency)
+    os.environ['FAKE_KRB5_FAILURE_RATE'] = str(args.failure_rate)
+    os.environ['KRB5CCNAME'] = os.path.join(tempfile.mkdtemp(prefix='krbticket-bench-'), 'krb5cc')
+
+    if not args.json:
+        print('{:<14} {:<15} {:>8} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}'.format(
+            'strategy', 'operation', 'count', 'errors', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for strategy in args.strategies:
+        for operation in args.operations:
+            result = bench(args, strategy, operation)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print('{strategy:<14} {operation:<15} {count:>8} {errors:>7} {throughput:>10.1f}'
+                      ' {p50_ms:>9.3f} {p90_ms:>9.3f} {p99_ms:>9.3f} {max_ms:>9.3f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
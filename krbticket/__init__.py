@@ -1,3 +1,15 @@
 from krbticket.ticket import *
 from krbticket.updater import *
 from krbticket.config import *
+from krbticket.command import *
+from krbticket.ccache import *
+from krbticket.aio import *
+from krbticket.lock import *
+from krbticket.metrics import *
+from krbticket.executor import *
+from krbticket.status import *
+from krbticket.inprocess import *
+from krbticket.fork import *
+from krbticket.registry import *
+from krbticket.reaper import *
+from krbticket.metadata import *
@@ -0,0 +1,437 @@
+"""
+asyncio API
+
+AsyncKrbTicket and AsyncKrbCommand provide the same operations as KrbTicket and KrbCommand
+without blocking the event loop. Kerberos commands run on asyncio subprocesses, and locks
+are acquired by polling instead of blocking. Other backends set by config.command_class,
+e.g. InProcessKrbCommand, run on the default executor of the event loop.
+"""
+import asyncio
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from krbticket.ccache import CCacheFormatError, KrbCCache
+from krbticket.command import KrbCircuitBreaker, KrbCircuitOpenError, KrbCommand
+from krbticket.config import KrbConfig
+from krbticket.executor import KrbCommandHelper
+from krbticket.metrics import KrbMetrics
+from krbticket.ticket import KrbTicket, NoCredentialFound
+from krbticket.updater import KrbTicketUpdater, next_interval
+
+logger = logging.getLogger(__name__)
+
+
+class _AsyncLock():
+    """
+    acquires the same locks as KrbCommand without blocking the event loop
+    """
+    MIN_POLL_INTERVAL = 0.001
+    MAX_POLL_INTERVAL = 0.1
+
+    def __init__(self, config, shared=False):
+        self.lock = KrbCommand.lock(config)
+        self.shared = shared
+        # readers don't need the lock if the ccache is always replaced atomically
+        self.acquire = not (shared and config.atomic_update and KrbCommand._ccache_path(config))
+
+    async def __aenter__(self):
+        if not self.acquire:
+            return self
+
+        started = time.monotonic()
+        poll_interval = self.MIN_POLL_INTERVAL
+        while True:
+            # w/o on_lock_wait, which is emitted once with the whole wait below
+            if self.shared:
+                acquired = self.lock._acquire_shared(blocking=False)
+            else:
+                acquired = self.lock._acquire_exclusive(blocking=False)
+            if acquired:
+                KrbMetrics.emit('on_lock_wait', self.lock.path, 'shared' if self.shared else 'exclusive',
+                                time.monotonic() - started)
+                return self
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.acquire:
+            return
+        if self.shared:
+            self.lock.release_shared()
+        else:
+            self.lock.release_exclusive()
+
+
+class AsyncKrbCommand():
+    @staticmethod
+    async def kinit(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.kinit, config)
+        breaker = KrbCircuitBreaker.get(config)
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            return await AsyncKrbCommand._retry(
+                config, 'kinit', lambda: AsyncKrbCommand._atomic_update(config, KrbCommand.kinit_commands),
+                breaker=breaker)
+        await AsyncKrbCommand._call(config, KrbCommand.kinit_commands(config), breaker=breaker)
+
+    @staticmethod
+    async def renewal(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.renewal, config)
+        breaker = KrbCircuitBreaker.get(config)
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            return await AsyncKrbCommand._retry(
+                config, 'renewal',
+                lambda: AsyncKrbCommand._atomic_update(config, KrbCommand.renewal_commands, copy_ccache=True),
+                breaker=breaker)
+        await AsyncKrbCommand._call(config, KrbCommand.renewal_commands(config), breaker=breaker)
+
+    @staticmethod
+    async def klist(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.klist, config)
+        return await AsyncKrbCommand._call(config, KrbCommand.klist_commands(config), shared=True)
+
+    @staticmethod
+    async def kdestroy(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.kdestroy, config)
+        return await AsyncKrbCommand._call(config, KrbCommand.kdestroy_commands(config))
+
+    @staticmethod
+    async def cache_exists(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.cache_exists, config)
+        path = KrbCommand._ccache_path(config)
+        async with _AsyncLock(config, shared=True):
+            if path:
+                return os.path.isfile(path)
+
+            try:
+                await AsyncKrbCommand._exec(config, 'klist', KrbCommand.klist_commands(config))
+                return True
+            except subprocess.CalledProcessError:
+                return False
+
+    @staticmethod
+    async def klist_if_exists(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.klist_if_exists, config)
+        if KrbCommand._ccache_path(config):
+            return await AsyncKrbCommand.klist(config) if await AsyncKrbCommand.cache_exists(config) else None
+
+        async with _AsyncLock(config, shared=True):
+            try:
+                return await AsyncKrbCommand._exec(config, 'klist', KrbCommand.klist_commands(config))
+            except subprocess.CalledProcessError:
+                return None
+
+    @staticmethod
+    async def read_ccache(config):
+        if AsyncKrbCommand._delegated(config):
+            return await AsyncKrbCommand._run_in_executor(config.command_class.read_ccache, config)
+        path = KrbCommand._ccache_path(config)
+        if not path:
+            raise CCacheFormatError("unsupported ccache type: {}".format(config.ccache_name))
+
+        async with _AsyncLock(config, shared=True):
+            logger.debug("Reading {}".format(path))
+            return KrbCCache.read(path)
+
+    @staticmethod
+    def _delegated(config):
+        """
+        True if config.command_class is not the kinit/klist subprocess backend, which runs natively here
+        """
+        return config.command_class is not KrbCommand
+
+    @staticmethod
+    async def _run_in_executor(func, config):
+        return await asyncio.get_event_loop().run_in_executor(None, func, config)
+
+    @staticmethod
+    async def _atomic_update(config, commands_builder, copy_ccache=False):
+        # async version of KrbCommand._atomic_update. the caller has to hold the exclusive lock.
+        path = KrbCommand._ccache_path(config)
+        tmp_config = KrbCommand._tmp_config(config)
+        commands = commands_builder(tmp_config)
+        try:
+            if copy_ccache:
+                KrbCommand._copy_ccache(path, tmp_config.ccache_name)
+            await AsyncKrbCommand._exec(config, KrbCommand._command_name(config, commands), commands)
+            os.replace(tmp_config.ccache_name, path)
+        finally:
+            if os.path.exists(tmp_config.ccache_name):
+                os.remove(tmp_config.ccache_name)
+
+    @staticmethod
+    async def _call(config, commands, shared=False, breaker=None):
+        name = KrbCommand._command_name(config, commands)
+        return await AsyncKrbCommand._retry(config, name, lambda: AsyncKrbCommand._exec(config, name, commands),
+                                            shared=shared, breaker=breaker)
+
+    @staticmethod
+    async def _retry(config, name, func, shared=False, breaker=None):
+        """
+        retries await func() under the lock according to retry_options like KrbCommand._retry.
+
+        supported options: stop_max_attempt_number, stop_max_delay, wait_fixed,
+        wait_exponential_multiplier and wait_exponential_max
+        """
+        options = config.retry_options
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if breaker:
+                    breaker.before()
+                async with _AsyncLock(config, shared=shared):
+                    try:
+                        output = await func()
+                    except Exception:
+                        if breaker:
+                            breaker.failure()
+                        raise
+                if breaker:
+                    breaker.success()
+                return output
+            except (FileNotFoundError, KrbCircuitOpenError):
+                # will not retry if command is not found, or the circuit breaker is open.
+                raise
+            except Exception as e:
+                if attempt >= options.get('stop_max_attempt_number', float('inf')):
+                    raise
+                if (time.monotonic() - started) * 1000 >= options.get('stop_max_delay', float('inf')):
+                    raise
+                logger.warning("the command failed. attempting retry... retry_options={}".format(options))
+                KrbMetrics.emit('on_retry', config, name, attempt, e)
+                await asyncio.sleep(AsyncKrbCommand._wait_ms(options, attempt) / 1000.0)
+
+    @staticmethod
+    def _wait_ms(options, attempt):
+        # compatible with the wait strategies of retrying
+        if 'wait_exponential_multiplier' in options or 'wait_exponential_max' in options:
+            wait = options.get('wait_exponential_multiplier', 1) * (2 ** attempt)
+            return min(wait, options.get('wait_exponential_max', float('inf')))
+        return options.get('wait_fixed', 0)
+
+    @staticmethod
+    async def _exec(config, name, commands):
+        logger.debug("Executing {}".format(" ".join(commands)))
+        custom_env = os.environ.copy()
+        custom_env["LC_ALL"] = "C"
+        started = time.monotonic()
+        try:
+            if config.command_executor == 'helper':
+                output = await asyncio.get_event_loop().run_in_executor(
+                    None, KrbCommandHelper.default().check_output, commands, custom_env)
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    *commands, stdout=subprocess.PIPE, env=custom_env)
+                stdout, _ = await process.communicate()
+                output = stdout.decode()
+                if process.returncode:
+                    raise subprocess.CalledProcessError(process.returncode, commands, output=output)
+        except Exception as e:
+            KrbMetrics.emit('on_command', config, name, time.monotonic() - started, e)
+            raise
+        KrbMetrics.emit('on_command', config, name, time.monotonic() - started, None)
+        return output
+
+
+class AsyncKrbTicket():
+    """
+    asyncio counterpart of KrbTicket
+
+    wraps the KrbTicket registered for the ccache, so ticket attributes are shared with KrbTicket.
+    The wrapper is kept in the KrbTicket, and leaves the registry together with it.
+    """
+    def __init__(self, ticket):
+        self.ticket = ticket
+        self._updater = None
+
+    def __getattr__(self, name):
+        return getattr(self.ticket, name)
+
+    def updater_start(self, interval=KrbTicketUpdater.DEFAULT_INTERVAL,
+                      schedule=KrbTicketUpdater.SCHEDULE_INTERVAL,
+                      max_interval=KrbTicketUpdater.DEFAULT_MAX_INTERVAL):
+        updater = self.updater(interval=interval, schedule=schedule, max_interval=max_interval)
+        updater.start()
+
+    def updater(self, interval=KrbTicketUpdater.DEFAULT_INTERVAL,
+                schedule=KrbTicketUpdater.SCHEDULE_INTERVAL,
+                max_interval=KrbTicketUpdater.DEFAULT_MAX_INTERVAL):
+        if not self._updater:
+            self._updater = AsyncKrbTicketUpdater(self, interval=interval, schedule=schedule,
+                                                  max_interval=max_interval)
+        return self._updater
+
+    async def maybe_update(self):
+        try:
+            await self.reload()
+
+            if self.ticket.is_expired():
+                if self.ticket.is_renewalable():
+                    await self.renewal()
+                    KrbMetrics.emit('on_update', self.ticket, 'renewal')
+                else:
+                    await self.reinit()
+                    KrbMetrics.emit('on_update', self.ticket, 'reinit')
+        except KrbCircuitOpenError as e:
+            # keeps serving the cached ticket until the cool-down ends
+            logger.warning("Skipping the ticket update: {}".format(e))
+            self.ticket._set_last_error(e)
+            return
+        except Exception as e:
+            self.ticket._set_last_error(e)
+            raise
+        self.ticket._set_last_error(None)
+        KrbMetrics.emit('on_ticket', self.ticket)
+
+    async def renewal(self):
+        logger.info("Renewing ticket for {}...".format(self.ticket.principal))
+        await AsyncKrbCommand.renewal(self.ticket.config)
+        self.ticket._fingerprint = None
+        await self.reload()
+
+    async def reinit(self):
+        logger.info("Reinitialize ticket for {}...".format(self.ticket.principal))
+        await AsyncKrbCommand.kinit(self.ticket.config)
+        self.ticket._fingerprint = None
+        await self.reload()
+
+    async def reload(self):
+        self.ticket._touch()
+        if self.ticket._is_unchanged():
+            return
+
+        logger.debug("Reloading ticket attributes from {}...".format(self.ticket.file))
+        self.ticket._reloaded((await AsyncKrbTicket.get_by_config(self.ticket.config)).ticket)
+        logger.debug("Reloaded ticket attributes: {}...".format(self.ticket))
+
+    @staticmethod
+    def _wrap(ticket):
+        with ticket._lock():
+            if not ticket._async_ticket:
+                ticket._async_ticket = AsyncKrbTicket(ticket)
+        return ticket._async_ticket
+
+    @staticmethod
+    async def init(principal, keytab=None, **kwargs):
+        config = KrbConfig(principal=principal, keytab=keytab, **kwargs)
+        return await AsyncKrbTicket.init_by_config(config)
+
+    @staticmethod
+    async def init_by_config(config):
+        await AsyncKrbCommand.kinit(config)
+        return await AsyncKrbTicket.get_by_config(config)
+
+    @staticmethod
+    async def get_or_init(principal, keytab=None, **kwargs):
+        config = KrbConfig(principal=principal, keytab=keytab, **kwargs)
+        try:
+            return await AsyncKrbTicket.get_by_config(config)
+        except NoCredentialFound:
+            return await AsyncKrbTicket.init_by_config(config)
+
+    @staticmethod
+    async def get(principal, keytab=None, **kwargs):
+        config = KrbConfig(principal=principal, keytab=keytab, **kwargs)
+        return await AsyncKrbTicket.get_by_config(config)
+
+    @staticmethod
+    async def get_by_config(config):
+        if not KrbCommand._ccache_path(config):
+            # the same as KrbTicket.get_by_config()
+            output = await AsyncKrbCommand.klist_if_exists(config)
+            if output is None:
+                raise NoCredentialFound()
+            ticket = KrbTicket.parse_from_klist(config, output)
+            ticket._set_fingerprint(None)
+            return AsyncKrbTicket._wrap(ticket)
+
+        if not await AsyncKrbCommand.cache_exists(config):
+            raise NoCredentialFound()
+
+        fingerprint = config.command_class.ccache_fingerprint(config)
+        ticket = KrbTicket._load_metadata(config, fingerprint)
+        if not ticket:
+            ticket = await AsyncKrbTicket._read(config)
+            ticket._set_fingerprint(fingerprint)
+            KrbTicket._save_metadata(ticket, fingerprint)
+        return AsyncKrbTicket._wrap(ticket)
+
+    @staticmethod
+    async def _read(config):
+        if config.ccache_reader == 'native':
+            try:
+                return KrbTicket.parse_from_ccache(config, await AsyncKrbCommand.read_ccache(config))
+            except (CCacheFormatError, OSError) as e:
+                logger.debug("Falling back to klist since the native ccache reader failed: {}".format(e))
+
+        return KrbTicket.parse_from_klist(config, await AsyncKrbCommand.klist(config))
+
+
+class AsyncKrbTicketUpdater():
+    """
+    asyncio task updating a ticket periodically
+
+    This is a counterpart of SimpleKrbTicketUpdater, and has to be started in a running event loop.
+    """
+    def __init__(self, ticket, interval=KrbTicketUpdater.DEFAULT_INTERVAL,
+                 schedule=KrbTicketUpdater.SCHEDULE_INTERVAL,
+                 min_interval=KrbTicketUpdater.DEFAULT_MIN_INTERVAL,
+                 max_interval=KrbTicketUpdater.DEFAULT_MAX_INTERVAL):
+        self.ticket = ticket
+        self.interval = interval
+        self.schedule = schedule
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stop_event = asyncio.Event()
+        self.task = None
+        self._loop = None
+        self._thread_id = None
+
+    def start(self):
+        if self.task:
+            logger.debug("Skipping start() since it already started...")
+            return
+
+        self._loop = asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        """
+        stops the updater. may be called from other threads, e.g. on eviction from the ticket registry.
+        """
+        logger.debug("Stopping ticket updater...")
+        if self._loop and self._thread_id != threading.get_ident():
+            self._loop.call_soon_threadsafe(self.stop_event.set)
+        else:
+            self.stop_event.set()
+
+    def is_alive(self):
+        return bool(self.task) and not self.task.done()
+
+    def next_interval(self):
+        return next_interval(self.ticket.ticket, self.interval, self.schedule, self.min_interval, self.max_interval)
+
+    async def run(self):
+        logger.info("{} start...".format(self.__class__.__name__))
+        while not self.stop_event.is_set():
+            try:
+                logger.debug("Trying to update ticket...")
+                await self.ticket.maybe_update()
+            except Exception:
+                # retried at the next interval instead of ending the task
+                logger.exception("Failed to update ticket: {}".format(self.ticket.ticket))
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=self.next_interval())
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,157 @@
+from datetime import datetime
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+# ticket flags. see: RFC 4120 5.3
+TKT_FLG_RENEWABLE = 0x00800000
+
+# realm of the special entries MIT krb5 stores configuration data in
+CONFIG_REALM = 'X-CACHECONF:'
+
+
+class CCacheFormatError(Exception):
+    pass
+
+
+class KrbCredential():
+    """
+    A credential entry in a credential cache
+    """
+    __slots__ = ('principal', 'service_principal', 'starting', 'expires',
+                 'renew_expires', 'flags')
+
+    def __init__(self, principal=None, service_principal=None, starting=None,
+                 expires=None, renew_expires=None, flags=None):
+        self.principal = principal
+        self.service_principal = service_principal
+        self.starting = starting
+        self.expires = expires
+        self.renew_expires = renew_expires
+        self.flags = flags
+
+    def __str__(self):
+        super_str = super(KrbCredential, self).__str__()
+        return "{}: principal={}, service_principal={}, starting={}," \
+               " expires={}, renew_expires={}, flags={}" \
+               .format(super_str, self.principal, self.service_principal,
+                       self.starting, self.expires, self.renew_expires,
+                       self.flags)
+
+
+class KrbCCache():
+    """
+    In-process reader of MIT krb5 FILE credential caches (format version 3 and 4)
+
+    see: https://web.mit.edu/kerberos/krb5-devel/doc/formats/ccache_file_format.html
+    """
+    SUPPORTED_VERSIONS = (0x0503, 0x0504)
+
+    def __init__(self, file=None, version=None, principal=None, credentials=None):
+        self.file = file
+        self.version = version
+        self.principal = principal
+        self.credentials = credentials or []
+
+    def primary_credential(self):
+        """
+        the first credential which is not a configuration entry, usually TGT.
+        """
+        if self.credentials:
+            return self.credentials[0]
+
+    @staticmethod
+    def read(file):
+        with open(file, 'rb') as f:
+            return KrbCCache.parse(f.read(), file=file)
+
+    @staticmethod
+    def parse(data, file=None):
+        try:
+            return _CCacheParser(data).parse(file)
+        except struct.error as e:
+            raise CCacheFormatError("truncated ccache: {}".format(e))
+
+
+class _CCacheParser():
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.version = None
+
+    def parse(self, file):
+        self.version = self._unpack('>H')
+        if self.version not in KrbCCache.SUPPORTED_VERSIONS:
+            raise CCacheFormatError("unsupported ccache version: {:#06x}".format(self.version))
+
+        if self.version == 0x0504:
+            # skip header tags (e.g. KDC time offset)
+            self._skip(self._unpack('>H'))
+
+        principal = self._principal()
+        credentials = []
+        while self.pos < len(self.data):
+            credential = self._credential()
+            if credential:
+                credentials.append(credential)
+
+        return KrbCCache(file=file, version=self.version, principal=principal, credentials=credentials)
+
+    def _credential(self):
+        client = self._principal()
+        server = self._principal()
+        self._unpack('>H')  # enctype
+        if self.version == 0x0503:
+            self._unpack('>H')  # enctype is repeated in version 3
+        self._data()  # key
+        authtime, starttime, endtime, renew_till = self._unpack('>IIII')
+        self._unpack('>B')  # is_skey
+        flags = self._unpack('>I')
+        for _ in range(self._unpack('>I')):  # addresses
+            self._unpack('>H')
+            self._data()
+        for _ in range(self._unpack('>I')):  # authdata
+            self._unpack('>H')
+            self._data()
+        self._data()  # ticket
+        self._data()  # second ticket
+
+        if server.endswith('@' + CONFIG_REALM):
+            return None
+
+        return KrbCredential(
+            principal=client,
+            service_principal=server,
+            starting=self._datetime(starttime or authtime),
+            expires=self._datetime(endtime),
+            renew_expires=self._datetime(renew_till) if flags & TKT_FLG_RENEWABLE else None,
+            flags=flags)
+
+    def _principal(self):
+        self._unpack('>I')  # name type
+        count = self._unpack('>I')
+        realm = self._data().decode('utf-8')
+        components = [self._data().decode('utf-8') for _ in range(count)]
+        return '{}@{}'.format('/'.join(components), realm)
+
+    def _data(self):
+        length = self._unpack('>I')
+        if self.pos + length > len(self.data):
+            raise CCacheFormatError("truncated ccache at offset {}".format(self.pos))
+        data = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return data
+
+    def _skip(self, length):
+        self.pos += length
+
+    def _unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values[0] if len(values) == 1 else values
+
+    @staticmethod
+    def _datetime(timestamp):
+        if timestamp:
+            return datetime.fromtimestamp(timestamp)
@@ -1,19 +1,61 @@
-import fasteners
+from contextlib import contextmanager
+import copy
 import logging
+from krbticket.ccache import KrbCCache, CCacheFormatError
+from krbticket.executor import KrbCommandHelper
+from krbticket.lock import KrbLock
+from krbticket.metrics import KrbMetrics
 import os
 import subprocess
 import threading
+import time
 from retrying import retry
 
 logger = logging.getLogger(__name__)
-# fasteners is for interprocess multiprocessing
-# threading.Lock is for multithreading
-lock = threading.Lock()
 
 
 class KrbCommand():
     @staticmethod
     def kinit(config):
+        breaker = KrbCircuitBreaker.get(config)
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            return KrbCommand._retry(
+                config, 'kinit',
+                lambda: KrbCommand._atomic_update(
+                    config, lambda tmp_config: KrbCommand._execute(config, KrbCommand.kinit_commands(tmp_config))),
+                lock=lambda: KrbCommand.lock(config).exclusive(), breaker=breaker)
+        KrbCommand._call(config, KrbCommand.kinit_commands(config), breaker=breaker)
+
+    @staticmethod
+    def renewal(config):
+        breaker = KrbCircuitBreaker.get(config)
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            return KrbCommand._retry(
+                config, 'renewal',
+                lambda: KrbCommand._atomic_update(
+                    config, lambda tmp_config: KrbCommand._execute(config, KrbCommand.renewal_commands(tmp_config)),
+                    copy_ccache=True),
+                lock=lambda: KrbCommand.lock(config).exclusive(), breaker=breaker)
+        KrbCommand._call(config, KrbCommand.renewal_commands(config), breaker=breaker)
+
+    @staticmethod
+    def klist(config):
+        return KrbCommand._call(config, KrbCommand.klist_commands(config), shared=True)
+
+    @staticmethod
+    def kdestroy(config):
+        return KrbCommand._call(config, KrbCommand.kdestroy_commands(config))
+
+    @staticmethod
+    def klist_collection(config):
+        """
+        klist output of all ccaches in the collection config.ccache_name (e.g. DIR:/path, KCM:) by a single klist -A
+        """
+        return KrbCommand._run(config, KrbCommand.klist_collection_commands(config),
+                               env={'KRB5CCNAME': config.ccache_name})
+
+    @staticmethod
+    def kinit_commands(config):
         commands = []
         commands.append(config.kinit_bin)
         if config.ticket_lifetime:
@@ -30,11 +72,10 @@ class KrbCommand():
             commands.append("-t")
             commands.append(config.keytab)
         commands.append(config.principal)
-
-        KrbCommand._call(config, commands)
+        return commands
 
     @staticmethod
-    def renewal(config):
+    def renewal_commands(config):
         commands = []
         commands.append(config.kinit_bin)
         if config.ccache_name:
@@ -42,52 +83,333 @@ class KrbCommand():
             commands.append(config.ccache_name)
         commands.append("-R")
         commands.append(config.principal)
-
-        KrbCommand._call(config, commands)
+        return commands
 
     @staticmethod
-    def klist(config):
+    def klist_commands(config):
         commands = []
         commands.append(config.klist_bin)
         if config.ccache_name:
             commands.append("-c")
             commands.append(config.ccache_name)
-        return KrbCommand._call(config, commands)
+        return commands
 
     @staticmethod
-    def kdestroy(config):
+    def klist_collection_commands(config):
+        return [config.klist_bin, "-A"]
+
+    @staticmethod
+    def kdestroy_commands(config):
         commands = []
         commands.append(config.kdestroy_bin)
         if config.ccache_name:
             commands.append("-c")
             commands.append(config.ccache_name)
-        return KrbCommand._call(config, commands)
+        return commands
 
     @staticmethod
     def cache_exists(config):
-        with lock:
-            with fasteners.InterProcessLock(config.ccache_cmd_lockfile):
-                return os.path.isfile(config.ccache_name)
+        """
+        True if the ccache file exists, or for the other ccache types, if klist finds the ccache.
+        the ccache exists even if its tickets have expired, so that they are updated instead of NoCredentialFound.
+        """
+        path = KrbCommand._ccache_path(config)
+        with KrbCommand._read_lock(config):
+            if path:
+                return os.path.isfile(path)
+
+            try:
+                KrbCommand._execute(config, KrbCommand.klist_commands(config))
+                return True
+            except subprocess.CalledProcessError:
+                return False
+
+    @staticmethod
+    def klist_if_exists(config):
+        """
+        klist output, or None if the ccache doesn't exist. for the ccache types other than FILE, a single klist
+        checks the existence and reads the ccache.
+        """
+        command_class = config.command_class
+        overridden = (command_class.klist, command_class.cache_exists) != (KrbCommand.klist, KrbCommand.cache_exists)
+        if KrbCommand._ccache_path(config) or overridden:
+            return command_class.klist(config) if command_class.cache_exists(config) else None
+
+        with KrbCommand._read_lock(config):
+            try:
+                return KrbCommand._execute(config, KrbCommand.klist_commands(config))
+            except subprocess.CalledProcessError:
+                return None
+
+    @staticmethod
+    def lock(config):
+        """
+        KrbLock for the ccache. Commands reading the ccache share it, and commands updating the ccache take it exclusively.
+        """
+        return KrbLock.get(config.ccache_cmd_lockfile)
+
+    @staticmethod
+    def read_ccache(config):
+        """
+        read the ccache in-process instead of executing klist
+        """
+        path = KrbCommand._ccache_path(config)
+        if not path:
+            raise CCacheFormatError("unsupported ccache type: {}".format(config.ccache_name))
+
+        with KrbCommand._read_lock(config):
+            logger.debug("Reading {}".format(path))
+            return KrbCCache.read(path)
+
+    @staticmethod
+    def read_collection(config):
+        """
+        read all ccaches in the DIR collection config.ccache_name in-process instead of executing klist -A
+        """
+        ccache_type, directory = config.ccache_name.split(':', 1) if ':' in config.ccache_name else (None, None)
+        if ccache_type != 'DIR' or directory.startswith(':'):
+            raise CCacheFormatError("unsupported ccache collection: {}".format(config.ccache_name))
+
+        ccaches = []
+        for name in sorted(os.listdir(directory)):
+            # subsidiary ccaches are named tkt*, and 'primary' names the default one
+            if name.startswith('tkt'):
+                path = os.path.join(directory, name)
+                logger.debug("Reading {}".format(path))
+                ccaches.append(KrbCCache.read(path))
+        return ccaches
+
+    @staticmethod
+    def _read_lock(config):
+        """
+        readers don't need the lock if the ccache is always replaced atomically
+        """
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            return _nolock()
+        return KrbCommand.lock(config).shared()
+
+    @staticmethod
+    def _atomic_update(config, update, copy_ccache=False):
+        """
+        updates a temporary ccache next to the ccache by update(tmp_config), and replaces the ccache with it.
+        the caller has to hold the exclusive lock.
+        """
+        path = KrbCommand._ccache_path(config)
+        tmp_config = KrbCommand._tmp_config(config)
+        try:
+            if copy_ccache:
+                KrbCommand._copy_ccache(path, tmp_config.ccache_name)
+            update(tmp_config)
+            os.replace(tmp_config.ccache_name, path)
+        finally:
+            if os.path.exists(tmp_config.ccache_name):
+                os.remove(tmp_config.ccache_name)
+
+    @staticmethod
+    def _tmp_config(config):
+        tmp_config = copy.copy(config)
+        tmp_config.ccache_name = '{}.krbticket.tmp.{}.{}'.format(
+            KrbCommand._ccache_path(config), os.getpid(), threading.get_ident())
+        return tmp_config
 
     @staticmethod
-    def _call(config, commands):
+    def _copy_ccache(src, dst):
+        with open(src, 'rb') as f:
+            data = f.read()
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+    @staticmethod
+    def ccache_fingerprint(config):
+        """
+        (inode, size, mtime_ns) of the ccache file, or None if it's unavailable
+        """
+        path = KrbCommand._ccache_path(config)
+        if not path:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def _ccache_path(config):
+        """
+        file path of a FILE ccache or a DIR subsidiary ccache (DIR::path), or None for the other ccache types
+        """
+        return KrbCommand._ccache_path_of(config.ccache_name)
+
+    @staticmethod
+    def ccache_type(config):
+        """
+        type of the ccache, e.g. FILE, DIR, KEYRING, KCM or MEMORY
+        """
+        return KrbCommand._split_ccache_name(config.ccache_name)[0]
+
+    @staticmethod
+    def _split_ccache_name(ccache_name):
+        """
+        (type, residual) of the ccache name. FILE if the name has no type prefix.
+        """
+        if ':' in ccache_name:
+            ccache_type, residual = ccache_name.split(':', 1)
+            return ccache_type, residual
+        return 'FILE', ccache_name
+
+    @staticmethod
+    def _ccache_path_of(ccache_name):
+        ccache_type, residual = KrbCommand._split_ccache_name(ccache_name)
+        if ccache_type == 'DIR' and residual.startswith(':'):
+            return residual[1:]
+        if ccache_type != 'FILE':
+            return None
+        return residual
+
+    @staticmethod
+    def _call(config, commands, shared=False, breaker=None):
+        if shared:
+            lock = lambda: KrbCommand._read_lock(config)  # noqa: E731
+        else:
+            lock = lambda: KrbCommand.lock(config).exclusive()  # noqa: E731
+        return KrbCommand._retry(config, KrbCommand._command_name(config, commands),
+                                 lambda: KrbCommand._execute(config, commands), lock=lock, breaker=breaker)
+
+    @staticmethod
+    def _run(config, commands, env=None):
+        return KrbCommand._retry(config, KrbCommand._command_name(config, commands),
+                                 lambda: KrbCommand._execute(config, commands, env=env))
+
+    @staticmethod
+    def _execute(config, commands, env=None):
+        logger.debug("Executing {}".format(" ".join(commands)))
+        custom_env = os.environ.copy()
+        custom_env.update(env or {})
+        custom_env["LC_ALL"] = "C"
+        if config.command_executor == 'helper':
+            return KrbCommandHelper.default().check_output(commands, env=custom_env)
+        return subprocess.check_output(commands, universal_newlines=True, env=custom_env)
+
+    @staticmethod
+    def _retry(config, name, func, lock=None, breaker=None):
+        """
+        calls func with retries according to config.retry_options
+
+        lock() is held only while func is running, so that waits between attempts don't block others.
+        """
+        attempts = [0]
 
         def error_on_retry(exception):
-            # will not retry if command is not found.
-            if type(exception) == FileNotFoundError:
+            # will not retry if command is not found, or the circuit breaker is open.
+            if type(exception) in (FileNotFoundError, KrbCircuitOpenError):
                 raise exception
 
             logger.warning("the command failed. attempting retry... retry_options={}".format(config.retry_options))
+            KrbMetrics.emit('on_retry', config, name, attempts[0], exception)
             return True
 
         retry_options = {**config.retry_options, **{'retry_on_exception': error_on_retry}}
         @retry(**retry_options)
         def retriable_call():
-            logger.debug("Executing {}".format(" ".join(commands)))
-            custom_env = os.environ.copy()
-            custom_env["LC_ALL"] = "C"
-            return subprocess.check_output(commands, universal_newlines=True, env=custom_env)
-
-        with lock:
-            with fasteners.InterProcessLock(config.ccache_cmd_lockfile):
-                return retriable_call()
+            attempts[0] += 1
+            if breaker:
+                breaker.before()
+            with lock() if lock else _nolock():
+                started = time.monotonic()
+                try:
+                    output = func()
+                except Exception as e:
+                    KrbMetrics.emit('on_command', config, name, time.monotonic() - started, e)
+                    if breaker:
+                        breaker.failure()
+                    raise
+            KrbMetrics.emit('on_command', config, name, time.monotonic() - started, None)
+            if breaker:
+                breaker.success()
+            return output
+
+        return retriable_call()
+
+    @staticmethod
+    def _command_name(config, commands):
+        if commands[0] == config.kinit_bin:
+            return 'renewal' if '-R' in commands else 'kinit'
+        if commands[0] == config.klist_bin:
+            return 'klist'
+        if commands[0] == config.kdestroy_bin:
+            return 'kdestroy'
+        return os.path.basename(commands[0])
+
+
+class KrbCircuitOpenError(Exception):
+    pass
+
+
+class KrbCircuitBreaker():
+    """
+    Circuit breaker for kinit and renewal of a ccache in this process
+
+    Opens after circuit_breaker_threshold consecutive failed attempts, and rejects attempts by
+    KrbCircuitOpenError for circuit_breaker_cooldown seconds. After the cool-down, a single attempt
+    is let through, and the breaker closes if it succeeds.
+    """
+    __instances__ = {}
+    __instances_lock__ = threading.Lock()
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get(config):
+        """
+        the breaker for the ccache, or None if it's disabled
+        """
+        if not config.circuit_breaker_threshold:
+            return None
+
+        with KrbCircuitBreaker.__instances_lock__:
+            if config.ccache_name not in KrbCircuitBreaker.__instances__:
+                KrbCircuitBreaker.__instances__[config.ccache_name] = KrbCircuitBreaker(
+                    config.circuit_breaker_threshold, config.circuit_breaker_cooldown)
+            return KrbCircuitBreaker.__instances__[config.ccache_name]
+
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def before(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise KrbCircuitOpenError(
+                    "circuit breaker is open after {} failures. retry in {:.1f} sec".format(self.failures, remaining))
+            # half-open: lets this attempt through, and rejects the others until it finishes
+            self.opened_at = time.monotonic()
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Circuit breaker is closed")
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("Circuit breaker is open after {} failures".format(self.failures))
+                self.opened_at = time.monotonic()
+
+
+@contextmanager
+def _nolock():
+    yield
@@ -1,7 +1,13 @@
+import copy
 from datetime import timedelta
+import hashlib
 import logging
 import multiprocessing
 import os
+import tempfile
+
+from krbticket.command import KrbCommand
+from krbticket.reaper import KrbCCacheReaper
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +22,15 @@ class KrbConfig():
                  ticket_renewable_lifetime=None,
                  ccache_name=None,
                  updater_class=SimpleKrbTicketUpdater,
+                 ccache_reader='klist',
+                 fingerprint_cache=True,
+                 metadata_cache=False,
+                 atomic_update=False,
+                 command_class=KrbCommand,
+                 command_executor='subprocess',
+                 circuit_breaker_threshold=0,
+                 circuit_breaker_cooldown=60,
+                 lock_dir=None,
                  retry_options={
                      'wait_exponential_multiplier': 1000,
                      'wait_exponential_max': 30000,
@@ -29,10 +44,19 @@ class KrbConfig():
         self.ticket_lifetime = ticket_lifetime
         self.ticket_renewable_lifetime = ticket_renewable_lifetime
         self.updater_class = updater_class
+        self.ccache_reader = ccache_reader
+        self.fingerprint_cache = fingerprint_cache
+        self.metadata_cache = metadata_cache
+        self.atomic_update = atomic_update
+        self.command_class = command_class
+        self.command_executor = command_executor
+        self.circuit_breaker_threshold = circuit_breaker_threshold
+        self.circuit_breaker_cooldown = circuit_breaker_cooldown
+        # lock files of ccaches other than files are created in this directory
+        self.lock_dir = lock_dir
         self.retry_options = retry_options
         self.ccache_name = ccache_name if ccache_name else self._ccache_name()
-        self.ccache_lockfile = '{}.krbticket.lock'.format(self.ccache_name)
-        self.ccache_cmd_lockfile = '{}.krbticket.cmd.lock'.format(self.ccache_name)
+        self._set_lockfiles()
 
     def __str__(self):
         super_str = super(KrbConfig, self).__str__()
@@ -41,13 +65,53 @@ class KrbConfig():
                " renewal_threshold={}, ticket_lifetime={}, " \
                " ticket_renewable_lifetime={}, " \
                " retry_options={}, ccache_name={}, " \
-               " updater_class={}" \
+               " updater_class={}, ccache_reader={}," \
+               " fingerprint_cache={}, metadata_cache={}, atomic_update={}," \
+               " command_class={}, command_executor={}," \
+               " circuit_breaker_threshold={}, circuit_breaker_cooldown={}," \
+               " lock_dir={}" \
                .format(super_str, self.principal, self.keytab, self.kinit_bin,
                        self.klist_bin, self.kdestroy_bin,
                        self.renewal_threshold, self.ticket_lifetime,
                        self.ticket_renewable_lifetime,
                        self.retry_options, self.ccache_name,
-                       self.updater_class)
+                       self.updater_class, self.ccache_reader,
+                       self.fingerprint_cache, self.metadata_cache, self.atomic_update,
+                       self.command_class, self.command_executor,
+                       self.circuit_breaker_threshold, self.circuit_breaker_cooldown,
+                       self.lock_dir)
+
+    def _with_ccache_name(self, ccache_name):
+        """
+        copy of the config for another ccache
+        """
+        config = copy.copy(self)
+        config.ccache_name = ccache_name
+        config._set_lockfiles()
+        return config
+
+    def _set_lockfiles(self):
+        self.ccache_lockfile = '{}.krbticket.lock'.format(self._lockfile_prefix())
+        self.ccache_cmd_lockfile = '{}.krbticket.cmd.lock'.format(self._lockfile_prefix())
+        self.ccache_leasefile = '{}.krbticket.lease'.format(self._lockfile_prefix())
+        self.ccache_metafile = '{}.krbticket.meta'.format(self._lockfile_prefix())
+
+    def _lockfile_prefix(self):
+        path = KrbCommand._ccache_path_of(self.ccache_name)
+        if path and self.ccache_name.startswith('DIR::'):
+            # hidden, since every tkt* file in a DIR collection is a ccache
+            return os.path.join(os.path.dirname(path), '.' + os.path.basename(path))
+        if path:
+            return path
+
+        # KEYRING, KCM, MEMORY, DIR collections, etc. have no file to put the lock files next to
+        ccache_type = KrbCommand.ccache_type(self)
+        name = 'krbticket_{}_{}_{}'.format(
+            os.getuid(), ccache_type.lower(), hashlib.sha1(self.ccache_name.encode()).hexdigest()[:16])
+        if ccache_type == 'MEMORY':
+            # MEMORY ccaches are private to the process
+            name = '{}_{}'.format(name, os.getpid())
+        return os.path.join(self.lock_dir or tempfile.gettempdir(), name)
 
     def _ccache_name(self):
         if self.updater_class.use_per_process_ccache():
@@ -65,9 +129,14 @@ class KrbConfig():
         if self._is_main_process():
             return self._default_ccache_name()
 
-        new_ccname = "/tmp/krb5cc_{}_{}".format(os.getuid(), os.getpid())
+        new_ccname = KrbConfig._per_process_ccache_path()
+        KrbCCacheReaper.register_exit(new_ccname)
         # Update KRB5CCNAME for kinit
         os.environ['KRB5CCNAME'] = new_ccname
         logger.info("env KRB5CCNAME is updated to '{}' for multiprocessing".format(new_ccname))
 
         return os.environ.get('KRB5CCNAME')
+
+    @staticmethod
+    def _per_process_ccache_path(pid=None):
+        return "/tmp/krb5cc_{}_{}".format(os.getuid(), pid or os.getpid())
@@ -0,0 +1,208 @@
+"""
+krbticket daemon
+
+Keeps the tickets of multiple principals fresh in a single process, so that applications on the node only
+read the ccaches. Tickets are listed in an INI file, one section per ticket. Options in [DEFAULT] apply to
+all tickets.
+
+    [DEFAULT]
+    keytab = /etc/krb5.keytab
+    ticket_lifetime = 10h
+    ticket_renewable_lifetime = 7d
+
+    [hdfs]
+    principal = hdfs/host.example.com@EXAMPLE.COM
+    ccache_name = /var/run/krbticket/krb5cc_hdfs
+
+usage: krbticket-daemon [--status-socket /var/run/krbticket/status.sock] /etc/krbticket.ini
+"""
+import argparse
+import configparser
+from datetime import timedelta
+import logging
+import signal
+import threading
+import time
+
+from krbticket.config import KrbConfig
+from krbticket.status import KrbTicketStatusServer
+from krbticket.ticket import KrbTicket, NoCredentialFound
+from krbticket.updater import KrbTicketUpdater
+import krbticket.updater
+
+logger = logging.getLogger(__name__)
+
+
+class KrbTicketDaemon():
+    """
+    Updates the tickets in a config file
+
+    Options of a ticket section:
+
+    - principal (required), keytab, ccache_name
+    - ticket_lifetime, ticket_renewable_lifetime: passed to kinit as is, e.g. 10h, 7d
+    - renewal_threshold: seconds (default: 1800)
+    - kinit_bin, klist_bin, kdestroy_bin, ccache_reader, command_executor, lock_dir: same as KrbConfig
+    - atomic_update, fingerprint_cache, metadata_cache: true or false
+    - circuit_breaker_threshold, circuit_breaker_cooldown: same as KrbConfig
+    - updater_class: name of a KrbTicketUpdater subclass (default: MultiProcessKrbTicketUpdater)
+    - interval: seconds between updates (default: 600)
+    - schedule: interval or deadline (default: interval)
+    - max_interval: upper bound of seconds between updates in the deadline schedule (default: 86400)
+
+    A ticket failing to start doesn't stop the others, and is retried every RETRY_INTERVAL seconds.
+    """
+    DEFAULT_UPDATER_CLASS = 'MultiProcessKrbTicketUpdater'
+    RETRY_INTERVAL = 60
+
+    def __init__(self, sections):
+        """
+        sections: dict of a ticket name to its options
+        """
+        self.sections = sections
+        self.tickets = {}
+        # ticket name to the monotonic time of the next start attempt
+        self.retries = {}
+        self.stop_event = threading.Event()
+
+    @staticmethod
+    def from_file(path):
+        parser = configparser.ConfigParser(interpolation=None)
+        with open(path) as f:
+            parser.read_file(f)
+        return KrbTicketDaemon({name: dict(parser[name]) for name in parser.sections()})
+
+    def start(self):
+        configs = {name: self.config(options) for (name, options) in self.sections.items()}
+        ccache_names = [config.ccache_name for config in configs.values()]
+        for ccache_name in set(ccache_names):
+            if ccache_names.count(ccache_name) > 1:
+                raise ValueError("ccache_name is shared by multiple tickets: {}".format(ccache_name))
+
+        for (name, config) in configs.items():
+            self._start(name, config)
+
+    def retry(self):
+        """
+        starts the tickets failed to start if their retry time has come
+        """
+        now = time.monotonic()
+        for (name, retry_at) in list(self.retries.items()):
+            if retry_at <= now:
+                self._start(name, self.config(self.sections[name]))
+
+    def _start(self, name, config):
+        options = self.sections[name]
+        logger.info("Starting {}: principal={}, ccache_name={}".format(name, config.principal, config.ccache_name))
+        try:
+            ticket = KrbTicketDaemon._get_or_init(config)
+        except Exception:
+            logger.exception("Failed to start {}. Retrying in {} sec...".format(name, self.RETRY_INTERVAL))
+            self.retries[name] = time.monotonic() + self.RETRY_INTERVAL
+            return
+        self.retries.pop(name, None)
+
+        try:
+            ticket.maybe_update()
+        except Exception:
+            # the updater retries it
+            logger.exception("Failed to update {}".format(name))
+        ticket.updater_start(
+            interval=float(options.get('interval', KrbTicketUpdater.DEFAULT_INTERVAL)),
+            schedule=options.get('schedule', KrbTicketUpdater.SCHEDULE_INTERVAL),
+            max_interval=float(options.get('max_interval', KrbTicketUpdater.DEFAULT_MAX_INTERVAL)))
+        self.tickets[name] = ticket
+
+    def stop(self):
+        logger.info("Stopping krbticket daemon...")
+        for ticket in self.tickets.values():
+            ticket.updater().stop()
+        self.stop_event.set()
+
+    def run(self):
+        """
+        starts updaters, and blocks until stop()
+        """
+        self.start()
+        while not self.stop_event.is_set():
+            # wakes up periodically to handle signals
+            self.stop_event.wait(1)
+            if not self.stop_event.is_set():
+                self.retry()
+
+    @staticmethod
+    def _get_or_init(config):
+        try:
+            return KrbTicket.get_by_config(config)
+        except NoCredentialFound:
+            return KrbTicket.init_by_config(config)
+
+    @staticmethod
+    def config(options):
+        if not options.get('principal'):
+            raise ValueError("principal is required")
+
+        def boolean(key, default):
+            value = options.get(key)
+            if value is None:
+                return default
+            return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
+        kwargs = {}
+        for key in ('keytab', 'ccache_name', 'ticket_lifetime', 'ticket_renewable_lifetime',
+                    'kinit_bin', 'klist_bin', 'kdestroy_bin', 'ccache_reader', 'command_executor', 'lock_dir'):
+            if options.get(key):
+                kwargs[key] = options[key]
+        if options.get('renewal_threshold'):
+            kwargs['renewal_threshold'] = timedelta(seconds=float(options['renewal_threshold']))
+        if options.get('circuit_breaker_threshold'):
+            kwargs['circuit_breaker_threshold'] = int(options['circuit_breaker_threshold'])
+        if options.get('circuit_breaker_cooldown'):
+            kwargs['circuit_breaker_cooldown'] = float(options['circuit_breaker_cooldown'])
+
+        return KrbConfig(
+            principal=options['principal'],
+            updater_class=getattr(krbticket.updater,
+                                  options.get('updater_class', KrbTicketDaemon.DEFAULT_UPDATER_CLASS)),
+            atomic_update=boolean('atomic_update', False),
+            fingerprint_cache=boolean('fingerprint_cache', True),
+            metadata_cache=boolean('metadata_cache', False),
+            **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', help='path to the config file')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--once', action='store_true', help='update the tickets once, and exit')
+    parser.add_argument('--status-socket', help='serve the ticket status on the Unix domain socket')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)s [%(levelname)s] %(name)s %(message)s')
+
+    daemon = KrbTicketDaemon.from_file(args.config)
+    if args.once:
+        failed = False
+        for (name, options) in daemon.sections.items():
+            try:
+                KrbTicketDaemon._get_or_init(KrbTicketDaemon.config(options)).maybe_update()
+            except Exception:
+                logger.exception("Failed to update {}".format(name))
+                failed = True
+        return 1 if failed else 0
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+    if args.status_socket:
+        server = KrbTicketStatusServer(args.status_socket)
+        server.start()
+    try:
+        daemon.run()
+    finally:
+        if args.status_socket:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Pre-forked command helper
+
+KrbCommandHelper runs kerberos commands in a small helper process instead of forking the application process,
+which can be expensive for a process with a large address space. Requests and responses are exchanged as
+JSON lines over pipes. This module only depends on the standard library, since it's also the helper program.
+"""
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class KrbCommandHelper():
+    """
+    Client of the helper process
+
+    The helper is started on the first request. To fork it while the application is still small,
+    start it early by KrbCommandHelper.default().start().
+    """
+    __default__ = None
+    __default_lock__ = threading.Lock()
+
+    def __init__(self):
+        self._process = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def default():
+        """
+        the process wide helper
+        """
+        with KrbCommandHelper.__default_lock__:
+            helper = KrbCommandHelper.__default__
+            # pipes and the reader thread belong to the parent after fork(2)
+            if not helper or helper._pid != os.getpid():
+                helper = KrbCommandHelper()
+                KrbCommandHelper.__default__ = helper
+            return helper
+
+    def start(self):
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        # the reader thread clears _process when the helper exits
+        if self._process:
+            return self._process
+
+        logger.debug("Starting command helper...")
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+        reader = threading.Thread(target=self._read, args=(process,), name='KrbCommandHelper')
+        reader.daemon = True
+        reader.start()
+        self._process = process
+        return process
+
+    def stop(self):
+        with self._lock:
+            process, self._process = self._process, None
+        if process:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            process.wait()
+
+    def check_output(self, commands, env=None):
+        """
+        compatible with subprocess.check_output(commands, universal_newlines=True, env=env)
+        """
+        request_id = next(self._ids)
+        event = threading.Event()
+        with self._lock:
+            process = self._start()
+            self._pending[request_id] = (event, [], process)
+        request = json.dumps({'id': request_id, 'commands': list(commands), 'env': env})
+
+        try:
+            try:
+                with self._write_lock:
+                    process.stdin.write(request.encode() + b'\n')
+                    process.stdin.flush()
+            except OSError:
+                # the helper exited, and a new one is started by the next request
+                with self._lock:
+                    if self._process is process:
+                        self._process = None
+                raise
+            event.wait()
+        finally:
+            with self._lock:
+                _, responses, _ = self._pending.pop(request_id)
+
+        if not responses:
+            raise OSError("command helper exited")
+        response = responses[0]
+        if response.get('error') == 'FileNotFoundError':
+            raise FileNotFoundError(response['message'])
+        if response.get('error'):
+            raise OSError(response['message'])
+        if response['returncode']:
+            raise subprocess.CalledProcessError(response['returncode'], commands, output=response['output'])
+        return response['output']
+
+    def _read(self, process):
+        for line in process.stdout:
+            response = json.loads(line.decode())
+            with self._lock:
+                event, responses, _ = self._pending.get(response['id'], (None, None, None))
+            if event:
+                responses.append(response)
+                event.set()
+
+        logger.debug("Command helper exited")
+        with self._lock:
+            if self._process is process:
+                self._process = None
+            # fails requests waiting for the helper
+            pending = [event for (event, _, p) in self._pending.values() if p is process]
+        for event in pending:
+            event.set()
+
+
+def _execute(request):
+    try:
+        # stdin of the helper is the request pipe
+        completed = subprocess.run(request['commands'], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   universal_newlines=True, env=request['env'])
+        return {'id': request['id'], 'returncode': completed.returncode, 'output': completed.stdout}
+    except Exception as e:
+        return {'id': request['id'], 'error': type(e).__name__, 'message': str(e)}
+
+
+def _main():
+    """
+    helper process: executes each request on a thread, and writes responses in the completion order
+    """
+    write_lock = threading.Lock()
+
+    def execute(request):
+        response = json.dumps(_execute(request))
+        with write_lock:
+            sys.stdout.write(response + '\n')
+            sys.stdout.flush()
+
+    threads = []
+    for line in sys.stdin:
+        thread = threading.Thread(target=execute, args=(json.loads(line),))
+        thread.start()
+        threads = [t for t in threads if t.is_alive()] + [thread]
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    _main()
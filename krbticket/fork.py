@@ -0,0 +1,136 @@
+"""
+fork/spawn integration for per-process ccaches
+
+Child processes get a copy of the parent's ccache as their per-process ccache instead of running kinit,
+so that starting a pool of workers doesn't hit the KDC.
+
+With fork(2), KrbTicketFork.register() clones the ccaches of the tickets registered in the parent into each
+forked child, and resets the locks and the ticket registry inherited from the parent. With the spawn start
+method, pass KrbTicketFork.initializer to the pool:
+
+    ProcessPoolExecutor(initializer=KrbTicketFork.initializer, initargs=(ticket.config.ccache_name,))
+
+Children get the clone by KrbTicket.get_or_init(), which doesn't run kinit while the ccache exists.
+"""
+from datetime import datetime
+import logging
+import multiprocessing.util
+import os
+import threading
+
+from krbticket.command import KrbCircuitBreaker, KrbCommand
+from krbticket.config import KrbConfig
+from krbticket.lock import KrbLock
+from krbticket.reaper import KrbCCacheReaper
+from krbticket.ticket import KrbTicket
+
+logger = logging.getLogger(__name__)
+
+
+class KrbTicketFork():
+    _registered = False
+    _enabled = False
+
+    @staticmethod
+    def register():
+        """
+        clones the ccaches into children forked after this call
+        """
+        if not hasattr(os, 'register_at_fork'):
+            raise RuntimeError("os.register_at_fork is not available. use KrbTicketFork.initializer instead")
+
+        KrbTicketFork._enabled = True
+        if not KrbTicketFork._registered:
+            # fork hooks can't be unregistered
+            os.register_at_fork(after_in_child=KrbTicketFork._after_fork_in_child)
+            KrbTicketFork._registered = True
+
+    @staticmethod
+    def unregister():
+        KrbTicketFork._enabled = False
+
+    @staticmethod
+    def initializer(ccache_name):
+        """
+        pool initializer: clones the ccache into the per-process ccache of the child
+        """
+        KrbTicketFork._reset()
+        path = KrbConfig._per_process_ccache_path()
+        if KrbTicketFork.clone(KrbConfig(ccache_name=ccache_name), path):
+            KrbCCacheReaper.register_exit(path)
+            os.environ['KRB5CCNAME'] = path
+
+    @staticmethod
+    def clone(config, ccache_name):
+        """
+        copies the ccache of config into ccache_name. False if the ccache is not a file, or doesn't exist.
+        """
+        path = KrbCommand._ccache_path(config)
+        if not path or not os.path.isfile(path):
+            return False
+
+        tmp_name = '{}.krbticket.tmp.{}'.format(ccache_name, os.getpid())
+        try:
+            with KrbCommand._read_lock(config):
+                KrbCommand._copy_ccache(path, tmp_name)
+            os.replace(tmp_name, ccache_name)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+        logger.debug("Cloned {} into {}".format(config.ccache_name, ccache_name))
+        return True
+
+    @staticmethod
+    def _after_fork_in_child():
+        if not KrbTicketFork._enabled:
+            return
+
+        # exceptions can't be propagated from fork hooks
+        try:
+            KrbTicketFork._fork_tickets()
+        except Exception:
+            logger.exception("Failed to clone ccaches into the child process")
+
+    @staticmethod
+    def _fork_tickets():
+        tickets = list(KrbTicket.__instances__.values())
+        KrbTicketFork._reset()
+
+        path = KrbConfig._per_process_ccache_path()
+        # the ccache names of the parent, which may be a per-process ccache itself
+        parent_ccache_names = (os.environ.get('KRB5CCNAME', '/tmp/krb5cc_{}'.format(os.getuid())),
+                               KrbConfig._per_process_ccache_path(os.getppid()))
+        for ticket in tickets:
+            config = ticket.config
+            file = ticket.file
+            if config.updater_class.use_per_process_ccache() and config.ccache_name in parent_ccache_names:
+                if not (ticket.expires and ticket.expires > datetime.now()):
+                    # the child runs kinit by itself
+                    continue
+                if not KrbTicketFork.clone(config, path):
+                    continue
+                config = config._with_ccache_name(path)
+                file = path
+                KrbCCacheReaper.register_exit(path)
+                os.environ['KRB5CCNAME'] = path
+
+            # attributes are copied into a new instance, since locks and the updater belong to the parent
+            child = KrbTicket(config=config, file=file, principal=ticket.principal,
+                              starting=ticket.starting, expires=ticket.expires,
+                              service_principal=ticket.service_principal, renew_expires=ticket.renew_expires,
+                              credentials=dict(ticket.credentials))
+            child._set_fingerprint(None)
+            KrbTicket.__instances__[config.ccache_name] = child
+            if file == path:
+                # multiprocessing discards the exit handler registered above when it starts the child
+                multiprocessing.util.register_after_fork(child, lambda _: KrbCCacheReaper.register_exit(path))
+
+    @staticmethod
+    def _reset():
+        # other threads of the parent may have held these locks at fork(2)
+        KrbTicket.__instances__.reset()
+        KrbLock.__instances__ = {}
+        KrbLock.__instances_lock__ = threading.Lock()
+        KrbCircuitBreaker.__instances__ = {}
+        KrbCircuitBreaker.__instances_lock__ = threading.Lock()
@@ -0,0 +1,207 @@
+from datetime import datetime
+import logging
+import os
+import re
+
+from krbticket.ccache import CONFIG_REALM, KrbCCache, KrbCredential
+from krbticket.command import KrbCircuitBreaker, KrbCommand
+
+try:
+    import krb5
+except ImportError:
+    krb5 = None
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessKrbCommand(KrbCommand):
+    """
+    KrbCommand w/o subprocesses
+
+    Gets, renews and inspects tickets in-process through the krb5 python bindings
+    instead of executing kinit/klist/kdestroy. Requires the optional dependency:
+
+        pip install krbticket[krb5]
+    """
+    @staticmethod
+    def kinit(config):
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            update = lambda: KrbCommand._atomic_update(  # noqa: E731
+                config, lambda tmp_config: InProcessKrbCommand._kinit(config, tmp_config.ccache_name))
+        else:
+            update = lambda: InProcessKrbCommand._kinit(config, config.ccache_name)  # noqa: E731
+        KrbCommand._retry(config, 'kinit', update, lock=lambda: KrbCommand.lock(config).exclusive(),
+                          breaker=KrbCircuitBreaker.get(config))
+
+    @staticmethod
+    def renewal(config):
+        if config.atomic_update and KrbCommand._ccache_path(config):
+            update = lambda: KrbCommand._atomic_update(  # noqa: E731
+                config, lambda tmp_config: InProcessKrbCommand._renewal(config, tmp_config.ccache_name),
+                copy_ccache=True)
+        else:
+            update = lambda: InProcessKrbCommand._renewal(config, config.ccache_name)  # noqa: E731
+        KrbCommand._retry(config, 'renewal', update, lock=lambda: KrbCommand.lock(config).exclusive(),
+                          breaker=KrbCircuitBreaker.get(config))
+
+    @staticmethod
+    def klist(config):
+        """
+        klist(1) compatible output
+        """
+        ccache = InProcessKrbCommand.read_ccache(config)
+        return _format_klist(config.ccache_name, ccache)
+
+    @staticmethod
+    def kdestroy(config):
+        path = KrbCommand._ccache_path(config)
+
+        def destroy():
+            if path:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                return
+
+            context = _context()
+            try:
+                krb5.cc_destroy(context, krb5.cc_resolve(context, config.ccache_name.encode()))
+            except krb5.Krb5Error as e:
+                # same as kdestroy, a missing ccache is not an error
+                logger.debug("Ignoring the error on destroying {}: {}".format(config.ccache_name, e))
+
+        KrbCommand._retry(config, 'kdestroy', destroy, lock=lambda: KrbCommand.lock(config).exclusive())
+
+    @staticmethod
+    def cache_exists(config):
+        if KrbCommand._ccache_path(config):
+            return KrbCommand.cache_exists(config)
+
+        with KrbCommand._read_lock(config):
+            context = _context()
+            try:
+                krb5.cc_get_principal(context, krb5.cc_resolve(context, config.ccache_name.encode()))
+                return True
+            except krb5.Krb5Error:
+                return False
+
+    @staticmethod
+    def read_ccache(config):
+        if KrbCommand._ccache_path(config):
+            return KrbCommand.read_ccache(config)
+
+        with KrbCommand._read_lock(config):
+            return InProcessKrbCommand._read_ccache(config)
+
+    @staticmethod
+    def _kinit(config, ccache_name):
+        context = _context()
+        principal = krb5.parse_name_flags(context, config.principal.encode())
+        if config.keytab:
+            keytab = krb5.kt_resolve(context, config.keytab.encode())
+        else:
+            # respects KRB5_KTNAME like kinit
+            keytab = krb5.kt_default(context)
+
+        options = krb5.get_init_creds_opt_alloc(context)
+        if config.ticket_lifetime:
+            krb5.get_init_creds_opt_set_tkt_life(options, _parse_duration(config.ticket_lifetime))
+        if config.ticket_renewable_lifetime:
+            krb5.get_init_creds_opt_set_renew_life(options, _parse_duration(config.ticket_renewable_lifetime))
+
+        logger.debug("Getting initial credentials for {} into {}".format(config.principal, ccache_name))
+        creds = krb5.get_init_creds_keytab(context, principal, options, keytab)
+        ccache = krb5.cc_resolve(context, ccache_name.encode())
+        krb5.cc_initialize(context, ccache, principal)
+        krb5.cc_store_cred(context, ccache, creds)
+
+    @staticmethod
+    def _renewal(config, ccache_name):
+        context = _context()
+        ccache = krb5.cc_resolve(context, ccache_name.encode())
+        principal = krb5.cc_get_principal(context, ccache)
+
+        logger.debug("Renewing credentials in {}".format(ccache_name))
+        creds = krb5.get_renewed_creds(context, principal, ccache)
+        krb5.cc_initialize(context, ccache, principal)
+        krb5.cc_store_cred(context, ccache, creds)
+
+    @staticmethod
+    def _read_ccache(config):
+        context = _context()
+        ccache = krb5.cc_resolve(context, config.ccache_name.encode())
+        principal = _unparse(context, krb5.cc_get_principal(context, ccache))
+        credentials = []
+        for creds in ccache:
+            if creds.server.realm.decode() == CONFIG_REALM:
+                continue
+            times = creds.times
+            credentials.append(KrbCredential(
+                principal=_unparse(context, creds.client),
+                service_principal=_unparse(context, creds.server),
+                starting=_datetime(times.starttime or times.authtime),
+                expires=_datetime(times.endtime),
+                renew_expires=_datetime(times.renew_till)
+                if creds.ticket_flags & krb5.TicketFlags.renewable else None,
+                flags=int(creds.ticket_flags)))
+
+        residual = config.ccache_name.split(':', 1)[-1]
+        return KrbCCache(file=residual, principal=principal, credentials=credentials)
+
+
+def _parse_duration(duration):
+    """
+    seconds of a kinit(1) style duration, e.g. '10h', '1d2h30m', '90s', '1:30' or '3600'
+    """
+    duration = str(duration).strip()
+    if re.match(r'^\d+$', duration):
+        return int(duration)
+
+    match = re.match(r'^(\d+):(\d+)(?::(\d+))?$', duration)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds or 0)
+
+    match = re.match(r'^(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$', duration)
+    if match and any(match.groups()):
+        days, hours, minutes, seconds = [int(v or 0) for v in match.groups()]
+        return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+    raise ValueError("invalid duration: {}".format(duration))
+
+
+def _context():
+    if krb5 is None:
+        raise RuntimeError("InProcessKrbCommand requires krb5 python bindings: pip install krbticket[krb5]")
+    return krb5.init_context()
+
+
+def _unparse(context, principal):
+    return krb5.unparse_name_flags(context, principal).decode()
+
+
+def _datetime(timestamp):
+    if timestamp:
+        return datetime.fromtimestamp(timestamp)
+
+
+def _format_klist(ccache_name, ccache):
+    def format_datetime(t):
+        return t.strftime('%m/%d/%y %H:%M:%S')
+
+    if ':' not in ccache_name:
+        ccache_name = 'FILE:{}'.format(ccache_name)
+    lines = [
+        'Ticket cache: {}'.format(ccache_name),
+        'Default principal: {}'.format(ccache.principal),
+        '',
+        'Valid starting     Expires            Service principal',
+    ]
+    for credential in ccache.credentials:
+        lines.append('{}  {}  {}'.format(
+            format_datetime(credential.starting), format_datetime(credential.expires),
+            credential.service_principal))
+        if credential.renew_expires:
+            lines.append('\trenew until {}'.format(format_datetime(credential.renew_expires)))
+    return '\n'.join(lines) + '\n'
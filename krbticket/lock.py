@@ -0,0 +1,236 @@
+from collections import namedtuple
+from contextlib import contextmanager
+import errno
+import fcntl
+import logging
+import os
+import threading
+import time
+
+from krbticket.metrics import KrbMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class KrbLockHolder(namedtuple('KrbLockHolder', ['pid', 'thread_id', 'mode', 'acquired', 'thread_name'])):
+    """
+    process/thread which took the file lock last, written into the lock file
+    """
+    __slots__ = ()
+    # written in place w/o truncating the file
+    SIZE = 256
+
+    def encode(self):
+        data = '{} {} {} {:.3f} {}'.format(self.pid, self.thread_id, self.mode, self.acquired, self.thread_name)
+        return data.encode()[:self.SIZE - 1].ljust(self.SIZE - 1) + b'\n'
+
+    @staticmethod
+    def decode(data):
+        try:
+            pid, thread_id, mode, acquired, thread_name = data.decode(errors='replace').strip().split(' ', 4)
+            return KrbLockHolder(int(pid), int(thread_id), mode, float(acquired), thread_name)
+        except ValueError:
+            return None
+
+
+class KrbLock():
+    """
+    Shared/exclusive lock for a ccache
+
+    Threads are coordinated by a condition variable, and processes by lockf(3) on the lock file, which is
+    compatible with fasteners.InterProcessLock used by former versions.
+    Readers share the file lock while they are running, and a writer waits until they finish.
+    Waiting writers take priority over new readers to avoid starvation.
+
+    The lock file is kept open, and reopened in forked children. Since closing any fd of the file releases
+    the locks of the process, the file must not be opened elsewhere in the process while the lock is held.
+    Each process taking the file lock writes KrbLockHolder into the lock file, so that processes waiting for it
+    can tell which process/thread is holding it.
+    """
+    __instances__ = {}
+    __instances_lock__ = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        # guards the file lock shared by reader threads
+        self._file_lock = threading.Lock()
+        self._file_holders = 0
+        self._fd = None
+        self._pid = os.getpid()
+        # guards _fd, which is also read by holder() w/o the file lock
+        self._fd_lock = threading.Lock()
+
+    @staticmethod
+    def get(path):
+        """
+        the lock instance for a lock file in this process
+        """
+        path = os.path.abspath(path)
+        with KrbLock.__instances_lock__:
+            lock = KrbLock.__instances__.get(path)
+            # the state of locks inherited by fork(2) belongs to the parent
+            if lock is None or lock._pid != os.getpid():
+                lock = KrbLock.__instances__[path] = KrbLock(path)
+            return lock
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield self
+        finally:
+            self.release_shared()
+
+    @contextmanager
+    def exclusive(self):
+        self.acquire_exclusive()
+        try:
+            yield self
+        finally:
+            self.release_exclusive()
+
+    def acquire_shared(self, blocking=True):
+        started = time.monotonic()
+        acquired = self._acquire_shared(blocking)
+        if acquired:
+            KrbMetrics.emit('on_lock_wait', self.path, 'shared', time.monotonic() - started)
+        return acquired
+
+    def _acquire_shared(self, blocking):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                if not blocking:
+                    return False
+                self._cond.wait()
+            self._readers += 1
+
+        try:
+            with self._holding_file_lock(blocking):
+                if not self._file_holders:
+                    self._lock_file(fcntl.LOCK_SH, blocking)
+                self._file_holders += 1
+            return True
+        except BlockingIOError:
+            self._release_readers()
+            return False
+        except BaseException:
+            self._release_readers()
+            raise
+
+    def release_shared(self):
+        with self._file_lock:
+            self._file_holders -= 1
+            if not self._file_holders:
+                self._unlock_file()
+        self._release_readers()
+
+    def acquire_exclusive(self, blocking=True):
+        started = time.monotonic()
+        acquired = self._acquire_exclusive(blocking)
+        if acquired:
+            KrbMetrics.emit('on_lock_wait', self.path, 'exclusive', time.monotonic() - started)
+        return acquired
+
+    def _acquire_exclusive(self, blocking):
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    if not blocking:
+                        return False
+                    self._cond.wait()
+                self._writer = True
+            finally:
+                self._waiting_writers -= 1
+                if not self._writer:
+                    self._cond.notify_all()
+
+        try:
+            with self._holding_file_lock(blocking):
+                self._lock_file(fcntl.LOCK_EX, blocking)
+            return True
+        except BlockingIOError:
+            self._release_writer()
+            return False
+        except BaseException:
+            self._release_writer()
+            raise
+
+    def release_exclusive(self):
+        with self._file_lock:
+            self._unlock_file()
+        self._release_writer()
+
+    @contextmanager
+    def _holding_file_lock(self, blocking):
+        # a thread waiting for lockf(3) holds _file_lock, which must not block non-blocking callers
+        if not self._file_lock.acquire(blocking):
+            raise BlockingIOError()
+        try:
+            yield
+        finally:
+            self._file_lock.release()
+
+    def _release_readers(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def _release_writer(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    def holder(self):
+        """
+        KrbLockHolder written by the process which took the file lock last, or None
+        """
+        # by the kept fd, since closing another fd of the file would release the lock
+        try:
+            return KrbLockHolder.decode(os.pread(self._open(), KrbLockHolder.SIZE, 0))
+        except OSError:
+            return None
+
+    def _open(self):
+        with self._fd_lock:
+            if self._fd is not None and self._pid != os.getpid():
+                # inherited by fork(2). the child doesn't have the locks of the parent.
+                os.close(self._fd)
+                self._fd = None
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+                self._pid = os.getpid()
+            return self._fd
+
+    def _lock_file(self, operation, blocking):
+        fd = self._open()
+        mode = 'exclusive' if operation == fcntl.LOCK_EX else 'shared'
+        try:
+            fcntl.lockf(fd, operation | fcntl.LOCK_NB)
+        except OSError as e:
+            # EACCES or EAGAIN if another process holds the lock
+            if e.errno not in (errno.EACCES, errno.EAGAIN):
+                raise
+            if not blocking:
+                raise BlockingIOError(e.errno, e.strerror)
+            holder = KrbLockHolder.decode(os.pread(fd, KrbLockHolder.SIZE, 0))
+            logger.debug("Waiting for {} lock on {} held by {}".format(mode, self.path, holder))
+            KrbMetrics.emit('on_lock_contended', self.path, mode, holder)
+            started = time.monotonic()
+            fcntl.lockf(fd, operation)
+            logger.debug("Got {} lock on {} after {:.3f}s".format(mode, self.path, time.monotonic() - started))
+
+        thread = threading.current_thread()
+        holder = KrbLockHolder(os.getpid(), thread.ident, mode, time.time(), thread.name)
+        try:
+            os.pwrite(fd, holder.encode(), 0)
+        except OSError as e:
+            logger.debug("Failed to write the lock holder into {}: {}".format(self.path, e))
+
+    def _unlock_file(self):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN)
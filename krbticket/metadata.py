@@ -0,0 +1,105 @@
+"""
+Ticket attributes cached next to the ccache
+
+After a ticket is read from a ccache, its attributes are written into <ccache>.krbticket.meta with the fingerprint
+of the ccache. New processes trust the file while the fingerprint of the ccache matches, and start w/o klist.
+The file is trusted only if it's a regular file owned by the user w/ mode 0600, since anyone able to write it
+could feed forged ticket attributes.
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+
+from krbticket.ccache import KrbCredential
+
+logger = logging.getLogger(__name__)
+
+
+class KrbTicketMetadata():
+    VERSION = 1
+    DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+    @staticmethod
+    def read(config, fingerprint):
+        """
+        (file, principal, credentials) cached for the fingerprint, or None if the file is missing or outdated
+        """
+        try:
+            fd = os.open(config.ccache_metafile, os.O_RDONLY | os.O_NOFOLLOW)
+            with open(fd) as f:
+                stat = os.fstat(fd)
+                if stat.st_uid != os.getuid() or stat.st_mode & 0o777 != 0o600:
+                    logger.warning("Ignoring {} since it's not owned by uid {} w/ mode 0600".format(
+                        config.ccache_metafile, os.getuid()))
+                    return None
+                data = json.load(f)
+            if data['version'] != KrbTicketMetadata.VERSION or tuple(data['fingerprint']) != tuple(fingerprint):
+                return None
+            credentials = [KrbCredential(principal=c['principal'],
+                                         service_principal=c['service_principal'],
+                                         starting=_parse_datetime(c['starting']),
+                                         expires=_parse_datetime(c['expires']),
+                                         renew_expires=_parse_datetime(c['renew_expires']),
+                                         flags=c['flags'])
+                           for c in data['credentials']]
+            return data['file'], data['principal'], credentials
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug("Ignoring {}: {}".format(config.ccache_metafile, e))
+            return None
+
+    @staticmethod
+    def write(config, fingerprint, ticket):
+        """
+        replaces the file atomically with the attributes of the ticket
+        """
+        data = {
+            'version': KrbTicketMetadata.VERSION,
+            'fingerprint': list(fingerprint),
+            'file': ticket.file,
+            'principal': ticket.principal,
+            'credentials': [{'principal': c.principal,
+                             'service_principal': c.service_principal,
+                             'starting': _format_datetime(c.starting),
+                             'expires': _format_datetime(c.expires),
+                             'renew_expires': _format_datetime(c.renew_expires),
+                             'flags': c.flags}
+                            for c in _credentials(ticket)],
+        }
+
+        tmp_name = '{}.tmp.{}.{}'.format(config.ccache_metafile, os.getpid(), threading.get_ident())
+        try:
+            fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+        except OSError as e:
+            # not created by this call, so it's not removed
+            logger.debug("Failed to write {}: {}".format(config.ccache_metafile, e))
+            return
+
+        try:
+            with open(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_name, config.ccache_metafile)
+        except OSError as e:
+            logger.debug("Failed to write {}: {}".format(config.ccache_metafile, e))
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+
+def _credentials(ticket):
+    # the ticket attributes come from the first credential
+    credentials = list(ticket.credentials.values())
+    first = [c for c in credentials if c.service_principal == ticket.service_principal]
+    return first + [c for c in credentials if c.service_principal != ticket.service_principal]
+
+
+def _format_datetime(value):
+    if value:
+        return value.strftime(KrbTicketMetadata.DATETIME_FORMAT)
+
+
+def _parse_datetime(value):
+    if value:
+        return datetime.strptime(value, KrbTicketMetadata.DATETIME_FORMAT)
@@ -0,0 +1,205 @@
+from datetime import datetime
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class KrbMetrics():
+    """
+    Observer of krbticket metrics
+
+    Override the methods of interest, and register the observer by KrbMetrics.register().
+    Observers are called synchronously from the thread doing the operation, so they should return quickly.
+    """
+    __observers__ = ()
+    __observers_lock__ = threading.Lock()
+
+    def on_command(self, config, command, seconds, error):
+        """
+        called after each execution of a kerberos command (kinit, renewal, klist, kdestroy)
+        """
+
+    def on_retry(self, config, command, attempt, error):
+        """
+        called when a failed command is going to be retried
+        """
+
+    def on_lock_wait(self, lockfile, mode, seconds):
+        """
+        called after a ccache lock is acquired. mode is 'shared' or 'exclusive'
+        """
+
+    def on_lock_contended(self, lockfile, mode, holder):
+        """
+        called when a ccache lock is held by another process. holder is the KrbLockHolder which took the lock last,
+        or None if unknown
+        """
+
+    def on_update(self, ticket, action):
+        """
+        called when KrbTicket.maybe_update() updates the ticket. action is 'renewal' or 'reinit'
+        """
+
+    def on_ticket(self, ticket):
+        """
+        called after KrbTicket.maybe_update() checks the ticket
+        """
+
+    @staticmethod
+    def register(observer):
+        with KrbMetrics.__observers_lock__:
+            KrbMetrics.__observers__ = KrbMetrics.__observers__ + (observer,)
+
+    @staticmethod
+    def unregister(observer):
+        with KrbMetrics.__observers_lock__:
+            KrbMetrics.__observers__ = tuple(o for o in KrbMetrics.__observers__ if o is not observer)
+
+    @staticmethod
+    def enabled():
+        return bool(KrbMetrics.__observers__)
+
+    @staticmethod
+    def emit(event, *args):
+        for observer in KrbMetrics.__observers__:
+            try:
+                getattr(observer, event)(*args)
+            except Exception:
+                logger.exception("Failed to emit {} to {}".format(event, observer))
+
+
+class _Histogram():
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip(self.buckets, self.counts)),
+        }
+
+
+class KrbMetricsCollector(KrbMetrics):
+    """
+    KrbMetrics aggregating metrics in memory
+
+    The metrics are available as a dict by snapshot(), or as Prometheus text format by to_prometheus().
+    """
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._commands = {}
+        self._command_errors = {}
+        self._retries = {}
+        self._lock_waits = {}
+        self._updates = {}
+        # not to keep evicted tickets alive
+        self._tickets = weakref.WeakValueDictionary()
+
+    def on_command(self, config, command, seconds, error):
+        with self._lock:
+            self._histogram(self._commands, command).observe(seconds)
+            if error:
+                self._command_errors[command] = self._command_errors.get(command, 0) + 1
+
+    def on_retry(self, config, command, attempt, error):
+        with self._lock:
+            self._retries[command] = self._retries.get(command, 0) + 1
+
+    def on_lock_wait(self, lockfile, mode, seconds):
+        with self._lock:
+            self._histogram(self._lock_waits, mode).observe(seconds)
+
+    def on_update(self, ticket, action):
+        with self._lock:
+            self._updates[action] = self._updates.get(action, 0) + 1
+
+    def on_ticket(self, ticket):
+        with self._lock:
+            self._tickets[ticket.config.ccache_name] = ticket
+
+    def snapshot(self):
+        now = datetime.now()
+
+        def seconds_until(t):
+            if t:
+                return (t - now).total_seconds()
+
+        with self._lock:
+            return {
+                'command_duration_seconds': {k: v.snapshot() for (k, v) in self._commands.items()},
+                'command_errors_total': dict(self._command_errors),
+                'command_retries_total': dict(self._retries),
+                'lock_wait_seconds': {k: v.snapshot() for (k, v) in self._lock_waits.items()},
+                'updates_total': dict(self._updates),
+                'tickets': {
+                    ccache_name: {
+                        'principal': ticket.principal,
+                        'expires_in_seconds': seconds_until(ticket.expires),
+                        'renew_expires_in_seconds': seconds_until(ticket.renew_expires),
+                    } for (ccache_name, ticket) in list(self._tickets.items())},
+            }
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def histogram(name, help, label, histograms):
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} histogram'.format(name))
+            for (key, h) in sorted(histograms.items()):
+                for (bound, count) in h['buckets'].items():
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(name, label, key, le, count))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(name, label, key, h['sum']))
+                lines.append('{}_count{{{}="{}"}} {}'.format(name, label, key, h['count']))
+
+        def counter(name, help, label, counters):
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} counter'.format(name))
+            for (key, value) in sorted(counters.items()):
+                lines.append('{}{{{}="{}"}} {}'.format(name, label, key, value))
+
+        def gauge(name, help, field):
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} gauge'.format(name))
+            for (ccache_name, ticket) in sorted(snapshot['tickets'].items()):
+                if ticket[field] is not None:
+                    lines.append('{}{{principal="{}",ccache="{}"}} {}'.format(
+                        name, ticket['principal'], ccache_name, ticket[field]))
+
+        histogram('krbticket_command_duration_seconds', 'Duration of kerberos commands',
+                  'command', snapshot['command_duration_seconds'])
+        counter('krbticket_command_errors_total', 'Failed kerberos commands',
+                'command', snapshot['command_errors_total'])
+        counter('krbticket_command_retries_total', 'Retries of kerberos commands',
+                'command', snapshot['command_retries_total'])
+        histogram('krbticket_lock_wait_seconds', 'Time waited for ccache locks',
+                  'mode', snapshot['lock_wait_seconds'])
+        counter('krbticket_updates_total', 'Ticket updates by KrbTicket.maybe_update()',
+                'action', snapshot['updates_total'])
+        gauge('krbticket_ticket_expires_in_seconds', 'Seconds until the ticket expires',
+              'expires_in_seconds')
+        gauge('krbticket_ticket_renew_expires_in_seconds', 'Seconds until the ticket is no longer renewable',
+              'renew_expires_in_seconds')
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, histograms, key):
+        if key not in histograms:
+            histograms[key] = _Histogram(self.buckets)
+        return histograms[key]
@@ -0,0 +1,202 @@
+"""
+Garbage collector of per-process ccaches
+
+Per-process ccaches (/tmp/krb5cc_<uid>_<pid>) and their lock files are left behind when worker processes exit.
+KrbCCacheReaper removes them when the process doesn't exist anymore, or the pid is reused by another process,
+and each process removes its own per-process ccache at exit. Only ccaches w/ the command lock file created by
+krbticket are reaped, since other tools may use the same naming.
+"""
+import atexit
+import fcntl
+import logging
+import multiprocessing.util
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class KrbCCacheReaper():
+    """
+    Removes per-process ccaches of exited processes
+
+    Files modified within min_age seconds are kept to avoid racing with processes just starting.
+    """
+    DEFAULT_DIRECTORY = '/tmp'
+    DEFAULT_MIN_AGE = 60
+    # updaters w/ per-process ccaches reap at most once per interval seconds in a process. disabled if None.
+    interval = None
+
+    # krb5cc_<uid>_<pid>, and krb5cc_<uid>_<pid>.krbticket.*
+    PATTERN = re.compile(r'^krb5cc_(\d+)_(\d+)(\.krbticket\..+)?$')
+    # the marker of ccaches managed by krbticket
+    MARKER = '.krbticket.cmd.lock'
+    # files next to a ccache removed at exit
+    SUFFIXES = ('', '.krbticket.lock', '.krbticket.lease', '.krbticket.meta')
+
+    __last_reaped__ = None
+    __reap_lock__ = threading.Lock()
+    __exit_finalizers__ = {}
+    __exit_lock__ = threading.Lock()
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, min_age=DEFAULT_MIN_AGE):
+        self.directory = directory
+        self.min_age = min_age
+
+    @staticmethod
+    def maybe_reap():
+        """
+        reaps the default directory unless it's reaped within interval in this process
+        """
+        if KrbCCacheReaper.interval is None:
+            return
+        with KrbCCacheReaper.__reap_lock__:
+            last_reaped = KrbCCacheReaper.__last_reaped__
+            if last_reaped is not None and time.monotonic() - last_reaped < KrbCCacheReaper.interval:
+                return
+            KrbCCacheReaper.__last_reaped__ = time.monotonic()
+
+        try:
+            KrbCCacheReaper().reap()
+        except Exception:
+            logger.exception("Failed to reap per-process ccaches")
+
+    def reap(self):
+        """
+        removes per-process ccaches of exited processes. returns the removed ccache paths.
+        """
+        uid = os.getuid()
+        groups = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                match = KrbCCacheReaper.PATTERN.match(entry.name)
+                if not match or int(match.group(1)) != uid:
+                    continue
+                try:
+                    mtime = entry.stat(follow_symlinks=False).st_mtime
+                except FileNotFoundError:
+                    continue
+                # (the latest mtime, files) per pid
+                group = groups.setdefault(int(match.group(2)), [0, []])
+                group[0] = max(group[0], mtime)
+                group[1].append(entry.path)
+
+        removed = []
+        now = time.time()
+        for (pid, (mtime, files)) in groups.items():
+            if now - mtime < self.min_age or _is_running(pid, mtime):
+                continue
+            path = os.path.join(self.directory, 'krb5cc_{}_{}'.format(uid, pid))
+            if path + KrbCCacheReaper.MARKER not in files:
+                logger.debug("Skipping {} since it's not created by krbticket".format(path))
+                continue
+            if KrbCCacheReaper.remove(path, files):
+                removed.append(path)
+        if removed:
+            logger.info("Removed {} per-process ccaches of exited processes in {}".format(
+                len(removed), self.directory))
+        return removed
+
+    @staticmethod
+    def remove(path, files=None):
+        """
+        removes the ccache file and its lock files unless a process holds the lock. True if removed.
+
+        files: the ccache file and the files next to it. derived from the path if not given.
+        """
+        lockfile = path + KrbCCacheReaper.MARKER
+        if files is None:
+            files = [path + suffix for suffix in KrbCCacheReaper.SUFFIXES]
+        try:
+            fd = os.open(lockfile, os.O_RDWR)
+        except FileNotFoundError:
+            fd = None
+
+        try:
+            if fd is not None:
+                try:
+                    # the same lock type as KrbLock. the lock of this process is released at close.
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    logger.debug("Skipping {} since it's locked".format(path))
+                    return False
+
+            # the lock file is removed at last while holding the lock
+            for file in files:
+                if file != lockfile:
+                    _remove(file)
+            _remove(lockfile)
+            logger.debug("Removed {}".format(path))
+            return True
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    @staticmethod
+    def register_exit(path):
+        """
+        removes the per-process ccache at exit of this process
+        """
+        pid = os.getpid()
+
+        def cleanup():
+            # not in forked children, which inherit the registration
+            if os.getpid() != pid:
+                return
+            with KrbCCacheReaper.__exit_lock__:
+                if KrbCCacheReaper.__exit_finalizers__.pop(path, None) is None:
+                    return
+            try:
+                KrbCCacheReaper.remove(path)
+            except OSError as e:
+                logger.debug("Failed to remove {} at exit: {}".format(path, e))
+
+        with KrbCCacheReaper.__exit_lock__:
+            finalizer = KrbCCacheReaper.__exit_finalizers__.get(path)
+            if finalizer is not None and finalizer.still_active():
+                return
+            # multiprocessing children exit by os._exit() w/o atexit handlers, and finalizers registered
+            # before multiprocessing starts a forked child are discarded
+            KrbCCacheReaper.__exit_finalizers__[path] = multiprocessing.util.Finalize(None, cleanup, exitpriority=0)
+            if finalizer is None:
+                atexit.register(cleanup)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _is_running(pid, since):
+    """
+    True if the process exists, and it's not a reused pid, i.e. it started before since (unix time)
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    started = _start_time(pid)
+    # the start time is in clock ticks
+    return started is None or started <= since + 1
+
+
+def _start_time(pid):
+    """
+    start time of the process in unix time, or None if unknown
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # the command name may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
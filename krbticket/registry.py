@@ -0,0 +1,167 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class KrbTicketRegistry():
+    """
+    Tickets indexed by ccache name
+
+    Keys are spread over shards, each with its own lock, so that lookups of different ccaches don't contend.
+    Each shard keeps its tickets in the least recently used order, and evicts tickets which are not looked up
+    for max_idle seconds, or the least recently used ones beyond max_size. on_evict is called with each evicted
+    ticket outside the lock.
+    """
+    DEFAULT_SHARDS = 16
+
+    def __init__(self, shards=DEFAULT_SHARDS, max_size=None, max_idle=None, on_evict=None):
+        self.shards = shards
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.on_evict = on_evict
+        self._shards = [_Shard() for i in range(shards)]
+        # per-shard limit, so that the whole registry stays within max_size
+        self._shard_max_size = -(-max_size // shards) if max_size else None
+
+    def lock(self, key):
+        """
+        the lock of the shard for the key
+        """
+        return self._shard(key).lock
+
+    def get(self, key, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry:
+                shard.entries.move_to_end(key)
+                entry[1] = time.monotonic()
+            evicted = self._evict(shard)
+        self._evicted(evicted)
+        return entry[0] if entry else default
+
+    def setdefault(self, key, factory):
+        """
+        the ticket for the key. factory() is registered if it doesn't exist.
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry:
+                shard.entries.move_to_end(key)
+                entry[1] = time.monotonic()
+            else:
+                entry = [factory(), time.monotonic()]
+                shard.entries[key] = entry
+            evicted = self._evict(shard)
+        self._evicted(evicted)
+        return entry[0]
+
+    def __getitem__(self, key):
+        ticket = self.get(key)
+        if ticket is None:
+            raise KeyError(key)
+        return ticket
+
+    def __setitem__(self, key, ticket):
+        shard = self._shard(key)
+        with shard.lock:
+            shard.entries[key] = [ticket, time.monotonic()]
+            shard.entries.move_to_end(key)
+            evicted = self._evict(shard)
+        self._evicted(evicted)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def pop(self, key, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.pop(key, None)
+        return entry[0] if entry else default
+
+    def __contains__(self, key):
+        shard = self._shard(key)
+        with shard.lock:
+            return key in shard.entries
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def items(self):
+        """
+        snapshot of (key, ticket). doesn't affect the eviction order.
+        """
+        items = []
+        for shard in self._shards:
+            with shard.lock:
+                items.extend((key, entry[0]) for (key, entry) in shard.entries.items())
+        return items
+
+    def keys(self):
+        return [key for (key, _) in self.items()]
+
+    def values(self):
+        return [ticket for (_, ticket) in self.items()]
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+
+    def reset(self):
+        """
+        removes all tickets w/o locking, e.g. in a forked child where the locks may be held by other threads
+        """
+        self._shards = [_Shard() for i in range(self.shards)]
+
+    def evict(self):
+        """
+        evicts idle tickets from all shards. returns the evicted tickets.
+        """
+        evicted = []
+        for shard in self._shards:
+            with shard.lock:
+                evicted.extend(self._evict(shard))
+        self._evicted(evicted)
+        return evicted
+
+    def _shard(self, key):
+        return self._shards[hash(key) % self.shards]
+
+    def _evict(self, shard):
+        evicted = []
+        now = time.monotonic()
+        while shard.entries:
+            key, (ticket, accessed) = next(iter(shard.entries.items()))
+            if self._shard_max_size and len(shard.entries) > self._shard_max_size:
+                reason = 'size'
+            elif self.max_idle is not None and now - accessed > self.max_idle:
+                reason = 'idle'
+            else:
+                break
+            del shard.entries[key]
+            logger.debug("Evicting ticket for {} ({})".format(key, reason))
+            evicted.append(ticket)
+        return evicted
+
+    def _evicted(self, tickets):
+        if not self.on_evict:
+            return
+        for ticket in tickets:
+            try:
+                self.on_evict(ticket)
+            except Exception:
+                logger.exception("Failed to evict ticket: {}".format(ticket))
+
+
+class _Shard():
+    __slots__ = ('lock', 'entries')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [ticket, last access in monotonic time], in the least recently used order
+        self.entries = OrderedDict()
@@ -0,0 +1,176 @@
+"""
+Ticket status service
+
+KrbTicketStatusServer answers status queries over a Unix domain socket from the in-memory KrbTicket state
+of the updater process, and KrbTicketStatusClient queries it w/o executing klist.
+
+The protocol is a JSON object per line. A request may filter tickets by ccache_name or principal:
+
+    {"principal": "user@EXAMPLE.COM"}
+    {"tickets": [{"ccache_name": ..., "principal": ..., "expires": <unix time>, ...}]}
+"""
+from datetime import datetime
+import errno
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from krbticket.ticket import KrbTicket
+
+logger = logging.getLogger(__name__)
+
+
+class KrbTicketStatusServer():
+    """
+    Serves the status of tickets on a Unix domain socket
+
+    All tickets registered in this process are served unless tickets are given.
+    """
+    def __init__(self, path, tickets=None):
+        self.path = path
+        self.tickets = tickets
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._server:
+            logger.debug("Skipping start() since it already started...")
+            return
+
+        self._remove_stale_socket()
+
+        status = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = {'tickets': status.status(**json.loads(line.decode()))}
+                    except Exception as e:
+                        response = {'error': '{}: {}'.format(type(e).__name__, e)}
+                    self.wfile.write(json.dumps(response).encode() + b'\n')
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='KrbTicketStatusServer')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Serving ticket status on {}".format(self.path))
+
+    def _remove_stale_socket(self):
+        """
+        removes the socket left by a previous process. raises OSError if another server is listening on it.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    return
+                if e.errno != errno.ECONNREFUSED:
+                    raise
+                logger.debug("Removing stale socket {}...".format(self.path))
+                os.remove(self.path)
+                return
+        raise OSError(errno.EADDRINUSE, "Another server is listening on {}".format(self.path))
+
+    def stop(self):
+        if not self._server:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def status(self, ccache_name=None, principal=None):
+        tickets = self.tickets
+        if tickets is None:
+            tickets = list(KrbTicket.__instances__.values())
+        return [KrbTicketStatusServer.ticket_status(t) for t in tickets
+                if (not ccache_name or t.config.ccache_name == ccache_name)
+                and (not principal or t.principal == principal)]
+
+    @staticmethod
+    def ticket_status(ticket):
+        def timestamp(t):
+            if t:
+                return t.timestamp()
+
+        now = datetime.now()
+        return {
+            'ccache_name': ticket.config.ccache_name,
+            'principal': ticket.principal,
+            'starting': timestamp(ticket.starting),
+            'expires': timestamp(ticket.expires),
+            'renew_expires': timestamp(ticket.renew_expires),
+            'valid': bool(ticket.expires and ticket.expires > now),
+            'last_error': ticket.last_error,
+            'last_checked': timestamp(ticket.last_checked),
+        }
+
+
+class KrbTicketStatusClient():
+    """
+    Client of KrbTicketStatusServer
+
+    Responses are cached for ttl seconds.
+    """
+    DEFAULT_TTL = 1
+    DEFAULT_TIMEOUT = 5
+
+    def __init__(self, path, ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def status(self, ccache_name=None, principal=None):
+        """
+        list of ticket status. times are converted to datetime
+        """
+        key = (ccache_name, principal)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        request = {k: v for (k, v) in (('ccache_name', ccache_name), ('principal', principal)) if v}
+        response = self._request(request)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+
+        tickets = [KrbTicketStatusClient._parse(t) for t in response['tickets']]
+        with self._lock:
+            self._cache[key] = (time.monotonic(), tickets)
+        return tickets
+
+    def is_valid(self, ccache_name=None, principal=None):
+        """
+        True if the ticket is valid. This doesn't take renewal_threshold into account.
+        """
+        tickets = self.status(ccache_name=ccache_name, principal=principal)
+        return bool(tickets) and all(t['valid'] for t in tickets)
+
+    def _request(self, request):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as f:
+                return json.loads(f.readline().decode())
+
+    @staticmethod
+    def _parse(status):
+        status = dict(status)
+        for key in ('starting', 'expires', 'renew_expires', 'last_checked'):
+            if status.get(key) is not None:
+                status[key] = datetime.fromtimestamp(status[key])
+        return status
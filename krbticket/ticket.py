@@ -1,9 +1,19 @@
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import ExitStack
 from datetime import datetime
 import logging
+import os
 import threading
+import time
 
-from krbticket.command import KrbCommand
+from krbticket.ccache import CCacheFormatError, KrbCredential
+from krbticket.command import KrbCircuitOpenError, KrbCommand
 from krbticket.config import KrbConfig
+from krbticket.metadata import KrbTicketMetadata
+from krbticket.metrics import KrbMetrics
+from krbticket.registry import KrbTicketRegistry
 from krbticket.updater import KrbTicketUpdater
 
 logger = logging.getLogger(__name__)
@@ -13,64 +23,264 @@ class NoCredentialFound(Exception):
     pass
 
 
-class KrbTicket():
+class KrbTicketInitError(Exception):
+    """
+    raised by KrbTicket.init_many() when some tickets are not initialized
+
+    errors: exceptions by ccache name
+    tickets: initialized tickets in the order of the configs, and None for the failed ones
+    """
+    def __init__(self, errors, tickets):
+        super().__init__("Failed to initialize {} of {} tickets: {}".format(
+            len(errors), len(tickets), ', '.join('{}: {!r}'.format(k, v) for (k, v) in errors.items())))
+        self.errors = errors
+        self.tickets = tickets
+
+
+class KrbTicketState(namedtuple('KrbTicketState', ['file', 'principal', 'starting', 'expires', 'service_principal',
+                                                   'renew_expires', 'credentials'])):
+    """
+    immutable snapshot of ticket attributes
+    """
+    __slots__ = ()
+
+
+def _state_property(name):
+    def get(self):
+        return getattr(self._state, name)
+
+    def set(self, value):
+        self._state = self._state._replace(**{name: value})
+
+    return property(get, set)
 
-    __instances__ = {}
-    __instances_lock__ = threading.Lock()
+
+def _evict(ticket):
+    if ticket._updater:
+        ticket._updater.stop()
+    if ticket._async_ticket and ticket._async_ticket._updater:
+        ticket._async_ticket._updater.stop()
+    if ticket._metadata_timer:
+        ticket._metadata_timer.cancel()
+
+
+class KrbTicket():
+    """
+    Kerberos ticket in a ccache
+
+    Ticket attributes are kept in a KrbTicketState, which is replaced as a whole when the ccache is read,
+    so that readers always see attributes from the same read. snapshot() returns the current one.
+    """
+    __instances__ = KrbTicketRegistry(on_evict=_evict)
+
+    file = _state_property('file')
+    principal = _state_property('principal')
+    starting = _state_property('starting')
+    expires = _state_property('expires')
+    service_principal = _state_property('service_principal')
+    renew_expires = _state_property('renew_expires')
+    # credentials in the ccache indexed by service principal
+    credentials = _state_property('credentials')
+
+    # a ccache modified within this window may be modified again without
+    # changing its fingerprint due to the timestamp granularity of filesystems
+    FINGERPRINT_RACY_WINDOW_NS = 1000 * 1000 * 1000
+    # seconds
+    DEFAULT_MAX_STALENESS = 60
+    DEFAULT_INIT_WORKERS = 8
+    INIT_POLL_INTERVAL = 0.1
 
     def __init__(self, config=None, file=None, principal=None, starting=None, expires=None,
-                 service_principal=None, renew_expires=None):
+                 service_principal=None, renew_expires=None, credentials=None):
 
         self.config = config
-        self.file = file
-        self.principal = principal
-        self.starting = starting
-        self.expires = expires
-        self.service_principal = service_principal
-        self.renew_expires = renew_expires
+        self._state = KrbTicketState(file, principal, starting, expires, service_principal, renew_expires,
+                                     credentials or {})
         self._updater = None
-        self._updater_lock = threading.RLock()
+        # AsyncKrbTicket wrapping this ticket
+        self._async_ticket = None
+        self._fingerprint = None
+        self.fingerprint_hits = 0
+        self.fingerprint_misses = 0
+        # result of the last maybe_update()
+        self.last_error = None
+        self.last_checked = None
+        # monotonic time when the attributes are read from the ccache
+        self._refreshed_at = None
+        # created on demand to keep tickets small
+        self._refresh_lock = None
+        self._refresh_thread = None
+        self._metadata_timer = None
+
+    def snapshot(self):
+        """
+        the current KrbTicketState
+        """
+        return self._state
 
-    def updater_start(self, interval=KrbTicketUpdater.DEFAULT_INTERVAL):
-        with self._updater_lock:
-            updater = self.updater(interval=interval)
-            updater.start()
+    def updater_start(self, interval=KrbTicketUpdater.DEFAULT_INTERVAL,
+                      schedule=KrbTicketUpdater.SCHEDULE_INTERVAL,
+                      max_interval=KrbTicketUpdater.DEFAULT_MAX_INTERVAL):
+        self.updater(interval=interval, schedule=schedule, max_interval=max_interval).start()
 
-    def updater(self, interval=KrbTicketUpdater.DEFAULT_INTERVAL):
-        with self._updater_lock:
+    def updater(self, interval=KrbTicketUpdater.DEFAULT_INTERVAL,
+                schedule=KrbTicketUpdater.SCHEDULE_INTERVAL,
+                max_interval=KrbTicketUpdater.DEFAULT_MAX_INTERVAL):
+        with self._lock():
             if not self._updater:
-                self._updater = self.config.updater_class(self, interval=interval)
+                self._updater = self.config.updater_class(self, interval=interval, schedule=schedule,
+                                                          max_interval=max_interval)
         return self._updater
 
     def maybe_update(self):
-        self.reload()
+        try:
+            self.reload()
+
+            if self.is_expired():
+                if self.is_renewalable():
+                    self.renewal()
+                    KrbMetrics.emit('on_update', self, 'renewal')
+                else:
+                    self.reinit()
+                    KrbMetrics.emit('on_update', self, 'reinit')
+        except KrbCircuitOpenError as e:
+            # keeps serving the cached ticket until the cool-down ends
+            logger.warning("Skipping the ticket update: {}".format(e))
+            self._set_last_error(e)
+            return
+        except Exception as e:
+            self._set_last_error(e)
+            raise
+        self._set_last_error(None)
+        KrbMetrics.emit('on_ticket', self)
+
+    def current(self, max_staleness=DEFAULT_MAX_STALENESS):
+        """
+        the ticket w/o executing klist unless the ticket has expired.
+
+        if the attributes are older than max_staleness seconds while the ticket is still valid, a single
+        background refresh is scheduled on the updater, and the current attributes are returned.
+        """
+        self._touch()
+        if self.expires and self.expires > datetime.now():
+            if self._refreshed_at is None or time.monotonic() - self._refreshed_at > max_staleness:
+                self._refresh_in_background()
+            return self
+
+        with self._lock():
+            if not self._refresh_lock:
+                self._refresh_lock = threading.Lock()
+        with self._refresh_lock:
+            # another caller may have updated the ticket while waiting for the lock
+            if not self.expires or self.expires <= datetime.now():
+                self.maybe_update()
+        return self
+
+    def _touch(self):
+        """
+        refreshes the idle time of the ticket in the registry, and registers it again if it's evicted
+        """
+        KrbTicket.__instances__.setdefault(self.config.ccache_name, lambda: self)
+
+    def _lock(self):
+        # tickets share the lock of the registry shard instead of having their own
+        return KrbTicket.__instances__.lock(self.config.ccache_name)
 
-        if self.is_expired():
-            if self.is_renewalable():
-                self.renewal()
-            else:
-                self.reinit()
+    def _refresh_in_background(self):
+        with self._lock():
+            if self._updater and self._updater.is_alive():
+                self._updater.wakeup()
+                return
 
-    def update(self, **kwargs):
-        self.__dict__.update(**kwargs)
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+
+            def refresh():
+                try:
+                    self.maybe_update()
+                except Exception:
+                    logger.exception("Failed to refresh ticket: {}".format(self))
+
+            self._refresh_thread = threading.Thread(target=refresh, name='KrbTicketRefresh')
+            self._refresh_thread.daemon = True
+            self._refresh_thread.start()
+
+    def _set_last_error(self, error):
+        """
+        records the result of maybe_update() for status queries
+        """
+        self.last_error = '{}: {}'.format(type(error).__name__, error) if error else None
+        self.last_checked = datetime.now()
+
+    def update(self, config=None, **kwargs):
+        """
+        replaces the config and the ticket attributes given
+        """
+        if config:
+            self.config = config
+        self._state = self._state._replace(**kwargs)
 
     def renewal(self):
         logger.info("Renewing ticket for {}...".format(self.principal))
-        KrbCommand.renewal(self.config)
+        self.config.command_class.renewal(self.config)
+        self._fingerprint = None
         self.reload()
 
     def reinit(self):
         logger.info("Reinitialize ticket for {}...".format(self.principal))
-        KrbCommand.kinit(self.config)
+        self.config.command_class.kinit(self.config)
+        self._fingerprint = None
         self.reload()
 
     def reload(self):
+        # get_by_config() updates the registered ticket, which is this one unless another one is registered
+        # after this one is evicted
+        self._touch()
+        if self._is_unchanged():
+            return
+
         logger.debug(
             "Reloading ticket attributes from {}...".format(self.file))
-        KrbTicket.get_by_config(self.config)
+        self._reloaded(KrbTicket.get_by_config(self.config))
         logger.debug(
             "Reloaded ticket attributes: {}...".format(self))
 
+    def _reloaded(self, ticket):
+        """
+        takes the attributes read into the registered ticket if it's another one
+        """
+        if ticket is not self:
+            self._state = ticket._state
+            self._fingerprint = ticket._fingerprint
+            self._refreshed_at = ticket._refreshed_at
+
+    def _is_unchanged(self):
+        if not self.config.fingerprint_cache:
+            return False
+
+        if self._fingerprint and self._fingerprint == self.config.command_class.ccache_fingerprint(self.config):
+            self.fingerprint_hits += 1
+            self._refreshed_at = time.monotonic()
+            logger.debug("Skipping reload since {} is not changed".format(self.config.ccache_name))
+            return True
+
+        self.fingerprint_misses += 1
+        return False
+
+    def _set_fingerprint(self, fingerprint):
+        """
+        called when the attributes are read from the ccache
+        """
+        self._refreshed_at = time.monotonic()
+        self._fingerprint = fingerprint if KrbTicket._is_stable(fingerprint) else None
+
+    @staticmethod
+    def _is_stable(fingerprint):
+        """
+        True if the fingerprint identifies the content, i.e. the ccache is not modified within the racy window
+        """
+        return bool(fingerprint) and fingerprint[2] < time.time() * 1e9 - KrbTicket.FINGERPRINT_RACY_WINDOW_NS
+
     def is_expired(self):
         return self.expires < self.config.renewal_threshold + datetime.now()
 
@@ -80,6 +290,28 @@ class KrbTicket():
         else:
             return False
 
+    def service_ticket(self, service_principal):
+        """
+        the credential for the service principal, or None if the ccache doesn't have it.
+
+        the realm of the client principal is used if service_principal has no realm.
+        """
+        if '@' not in service_principal and self.principal:
+            service_principal = '{}@{}'.format(service_principal, self.principal.rsplit('@', 1)[-1])
+        return self.credentials.get(service_principal)
+
+    def service_tickets(self):
+        """
+        all credentials except ticket granting tickets
+        """
+        return [c for c in self.credentials.values() if not c.service_principal.startswith('krbtgt/')]
+
+    def is_service_ticket_valid(self, service_principal):
+        credential = self.service_ticket(service_principal)
+        if not credential or not credential.expires:
+            return False
+        return credential.expires > self.config.renewal_threshold + datetime.now()
+
     def __str__(self):
         super_str = super(KrbTicket, self).__str__()
         return "{}: file={}, principal={}, starting={}, expires={}," \
@@ -88,18 +320,28 @@ class KrbTicket():
                        self.expires, self.service_principal, self.renew_expires)
 
     @staticmethod
-    def get_instance(**kwargs):
-        ccache_name = kwargs.get('config').ccache_name
-        with KrbTicket.__instances_lock__:
-            if ccache_name not in KrbTicket.__instances__:
-                KrbTicket.__instances__.update({ccache_name: KrbTicket(**kwargs)})
-        ticket = KrbTicket.__instances__.get(ccache_name)
-        ticket.update(**kwargs)
+    def get_instance(config, **kwargs):
+        ticket = KrbTicket.__instances__.setdefault(config.ccache_name, lambda: KrbTicket(config=config))
+        ticket.update(config=config, **kwargs)
         return ticket
 
+    @staticmethod
+    def configure_registry(shards=KrbTicketRegistry.DEFAULT_SHARDS, max_size=None, max_idle=None):
+        """
+        replaces the ticket registry. registered tickets are moved into the new one.
+
+        tickets not used for max_idle seconds, or the least recently used ones beyond max_size are
+        evicted from the registry, and their updaters are stopped. reload() and current() count as uses.
+        """
+        registry = KrbTicketRegistry(shards=shards, max_size=max_size, max_idle=max_idle,
+                                     on_evict=_evict)
+        for (key, ticket) in KrbTicket.__instances__.items():
+            registry[key] = ticket
+        KrbTicket.__instances__ = registry
+
     @staticmethod
     def cache_exists(config):
-        return KrbCommand.cache_exists(config)
+        return config.command_class.cache_exists(config)
 
     @staticmethod
     def init(principal, keytab=None, **kwargs):
@@ -108,9 +350,70 @@ class KrbTicket():
 
     @staticmethod
     def init_by_config(config):
-        KrbCommand.kinit(config)
+        config.command_class.kinit(config)
         return KrbTicket.get_by_config(config)
 
+    @staticmethod
+    def init_many(configs, max_workers=DEFAULT_INIT_WORKERS, timeout=None, reuse=False):
+        """
+        initializes tickets of configs concurrently on max_workers threads, and returns them in the order of configs
+
+        timeout: seconds to wait for each ticket since its kinit starts. kinit timed out keeps running in
+                 the background, and registers the ticket when it finishes.
+        reuse: uses the existing ccaches like get_or_init()
+
+        raises KrbTicketInitError if any of them fails or times out, after the others finish.
+        """
+        names = [config.ccache_name for config in configs]
+        if len(set(names)) != len(names):
+            raise ValueError("ccache names are not unique: {}".format(names))
+
+        started = {}
+
+        def init(config):
+            started[config.ccache_name] = time.monotonic()
+            if reuse:
+                try:
+                    return KrbTicket.get_by_config(config)
+                except NoCredentialFound:
+                    pass
+            return KrbTicket.init_by_config(config)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {}
+        errors = {}
+        try:
+            futures = {executor.submit(init, config): config.ccache_name for config in configs}
+            pending = set(futures)
+            while pending:
+                if timeout is None:
+                    done, pending = wait(pending)
+                else:
+                    now = time.monotonic()
+                    for future in [f for f in pending if futures[f] in started]:
+                        if now - started[futures[future]] >= timeout and not future.done():
+                            pending.discard(future)
+                            errors[futures[future]] = FutureTimeoutError(
+                                "kinit didn't finish in {} seconds".format(timeout))
+                    deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                    # kinit of queued configs starts when a worker gets free, which is not notified
+                    poll = min([d - now for d in deadlines] + [KrbTicket.INIT_POLL_INTERVAL])
+                    done, pending = wait(pending, timeout=max(poll, 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        errors[futures[future]] = future.exception()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        tickets = [None if name in errors else future.result()
+                   for (future, name) in futures.items()]
+        if errors:
+            logger.error("Failed to initialize tickets: {}".format(errors))
+            raise KrbTicketInitError(errors, tickets)
+        return tickets
+
     @staticmethod
     def get_or_init(principal, keytab=None, **kwargs):
         config = KrbConfig(principal=principal, keytab=keytab, **kwargs)
@@ -126,37 +429,220 @@ class KrbTicket():
 
     @staticmethod
     def get_by_config(config):
-        if KrbTicket.cache_exists(config):
-            return KrbTicket.parse_from_klist(config, KrbCommand.klist(config))
-        else:
+        if not KrbCommand._ccache_path(config):
+            # ccaches w/o a file have no fingerprint to skip reads. a single klist checks the existence and
+            # reads the ccache instead of klist for each.
+            output = config.command_class.klist_if_exists(config)
+            if output is None:
+                raise NoCredentialFound()
+            ticket = KrbTicket.parse_from_klist(config, output)
+            ticket._set_fingerprint(None)
+            return ticket
+
+        if not KrbTicket.cache_exists(config):
             raise NoCredentialFound()
 
+        # take the fingerprint before reading so that a concurrent update is detected by the next reload
+        fingerprint = config.command_class.ccache_fingerprint(config)
+        ticket = KrbTicket._load_metadata(config, fingerprint)
+        if ticket:
+            return ticket
+
+        ticket = KrbTicket._read(config)
+        ticket._set_fingerprint(fingerprint)
+        KrbTicket._save_metadata(ticket, fingerprint)
+        return ticket
+
+    @staticmethod
+    def _load_metadata(config, fingerprint):
+        """
+        the ticket from the metadata file written by the last read of the ccache, or None if it's outdated
+        """
+        if not (config.metadata_cache and config.fingerprint_cache and KrbTicket._is_stable(fingerprint)):
+            return None
+
+        metadata = KrbTicketMetadata.read(config, fingerprint)
+        if not metadata:
+            return None
+        logger.debug("Loaded ticket attributes from {}".format(config.ccache_metafile))
+        ticket = KrbTicket._from_credentials(config, *metadata)
+        ticket._set_fingerprint(fingerprint)
+        return ticket
+
+    @staticmethod
+    def _save_metadata(ticket, fingerprint):
+        config = ticket.config
+        if not (config.metadata_cache and config.fingerprint_cache and fingerprint):
+            return
+
+        if ticket._fingerprint:
+            KrbTicketMetadata.write(config, ticket._fingerprint, ticket)
+        else:
+            # the ccache is just modified, e.g. by kinit
+            ticket._save_metadata_later(fingerprint)
+
+    def _save_metadata_later(self, fingerprint):
+        """
+        reads the ccache again to write the metadata file once the fingerprint gets out of the racy window
+        """
+        delay = (fingerprint[2] + KrbTicket.FINGERPRINT_RACY_WINDOW_NS) / 1e9 - time.time()
+        with self._lock():
+            if self._metadata_timer:
+                return
+            self._metadata_timer = threading.Timer(max(delay, 0) + 0.01, self._refresh_metadata)
+            self._metadata_timer.daemon = True
+            self._metadata_timer.start()
+
+    def _refresh_metadata(self):
+        with self._lock():
+            self._metadata_timer = None
+        try:
+            self.reload()
+        except Exception as e:
+            logger.debug("Failed to write {}: {}".format(self.config.ccache_metafile, e))
+
+    @staticmethod
+    def _read(config):
+        if config.ccache_reader == 'native':
+            try:
+                return KrbTicket.parse_from_ccache(config, config.command_class.read_ccache(config))
+            except (CCacheFormatError, OSError) as e:
+                logger.debug("Falling back to klist since the native ccache reader failed: {}".format(e))
+
+        return KrbTicket.parse_from_klist(config, config.command_class.klist(config))
+
+    @staticmethod
+    def parse_from_ccache(config, ccache):
+        return KrbTicket._from_credentials(config, ccache.file, ccache.principal, ccache.credentials)
+
     @staticmethod
     def parse_from_klist(config, output):
         if not output:
             return KrbTicket.get_instance(config=config)
 
-        lines = output.splitlines()
-        file = lines[0].split(':')[2]
-        principal = lines[1].split(':')[1].strip()
-        starting, expires, service_principal = lines[4].strip().split('  ')
-        if len(lines) > 5:
-            renew_expires = lines[5].strip().replace('renew until ', '')
-        else:
-            renew_expires = None
+        ccache_name, principal, credentials = KrbTicket._parse_klist_entries(output.splitlines())
+        return KrbTicket._from_credentials(config, KrbTicket._file(ccache_name), principal, credentials)
+
+    @staticmethod
+    def _parse_klist_entries(lines):
+        """
+        (ccache name, principal, credentials) of the output of a single ccache
+        """
+        # e.g. 'Ticket cache: FILE:/tmp/krb5cc_1000'
+        ccache_name = lines[0].split(':', 1)[1].strip()
+        principal = lines[1].split(':', 1)[1].strip()
 
         def parseDatetime(str):
             if str:
                 return datetime.strptime(str, '%m/%d/%y %H:%M:%S')
 
+        credentials = []
+        for line in lines[4:]:
+            if not line.strip():
+                continue
+            if line[0].isspace():
+                # 'renew until ...' of the previous entry
+                if credentials and 'renew until ' in line:
+                    credentials[-1].renew_expires = parseDatetime(line.strip().replace('renew until ', ''))
+                continue
+            starting, expires, service_principal = line.strip().split('  ', 2)
+            credentials.append(KrbCredential(
+                principal=principal,
+                service_principal=service_principal.strip(),
+                starting=parseDatetime(starting),
+                expires=parseDatetime(expires)))
+
+        return ccache_name, principal, credentials
+
+    @staticmethod
+    def refresh_collection(config):
+        """
+        reload all registered tickets in the ccache collection config.ccache_name (e.g. DIR:/path, KCM:)
+
+        the whole collection is read by a single klist -A, or natively for DIR collections with
+        ccache_reader='native'. returns the updated tickets.
+        """
+        # only the tickets in the collection are locked and fingerprinted
+        tickets = {KrbTicket._collection_key(t.config.ccache_name): t for t in KrbTicket.__instances__.values()
+                   if KrbTicket._in_collection(config.ccache_name, t.config.ccache_name)}
+        # take the fingerprints before reading like get_by_config
+        fingerprints = {key: t.config.command_class.ccache_fingerprint(t.config) for (key, t) in tickets.items()}
+
+        with ExitStack() as stack:
+            # file backed ccaches are locked in a fixed order to avoid deadlocks
+            for key in sorted(k for (k, t) in tickets.items() if KrbCommand._ccache_path(t.config)):
+                stack.enter_context(KrbCommand._read_lock(tickets[key].config))
+            entries = KrbTicket._read_collection(config)
+
+        updated = []
+        for (ccache_name, principal, credentials) in entries:
+            key = KrbTicket._collection_key(ccache_name)
+            ticket = tickets.get(key)
+            if not ticket:
+                continue
+            KrbTicket._from_credentials(ticket.config, KrbTicket._file(ccache_name), principal, credentials)
+            ticket._set_fingerprint(fingerprints[key])
+            updated.append(ticket)
+        logger.debug("Refreshed {} tickets in {}".format(len(updated), config.ccache_name))
+        return updated
+
+    @staticmethod
+    def _read_collection(config):
+        if config.ccache_reader == 'native':
+            try:
+                return [('FILE:{}'.format(c.file), c.principal, c.credentials)
+                        for c in config.command_class.read_collection(config)]
+            except (CCacheFormatError, OSError) as e:
+                logger.debug("Falling back to klist since the native ccache reader failed: {}".format(e))
+
+        output = config.command_class.klist_collection(config)
+        entries = []
+        lines = []
+        for line in output.splitlines():
+            if line.startswith('Ticket cache:') and lines:
+                entries.append(KrbTicket._parse_klist_entries(lines))
+                lines = []
+            lines.append(line)
+        if lines:
+            entries.append(KrbTicket._parse_klist_entries(lines))
+        return entries
+
+    @staticmethod
+    def _collection_key(ccache_name):
+        """
+        file path for file backed ccaches, so that FILE:path and DIR::path of the same file are matched
+        """
+        path = KrbCommand._ccache_path_of(ccache_name)
+        return os.path.abspath(path) if path else ccache_name
+
+    @staticmethod
+    def _in_collection(collection_name, ccache_name):
+        ccache_type, residual = KrbCommand._split_ccache_name(collection_name)
+        if ccache_type == 'DIR' and not residual.startswith(':'):
+            path = KrbCommand._ccache_path_of(ccache_name)
+            return bool(path) and os.path.dirname(os.path.abspath(path)) == os.path.abspath(residual)
+        return ccache_name.startswith(collection_name)
+
+    @staticmethod
+    def _file(ccache_name):
+        return KrbCommand._ccache_path_of(ccache_name) or ccache_name.split(':', 1)[-1]
+
+    @staticmethod
+    def _from_credentials(config, file, principal, credentials):
+        if not credentials:
+            return KrbTicket.get_instance(config=config, file=file, principal=principal, credentials={})
+
+        # the first entry, usually the TGT, provides the ticket attributes
+        credential = credentials[0]
         return KrbTicket.get_instance(
             config=config,
             file=file,
             principal=principal,
-            starting=parseDatetime(starting),
-            expires=parseDatetime(expires),
-            service_principal=service_principal,
-            renew_expires=parseDatetime(renew_expires))
+            starting=credential.starting,
+            expires=credential.expires,
+            service_principal=credential.service_principal,
+            renew_expires=credential.renew_expires,
+            credentials={c.service_principal: c for c in credentials})
 
     @staticmethod
     def _destroy():
@@ -165,8 +651,9 @@ class KrbTicket():
 
         stop all updaters belonging to a ticket registered in registry, and remove all entiries
         """
-        with KrbTicket.__instances_lock__:
-            for (key, ticket) in KrbTicket.__instances__.items():
-                ticket.updater().stop()
-                KrbCommand.kdestroy(ticket.config)
-            KrbTicket.__instances__ = {}
+        for (key, ticket) in KrbTicket.__instances__.items():
+            ticket.updater().stop()
+            if ticket._metadata_timer:
+                ticket._metadata_timer.cancel()
+            ticket.config.command_class.kdestroy(ticket.config)
+        KrbTicket.__instances__.clear()
@@ -1,21 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import fcntl
+import heapq
+import itertools
 import logging
+import os
+import random
 import threading
 import time
 
 import fasteners
 
+from krbticket.reaper import KrbCCacheReaper
+
 logger = logging.getLogger(__name__)
 
 
+def next_interval(ticket, interval, schedule, min_interval, max_interval):
+    if schedule != KrbTicketUpdater.SCHEDULE_DEADLINE:
+        return interval
+
+    deadlines = [t for t in (ticket.expires, ticket.renew_expires) if t]
+    if not deadlines:
+        return interval
+
+    if ticket.starting and ticket.expires and ticket.expires - ticket.starting <= ticket.config.renewal_threshold:
+        # the deadline is always in the past, and updating every min_interval doesn't help
+        logger.warning("Ticket lifetime {} is not longer than renewal_threshold {}. Falling back to interval.".format(
+            ticket.expires - ticket.starting, ticket.config.renewal_threshold))
+        return interval
+
+    deadline = min(deadlines) - ticket.config.renewal_threshold
+    seconds = (deadline - datetime.now()).total_seconds()
+    logger.debug("Next update is scheduled at {}".format(deadline))
+    return max(min_interval, min(max_interval, seconds))
+
+
 class KrbTicketUpdater(threading.Thread):
     DEFAULT_INTERVAL = 60 * 10
+    DEFAULT_MIN_INTERVAL = 1
+    DEFAULT_MAX_INTERVAL = 60 * 60 * 24
+    # each wait is shortened by a random ratio up to this value
+    DEFAULT_JITTER = 0
 
-    def __init__(self, ticket, interval=DEFAULT_INTERVAL):
+    # wakes up every interval
+    SCHEDULE_INTERVAL = 'interval'
+    # wakes up when the ticket reaches renewal_threshold. max_interval is used as the upper bound.
+    SCHEDULE_DEADLINE = 'deadline'
+
+    def __init__(self, ticket, interval=DEFAULT_INTERVAL, schedule=SCHEDULE_INTERVAL,
+                 min_interval=DEFAULT_MIN_INTERVAL, jitter=None, max_interval=DEFAULT_MAX_INTERVAL):
         super(KrbTicketUpdater, self).__init__()
 
         self.ticket = ticket
         self.interval = interval
+        self.schedule = schedule
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = self.DEFAULT_JITTER if jitter is None else jitter
         self.stop_event = threading.Event()
+        # interrupts the wait for the next update
+        self.wakeup_event = threading.Event()
         self.daemon = True
         self.start_lock = threading.Lock()
 
@@ -25,9 +70,41 @@ class KrbTicketUpdater(threading.Thread):
             if self.stop_event.is_set():
                 return
 
-            logger.debug("Trying to update ticket...")
-            self.ticket.maybe_update()
-            time.sleep(self.interval)
+            try:
+                logger.debug("Trying to update ticket...")
+                self.update()
+                self.reap()
+            except Exception:
+                # retried at the next interval instead of stopping the updater
+                logger.exception("Failed to update ticket: {}".format(self.ticket))
+            self.wakeup_event.wait(self.next_interval())
+            self.wakeup_event.clear()
+
+    def update(self):
+        self.ticket.maybe_update()
+
+    def wakeup(self):
+        """
+        updates the ticket now instead of waiting for the next interval
+        """
+        self.wakeup_event.set()
+
+    def reap(self):
+        """
+        removes per-process ccaches left by exited processes
+        """
+        if self.use_per_process_ccache():
+            KrbCCacheReaper.maybe_reap()
+
+    def next_interval(self):
+        """
+        seconds to wait until the next update
+        """
+        interval = next_interval(self.ticket, self.interval, self.schedule, self.min_interval, self.max_interval)
+        if self.jitter:
+            # only shortened, so that the deadline is never missed
+            interval *= 1 - random.random() * self.jitter
+        return interval
 
     def start(self):
         with self.start_lock:
@@ -48,6 +125,7 @@ class KrbTicketUpdater(threading.Thread):
     def stop(self):
         logger.debug("Stopping ticket updater...")
         self.stop_event.set()
+        self.wakeup_event.set()
 
 
 class SimpleKrbTicketUpdater(KrbTicketUpdater):
@@ -61,6 +139,154 @@ class SimpleKrbTicketUpdater(KrbTicketUpdater):
         return True
 
 
+class SharedKrbTicketUpdater(KrbTicketUpdater):
+    """
+    KrbTicketUpdater w/o dedicated thread
+
+    All updaters are serviced by a shared KrbTicketScheduler thread.
+    Using this with multiprocessing, child processes uses dedicated ccache file
+    """
+    # KrbTicketScheduler to use. KrbTicketScheduler.default() is used if None.
+    scheduler = None
+
+    def __init__(self, *args, **kwargs):
+        super(SharedKrbTicketUpdater, self).__init__(*args, **kwargs)
+        self._scheduled = False
+
+    def start(self):
+        with self.start_lock:
+            if self._scheduled:
+                logger.debug("Skipping start() since it already started...")
+                return
+
+            if self.stop_event.is_set():
+                logger.debug("Skipping start() since it already stopped...")
+                return
+
+            self._scheduled = True
+            self._scheduler().add(self)
+
+    def is_alive(self):
+        return self._scheduled and not self.stop_event.is_set()
+
+    def join(self, timeout=None):
+        pass
+
+    def wakeup(self):
+        self._scheduler().wakeup(self)
+
+    def stop(self):
+        super().stop()
+        self._scheduler().remove(self)
+
+    def _scheduler(self):
+        return self.scheduler or KrbTicketScheduler.default()
+
+    @staticmethod
+    def use_per_process_ccache():
+        return True
+
+
+class KrbTicketScheduler(threading.Thread):
+    """
+    Services SharedKrbTicketUpdaters from a single thread
+
+    Updaters are kept in a min-heap ordered by the next due time.
+    If max_workers is given, updates run on a bounded thread pool instead of the scheduler thread.
+    """
+    __default__ = None
+    __default_lock__ = threading.Lock()
+
+    def __init__(self, max_workers=None):
+        super(KrbTicketScheduler, self).__init__(name='KrbTicketScheduler')
+        self.daemon = True
+        self.max_workers = max_workers
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = None
+        self._pid = os.getpid()
+
+    @staticmethod
+    def default():
+        """
+        the process wide scheduler
+        """
+        with KrbTicketScheduler.__default_lock__:
+            scheduler = KrbTicketScheduler.__default__
+            # threads don't survive fork(2)
+            if not scheduler or scheduler._pid != os.getpid():
+                scheduler = KrbTicketScheduler()
+                KrbTicketScheduler.__default__ = scheduler
+            return scheduler
+
+    def add(self, updater, delay=0):
+        with self._cond:
+            if not self.is_alive():
+                if self.max_workers:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self.start()
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), updater))
+            self._cond.notify()
+
+    def remove(self, updater):
+        with self._cond:
+            self._queue = [entry for entry in self._queue if entry[2] is not updater]
+            heapq.heapify(self._queue)
+            self._cond.notify()
+
+    def wakeup(self, updater):
+        """
+        makes the updater due now. nothing to do if it's being updated.
+        """
+        with self._cond:
+            for (i, (due, sequence, queued)) in enumerate(self._queue):
+                if queued is updater:
+                    self._queue[i] = (time.monotonic(), sequence, updater)
+                    heapq.heapify(self._queue)
+                    self._cond.notify()
+                    return
+
+    def updaters(self):
+        with self._cond:
+            return [entry[2] for entry in sorted(self._queue)]
+
+    def run(self):
+        logger.info("{} start...".format(self.__class__.__name__))
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+
+                due, _, updater = self._queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                heapq.heappop(self._queue)
+
+            if updater.stop_event.is_set():
+                continue
+
+            if self._executor:
+                self._executor.submit(self._update, updater)
+            else:
+                self._update(updater)
+
+    def _update(self, updater):
+        try:
+            logger.debug("Trying to update ticket...")
+            updater.update()
+            updater.reap()
+        except Exception:
+            logger.exception("Failed to update ticket: {}".format(updater.ticket))
+        finally:
+            if not updater.stop_event.is_set():
+                self.add(updater, delay=updater.next_interval())
+
+
 class MultiProcessKrbTicketUpdater(KrbTicketUpdater):
     """
     Multiprocess KrbTicket Updater
@@ -72,6 +298,121 @@ class MultiProcessKrbTicketUpdater(KrbTicketUpdater):
         return False
 
 
+class LeaderKrbTicketUpdater(MultiProcessKrbTicketUpdater):
+    """
+    Multiprocess KrbTicket Updater w/ leader election
+
+    Only the process holding the renewal lease of the ccache updates the ticket, and the others just reload it
+    after the leader updates the ccache. The leader writes heartbeats to the lease, and a follower updates the
+    ticket by itself if the heartbeat is older than lease_timeout (default: 2 * interval) and the ticket needs
+    an update. Wake-ups are jittered to spread klist over time.
+    """
+    DEFAULT_JITTER = 0.1
+
+    def __init__(self, ticket, interval=KrbTicketUpdater.DEFAULT_INTERVAL, lease_timeout=None, **kwargs):
+        super(LeaderKrbTicketUpdater, self).__init__(ticket, interval=interval, **kwargs)
+        self.lease = KrbTicketLease(ticket.config.ccache_leasefile,
+                                    lease_timeout if lease_timeout else interval * 2)
+
+    def update(self):
+        if self.lease.acquire():
+            self.lease.heartbeat()
+            self.ticket.maybe_update()
+            return
+
+        self.ticket.reload()
+        if self.lease.is_expired() and (self.ticket.is_expired() or not self.ticket.expires):
+            logger.warning("The leader of {} doesn't respond. Updating ticket...".format(
+                self.ticket.config.ccache_name))
+            self.ticket.maybe_update()
+
+    def stop(self):
+        super().stop()
+        self.lease.release()
+
+
+class KrbTicketLease():
+    """
+    Renewal lease shared by processes
+
+    The leader holds a POSIX record lock on the lease file, which is released when the leader exits,
+    and is not inherited by forked children. The leader writes its pid and a heartbeat timestamp into the file.
+    Since closing any fd of the file releases the record lock, the lease file must not be opened by others
+    in the leader process.
+    """
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        True if this process holds the lease
+        """
+        with self._lock:
+            if self._fd is not None and self._pid != os.getpid():
+                # the lock is not inherited by fork(2)
+                os.close(self._fd)
+                self._fd = None
+
+            if self._fd is not None:
+                return True
+
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+
+            logger.info("Got the renewal lease: {}".format(self.path))
+            self._fd = fd
+            self._pid = os.getpid()
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is None:
+                return
+            if self._pid == os.getpid():
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+                logger.info("Released the renewal lease: {}".format(self.path))
+            os.close(self._fd)
+            self._fd = None
+
+    def heartbeat(self):
+        with self._lock:
+            if self._fd is None:
+                return
+            data = '{} {}\n'.format(os.getpid(), time.time()).encode()
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, data)
+            os.ftruncate(self._fd, len(data))
+
+    def holder(self):
+        """
+        (pid, heartbeat timestamp) written by the leader, or None
+        """
+        try:
+            with self._lock:
+                if self._fd is not None and self._pid == os.getpid():
+                    # closing any other fd of the file would release the lock
+                    data = os.pread(self._fd, 64, 0).decode()
+                else:
+                    with open(self.path) as f:
+                        data = f.read()
+            pid, timestamp = data.split()
+            return int(pid), float(timestamp)
+        except (OSError, ValueError):
+            return None
+
+    def is_expired(self):
+        holder = self.holder()
+        return not holder or time.time() - holder[1] > self.timeout
+
+
 class SingleProcessKrbTicketUpdater(KrbTicketUpdater):
     """
     Singleprocess KrbTicket Updater
@@ -12,7 +12,8 @@ def read_requirements(file):
 install_requires = read_requirements("requirements.txt")
 test_require = read_requirements("requirements-test.txt")
 extras = {
-    'test': test_require
+    'test': test_require,
+    'krb5': ['krb5'],
 }
 
 setuptools.setup(
@@ -29,6 +30,11 @@ setuptools.setup(
     install_requires=install_requires,
     tests_require=test_require,
     extras_require=extras,
+    entry_points={
+        'console_scripts': [
+            'krbticket-daemon=krbticket.daemon:main',
+        ],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
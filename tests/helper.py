@@ -2,6 +2,8 @@ import pytest
 from krbticket import KrbConfig
 from datetime import timedelta
 import os
+import shutil
+import struct
 
 DEFAULT_PRINCIPAL = 'user@EXAMPLE.COM'
 DEFAULT_KEYTAB = './tests/conf/krb5.keytab'
@@ -12,6 +14,11 @@ DEFAULT_TICKET_RENEWABLE_LIFETIME_SEC = 8
 DEFAULT_TICKET_RENEWABLE_LIFETIME = '{}s'.format(DEFAULT_TICKET_RENEWABLE_LIFETIME_SEC)
 DEFAULT_CCACHE_NAME = '/tmp/krb5cc_{}'.format(os.getuid())
 
+# the stand-in kerberos commands emulating the ccache types other than FILE, e.g. KEYRING:process:
+FAKE_KRB5 = os.path.dirname(os.path.abspath(shutil.which('klist') or '')) == \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'bin'))
+requires_fake_krb5 = pytest.mark.skipif(not FAKE_KRB5, reason='requires the stand-in commands in benchmarks/bin')
+
 
 def assert_ticket(t1, t2):
     assert t1.principal == t2.principal
@@ -54,3 +61,40 @@ def default_config(**kwargs):
 @pytest.fixture
 def config():
     return default_config()
+
+
+def _pack_data(data):
+    return struct.pack('>I', len(data)) + data
+
+
+def _pack_principal(name):
+    primary, realm = name.rsplit('@', 1)
+    components = primary.split('/')
+    packed = struct.pack('>II', 1, len(components)) + _pack_data(realm.encode())
+    for component in components:
+        packed += _pack_data(component.encode())
+    return packed
+
+
+def write_ccache(path, principal, credentials, version=0x0504):
+    """
+    write a FILE ccache
+
+    credentials: list of (service_principal, starting, expires, renew_expires) in unix time
+    """
+    data = struct.pack('>H', version)
+    if version == 0x0504:
+        data += struct.pack('>HHHii', 12, 1, 8, 0, 0)
+    data += _pack_principal(principal)
+    for (service_principal, starting, expires, renew_expires) in credentials:
+        data += _pack_principal(principal) + _pack_principal(service_principal)
+        data += struct.pack('>H', 23)
+        if version == 0x0503:
+            data += struct.pack('>H', 23)
+        data += _pack_data(b'k' * 16)
+        data += struct.pack('>IIII', starting, starting, expires, renew_expires or 0)
+        data += struct.pack('>BI', 0, 0x00800000 if renew_expires else 0)
+        data += struct.pack('>II', 0, 0)
+        data += _pack_data(b't' * 64) + _pack_data(b'')
+    with open(path, 'wb') as f:
+        f.write(data)
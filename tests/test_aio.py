@@ -0,0 +1,183 @@
+from krbticket import AsyncKrbTicket, AsyncKrbCommand, KrbTicket, KrbCommand, KrbMetrics, NoCredentialFound
+from helper import *
+import asyncio
+import os
+import subprocess
+import time
+import pytest
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('command_executor', ['subprocess', 'helper'])
+def test_commands(command_executor):
+    config = default_config(command_executor=command_executor)
+
+    async def commands():
+        await AsyncKrbCommand.kdestroy(config)
+        assert not await AsyncKrbCommand.cache_exists(config)
+        await AsyncKrbCommand.kinit(config)
+        assert await AsyncKrbCommand.cache_exists(config)
+        await AsyncKrbCommand.renewal(config)
+        assert 'Default principal: user@EXAMPLE.COM' in await AsyncKrbCommand.klist(config)
+        await AsyncKrbCommand.kdestroy(config)
+
+    run(commands())
+
+
+def test_lock_wait_metrics(config, mocker):
+    observer = KrbMetrics()
+    mocker.patch.object(observer, 'on_lock_wait')
+    KrbMetrics.register(observer)
+    try:
+        run(AsyncKrbCommand.cache_exists(config))
+        assert observer.on_lock_wait.call_count == 1
+    finally:
+        KrbMetrics.unregister(observer)
+
+
+def test_get_or_init(config):
+    KrbCommand.kdestroy(config)
+
+    async def get_or_init():
+        with pytest.raises(NoCredentialFound):
+            await AsyncKrbTicket.get_by_config(config)
+        ticket0 = await AsyncKrbTicket.get_or_init(DEFAULT_PRINCIPAL, DEFAULT_KEYTAB)
+        ticket1 = await AsyncKrbTicket.get_or_init(DEFAULT_PRINCIPAL, DEFAULT_KEYTAB)
+        assert ticket0 is ticket1
+        assert ticket0.principal == DEFAULT_PRINCIPAL
+        assert ticket0.ticket is KrbTicket.get_by_config(config)
+
+    run(get_or_init())
+
+
+def test_retry(config, mocker):
+    calls = []
+
+    async def create_subprocess_exec(*args, **kwargs):
+        calls.append(args)
+        if len(calls) < 3:
+            raise subprocess.CalledProcessError(1, args)
+        return await original(*args, **kwargs)
+
+    original = asyncio.create_subprocess_exec
+    mocker.patch('asyncio.create_subprocess_exec', side_effect=create_subprocess_exec)
+    run(AsyncKrbCommand.kinit(config))
+    assert len(calls) == 3
+
+
+def test_no_retry_when_filenotfound(config):
+    config.kinit_bin = '/nonexistent/kinit'
+    with pytest.raises(FileNotFoundError):
+        run(AsyncKrbCommand.kinit(config))
+
+
+def test_renewal(config):
+    KrbCommand.kdestroy(config)
+
+    async def renewal():
+        ticket = await AsyncKrbTicket.init_by_config(config)
+        starting = ticket.starting
+        expires = ticket.expires
+        renew_expires = ticket.renew_expires
+
+        ticket.updater_start(interval=0.5)
+        assert ticket.updater().is_alive()
+
+        # the event loop is not blocked during the update
+        started = time.monotonic()
+        await asyncio.sleep(DEFAULT_TICKET_LIFETIME_SEC + DEFAULT_TICKET_RENEWAL_THRESHOLD_SEC)
+        assert time.monotonic() - started < DEFAULT_TICKET_LIFETIME_SEC + DEFAULT_TICKET_RENEWAL_THRESHOLD_SEC + 1
+        assert ticket.starting > starting
+        assert ticket.expires > expires
+        assert ticket.renew_expires == renew_expires
+
+        ticket.updater().stop()
+        await asyncio.sleep(0.1)
+        assert not ticket.updater().is_alive()
+
+    run(renewal())
+
+
+def test_update_failure(config, mocker):
+    KrbCommand.kdestroy(config)
+
+    async def update_failure():
+        ticket = await AsyncKrbTicket.init_by_config(config)
+        calls = []
+
+        async def maybe_update():
+            calls.append(1)
+            if len(calls) == 1:
+                raise subprocess.CalledProcessError(1, ['klist'])
+
+        mocker.patch.object(ticket, 'maybe_update', side_effect=maybe_update)
+        ticket.updater_start(interval=0.1)
+        await asyncio.sleep(0.5)
+        assert ticket.updater().is_alive()
+        assert len(calls) >= 2
+        ticket.updater().stop()
+        await asyncio.sleep(0.1)
+
+    run(update_failure())
+
+
+def test_atomic_update(config):
+    config.atomic_update = True
+
+    async def commands():
+        await AsyncKrbCommand.kdestroy(config)
+        await AsyncKrbCommand.kinit(config)
+        inode = os.stat(config.ccache_name).st_ino
+        await AsyncKrbCommand.renewal(config)
+        assert os.stat(config.ccache_name).st_ino != inode
+        assert await AsyncKrbCommand.cache_exists(config)
+        await AsyncKrbCommand.kdestroy(config)
+
+    run(commands())
+
+
+class RecordingKrbCommand(KrbCommand):
+    calls = []
+
+    @staticmethod
+    def kinit(config):
+        RecordingKrbCommand.calls.append('kinit')
+        KrbCommand.kinit(config)
+
+    @staticmethod
+    def klist(config):
+        RecordingKrbCommand.calls.append('klist')
+        return KrbCommand.klist(config)
+
+
+def test_command_class():
+    config = default_config(command_class=RecordingKrbCommand)
+    KrbCommand.kdestroy(config)
+    RecordingKrbCommand.calls = []
+
+    async def init():
+        return await AsyncKrbTicket.init_by_config(config)
+
+    ticket = run(init())
+    assert ticket.principal == DEFAULT_PRINCIPAL
+    assert RecordingKrbCommand.calls == ['kinit', 'klist']
+
+
+def test_wrapper_in_registry(config):
+    async def get():
+        return await AsyncKrbTicket.get_or_init(DEFAULT_PRINCIPAL, DEFAULT_KEYTAB)
+
+    ticket = run(get())
+    assert KrbTicket.__instances__[config.ccache_name]._async_ticket is ticket
+    assert not hasattr(AsyncKrbTicket, '__instances__')
@@ -0,0 +1,57 @@
+from krbticket import KrbCCache, CCacheFormatError, KrbTicket
+from helper import *
+from datetime import datetime
+import pytest
+
+STARTING = 1574349790
+EXPIRES = STARTING + 3600
+RENEW_EXPIRES = STARTING + 86400
+
+
+@pytest.mark.parametrize('version', [0x0503, 0x0504])
+def test_read(tmp_path, version):
+    path = str(tmp_path / 'krb5cc')
+    write_ccache(path, DEFAULT_PRINCIPAL, [
+        ('krb5_ccache_conf_data/pa_type/krbtgt\\/EXAMPLE.COM\\@EXAMPLE.COM@X-CACHECONF:', 0, 0, None),
+        ('krbtgt/EXAMPLE.COM@EXAMPLE.COM', STARTING, EXPIRES, RENEW_EXPIRES),
+        ('HTTP/host.example.com@EXAMPLE.COM', STARTING, EXPIRES, None),
+        ], version=version)
+
+    ccache = KrbCCache.read(path)
+    assert ccache.version == version
+    assert ccache.file == path
+    assert ccache.principal == DEFAULT_PRINCIPAL
+    assert len(ccache.credentials) == 2
+
+    tgt = ccache.primary_credential()
+    assert tgt.service_principal == 'krbtgt/EXAMPLE.COM@EXAMPLE.COM'
+    assert tgt.starting == datetime.fromtimestamp(STARTING)
+    assert tgt.expires == datetime.fromtimestamp(EXPIRES)
+    assert tgt.renew_expires == datetime.fromtimestamp(RENEW_EXPIRES)
+    assert ccache.credentials[1].renew_expires is None
+
+
+def test_read_invalid(tmp_path):
+    path = str(tmp_path / 'krb5cc')
+    write_ccache(path, DEFAULT_PRINCIPAL, [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', STARTING, EXPIRES, None)])
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    with pytest.raises(CCacheFormatError):
+        KrbCCache.parse(b'\x05\x02' + data[2:])
+    with pytest.raises(CCacheFormatError):
+        KrbCCache.parse(data[:-10])
+
+
+def test_get_by_config_with_native_reader(tmp_path):
+    path = str(tmp_path / 'krb5cc')
+    write_ccache(path, DEFAULT_PRINCIPAL, [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', STARTING, EXPIRES, RENEW_EXPIRES)])
+    config = default_config(ccache_name=path, ccache_reader='native', klist_bin='/nonexistent/klist')
+
+    ticket = KrbTicket.get_by_config(config)
+    assert ticket.file == path
+    assert ticket.principal == DEFAULT_PRINCIPAL
+    assert ticket.service_principal == 'krbtgt/EXAMPLE.COM@EXAMPLE.COM'
+    assert ticket.starting == datetime.fromtimestamp(STARTING)
+    assert ticket.expires == datetime.fromtimestamp(EXPIRES)
+    assert ticket.renew_expires == datetime.fromtimestamp(RENEW_EXPIRES)
@@ -1,8 +1,10 @@
-from krbticket import KrbConfig, KrbCommand
+from krbticket import KrbConfig, KrbCommand, KrbCircuitBreaker, KrbCircuitOpenError
 from krbticket import MultiProcessKrbTicketUpdater
 from helper import *
 import os
 import subprocess
+import threading
+import time
 from multiprocessing import Process
 import pytest
 
@@ -134,4 +136,94 @@ def test_no_retry_when_filenotfound(config, mocker):
 def test_kinit_command(config, expected, mocker):
     mocker.patch.object(KrbCommand, '_call')
     KrbCommand.kinit(config)
-    KrbCommand._call.assert_called_with(config, expected)
+    KrbCommand._call.assert_called_with(config, expected, breaker=None)
+
+
+def test_atomic_update(config):
+    config.atomic_update = True
+    KrbCommand.kdestroy(config)
+    KrbCommand.kinit(config)
+    inode = os.stat(config.ccache_name).st_ino
+    KrbCommand.renewal(config)
+    assert os.stat(config.ccache_name).st_ino != inode
+    assert 'Default principal: {}'.format(DEFAULT_PRINCIPAL) in KrbCommand.klist(config)
+
+    ccache_dir, ccache_file = os.path.split(config.ccache_name)
+    assert not [f for f in os.listdir(ccache_dir) if f.startswith(ccache_file + '.krbticket.tmp.')]
+    KrbCommand.kdestroy(config)
+
+
+def test_lock_released_between_retries(config, mocker):
+    KrbCommand.kdestroy(config)
+    config.retry_options = {'wait_fixed': 500, 'stop_max_attempt_number': 2}
+    mocker.patch('subprocess.check_output', side_effect=[subprocess.CalledProcessError(1, ['kinit']), None])
+
+    thread = threading.Thread(target=KrbCommand.kinit, args=(config,))
+    thread.start()
+    time.sleep(0.2)
+    lock = KrbCommand.lock(config)
+    try:
+        # kinit is waiting for the next attempt
+        assert lock.acquire_shared(blocking=False)
+        lock.release_shared()
+    finally:
+        thread.join()
+    assert subprocess.check_output.call_count == 2
+
+
+def test_circuit_breaker(config, mocker):
+    KrbCircuitBreaker.__instances__.clear()
+    config.circuit_breaker_threshold = 2
+    config.circuit_breaker_cooldown = 0.5
+    config.retry_options = {'wait_fixed': 0, 'stop_max_attempt_number': 5}
+    patcher = mocker.patch('subprocess.check_output', side_effect=subprocess.CalledProcessError(1, ['kinit']))
+    try:
+        # retries stop when the breaker opens
+        with pytest.raises(KrbCircuitOpenError):
+            KrbCommand.kinit(config)
+        assert patcher.call_count == 2
+        with pytest.raises(KrbCircuitOpenError):
+            KrbCommand.renewal(config)
+        assert patcher.call_count == 2
+        assert KrbCircuitBreaker.get(config).is_open()
+
+        # half-open after the cool-down
+        time.sleep(0.6)
+        patcher.side_effect = None
+        KrbCommand.kinit(config)
+        assert patcher.call_count == 3
+        assert not KrbCircuitBreaker.get(config).is_open()
+        assert KrbCircuitBreaker.get(config).failures == 0
+    finally:
+        KrbCircuitBreaker.__instances__.clear()
+
+
+def test_circuit_breaker_disabled(config):
+    assert KrbCircuitBreaker.get(config) is None
+
+
+def test_ccache_type():
+    assert KrbCommand.ccache_type(KrbConfig(ccache_name='/tmp/hoge')) == 'FILE'
+    assert KrbCommand.ccache_type(KrbConfig(ccache_name='FILE:/tmp/hoge')) == 'FILE'
+    assert KrbCommand.ccache_type(KrbConfig(ccache_name='DIR::/tmp/dir/tkt')) == 'DIR'
+    assert KrbCommand.ccache_type(KrbConfig(ccache_name='KEYRING:persistent:1000')) == 'KEYRING'
+    assert KrbCommand.ccache_type(KrbConfig(ccache_name='KCM:')) == 'KCM'
+
+
+@requires_fake_krb5
+def test_cache_exists_with_keyring(monkeypatch, tmp_path):
+    monkeypatch.setenv('FAKE_KRB5_STORE', str(tmp_path))
+    config = default_config(ccache_name='KEYRING:process:krbticket_test', lock_dir=str(tmp_path))
+    KrbCommand.kdestroy(config)
+    assert not KrbCommand.cache_exists(config)
+    KrbCommand.kinit(config)
+    assert KrbCommand.cache_exists(config)
+    assert 'Ticket cache: KEYRING:process:krbticket_test' in KrbCommand.klist(config)
+    KrbCommand.kdestroy(config)
+    assert not KrbCommand.cache_exists(config)
+
+    # expired tickets
+    starting = int(time.time()) - 7200
+    write_ccache(str(tmp_path / 'KEYRING_process_krbticket_test'), DEFAULT_PRINCIPAL,
+                 [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', starting, starting + 3600, None)])
+    assert KrbCommand.cache_exists(config)
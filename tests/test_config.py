@@ -8,3 +8,17 @@ def test_ccache_name():
     os.environ['KRB5CCNAME'] = '/tmp/env_krb5cc'
     assert KrbConfig().ccache_name == '/tmp/env_krb5cc'
     del os.environ['KRB5CCNAME']
+
+
+def test_lockfiles(tmp_path):
+    config = KrbConfig(ccache_name='/tmp/hoge')
+    assert config.ccache_cmd_lockfile == '/tmp/hoge.krbticket.cmd.lock'
+    assert KrbConfig(ccache_name='FILE:/tmp/hoge').ccache_cmd_lockfile == config.ccache_cmd_lockfile
+    assert KrbConfig(ccache_name='DIR::/tmp/dir/tkt').ccache_cmd_lockfile == '/tmp/dir/.tkt.krbticket.cmd.lock'
+
+    # derived from the ccache name for ccaches w/o a file
+    keyring = KrbConfig(ccache_name='KEYRING:persistent:1000', lock_dir=str(tmp_path))
+    assert os.path.dirname(keyring.ccache_cmd_lockfile) == str(tmp_path)
+    assert keyring.ccache_cmd_lockfile != KrbConfig(ccache_name='KCM:', lock_dir=str(tmp_path)).ccache_cmd_lockfile
+    assert keyring.ccache_lockfile != keyring.ccache_cmd_lockfile
+    assert str(os.getpid()) in KrbConfig(ccache_name='MEMORY:hoge').ccache_cmd_lockfile
@@ -0,0 +1,130 @@
+from krbticket import KrbTicket, KrbCommand, KrbTicketUpdater, SimpleKrbTicketUpdater, MultiProcessKrbTicketUpdater
+from krbticket.daemon import KrbTicketDaemon, main
+from helper import *
+from datetime import timedelta
+import os
+import threading
+import time
+import pytest
+
+CONFIG = """
+[DEFAULT]
+keytab = {keytab}
+ticket_lifetime = 4s
+ticket_renewable_lifetime = 8s
+renewal_threshold = 1
+
+[alice]
+principal = alice@EXAMPLE.COM
+ccache_name = {tmp_path}/krb5cc_alice
+interval = 0.5
+
+[bob]
+principal = bob@EXAMPLE.COM
+ccache_name = {tmp_path}/krb5cc_bob
+updater_class = SimpleKrbTicketUpdater
+atomic_update = true
+"""
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = str(tmp_path / 'krbticket.ini')
+    with open(path, 'w') as f:
+        f.write(CONFIG.format(keytab=DEFAULT_KEYTAB, tmp_path=tmp_path))
+    return path
+
+
+def test_config(config_file, tmp_path):
+    daemon = KrbTicketDaemon.from_file(config_file)
+    assert list(daemon.sections) == ['alice', 'bob']
+
+    alice = KrbTicketDaemon.config(daemon.sections['alice'])
+    assert alice.principal == 'alice@EXAMPLE.COM'
+    assert alice.keytab == DEFAULT_KEYTAB
+    assert alice.ccache_name == str(tmp_path / 'krb5cc_alice')
+    assert alice.ticket_lifetime == '4s'
+    assert alice.ticket_renewable_lifetime == '8s'
+    assert alice.renewal_threshold == timedelta(seconds=1)
+    assert alice.updater_class == MultiProcessKrbTicketUpdater
+    assert not alice.atomic_update
+
+    bob = KrbTicketDaemon.config(daemon.sections['bob'])
+    assert bob.updater_class == SimpleKrbTicketUpdater
+    assert bob.atomic_update
+
+    with pytest.raises(ValueError):
+        KrbTicketDaemon.config({'keytab': DEFAULT_KEYTAB})
+
+
+def test_shared_ccache_name():
+    daemon = KrbTicketDaemon({
+        'alice': {'principal': 'alice@EXAMPLE.COM', 'ccache_name': '/tmp/krb5cc_shared'},
+        'bob': {'principal': 'bob@EXAMPLE.COM', 'ccache_name': '/tmp/krb5cc_shared'}})
+    with pytest.raises(ValueError):
+        daemon.start()
+
+
+def test_once(config_file, tmp_path):
+    main(['--once', config_file])
+    assert os.path.isfile(str(tmp_path / 'krb5cc_alice'))
+    assert os.path.isfile(str(tmp_path / 'krb5cc_bob'))
+
+
+def test_run(config_file):
+    daemon = KrbTicketDaemon.from_file(config_file)
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    try:
+        for i in range(50):
+            if len(daemon.tickets) == 2:
+                break
+            time.sleep(0.1)
+        assert daemon.tickets['alice'].principal == 'alice@EXAMPLE.COM'
+        assert daemon.tickets['alice'].updater().is_alive()
+        assert daemon.tickets['alice'].updater().interval == 0.5
+        assert daemon.tickets['bob'].updater().interval == KrbTicketUpdater.DEFAULT_INTERVAL
+    finally:
+        daemon.stop()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    daemon.tickets['alice'].updater().join(timeout=5)
+    assert not daemon.tickets['alice'].updater().is_alive()
+
+
+def test_start_failure(config_file, mocker):
+    daemon = KrbTicketDaemon.from_file(config_file)
+    get_or_init = KrbTicketDaemon._get_or_init
+
+    def fail_alice(config):
+        if config.principal == 'alice@EXAMPLE.COM':
+            raise RuntimeError('KDC is unreachable')
+        return get_or_init(config)
+
+    mocker.patch.object(KrbTicketDaemon, '_get_or_init', side_effect=fail_alice)
+    try:
+        daemon.start()
+        assert list(daemon.tickets) == ['bob']
+        assert list(daemon.retries) == ['alice']
+
+        # not until the retry time
+        mocker.patch.object(KrbTicketDaemon, '_get_or_init', side_effect=get_or_init)
+        daemon.retry()
+        assert list(daemon.tickets) == ['bob']
+
+        daemon.retries['alice'] = 0
+        daemon.retry()
+        assert sorted(daemon.tickets) == ['alice', 'bob']
+        assert daemon.retries == {}
+    finally:
+        daemon.stop()
+
+
+def test_once_failure(config_file, mocker):
+    mocker.patch.object(KrbTicket, 'maybe_update', side_effect=[RuntimeError('KDC is unreachable'), None])
+    assert main(['--once', config_file]) == 1
+    assert KrbTicket.maybe_update.call_count == 2
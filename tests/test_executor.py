@@ -0,0 +1,69 @@
+from krbticket import KrbTicket, KrbCommand, KrbCommandHelper
+from helper import *
+from multiprocessing import Process, Queue
+import os
+import subprocess
+import pytest
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+@pytest.fixture
+def command_helper():
+    helper = KrbCommandHelper()
+    yield helper
+    helper.stop()
+
+
+def test_check_output(command_helper):
+    assert command_helper.check_output(['echo', 'hello']) == 'hello\n'
+    assert command_helper.check_output(['sh', '-c', 'echo $FOO'], env={'FOO': 'bar', 'PATH': os.environ['PATH']}) == 'bar\n'
+
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        command_helper.check_output(['sh', '-c', 'echo failed; exit 3'])
+    assert e.value.returncode == 3
+    assert e.value.output == 'failed\n'
+
+    with pytest.raises(FileNotFoundError):
+        command_helper.check_output(['/nonexistent/kinit'])
+
+
+def test_restart(command_helper):
+    command_helper.start()
+    pid = command_helper._process.pid
+    command_helper._process.kill()
+    command_helper._process.wait()
+
+    try:
+        command_helper.check_output(['true'])
+    except OSError:
+        # the request can be lost if the exit is not noticed yet
+        pass
+    assert command_helper.check_output(['echo', 'restarted']) == 'restarted\n'
+    assert command_helper._process.pid != pid
+
+
+def _default_helper_pid(queue):
+    queue.put(KrbCommandHelper.default()._pid)
+
+
+def test_default_after_fork():
+    helper = KrbCommandHelper.default()
+    assert KrbCommandHelper.default() is helper
+
+    queue = Queue()
+    p = Process(target=_default_helper_pid, args=(queue,))
+    p.start()
+    p.join()
+    assert queue.get() == p.pid
+
+
+def test_command_executor(mocker):
+    config = default_config(command_executor='helper')
+    mocker.spy(subprocess, 'check_output')
+    KrbCommand.kdestroy(config)
+    ticket = KrbTicket.init_by_config(config)
+    assert ticket.principal == config.principal
+    assert subprocess.check_output.call_count == 0
@@ -0,0 +1,80 @@
+from krbticket import KrbTicket, KrbCommand, KrbTicketFork, KrbConfig
+from helper import *
+import multiprocessing
+import os
+
+
+def teardown_function(function):
+    KrbTicketFork.unregister()
+    KrbTicket._destroy()
+
+
+def _child_ccache():
+    """
+    runs in the child: (KRB5CCNAME, ccache name of the ticket) w/o kinit
+    """
+    def kinit(config):
+        raise AssertionError("kinit is executed")
+    KrbCommand.kinit = kinit
+
+    ticket = KrbTicket.get_or_init(DEFAULT_PRINCIPAL, DEFAULT_KEYTAB)
+    assert ticket.expires
+    return os.environ.get('KRB5CCNAME'), ticket.config.ccache_name
+
+
+def _run_child(queue):
+    try:
+        queue.put(_child_ccache())
+    except Exception as e:
+        queue.put(e)
+
+
+def test_fork(config):
+    ticket = KrbTicket.init_by_config(config)
+    KrbTicketFork.register()
+
+    queue = multiprocessing.get_context('fork').Queue()
+    process = multiprocessing.get_context('fork').Process(target=_run_child, args=(queue,))
+    process.start()
+    result = queue.get(timeout=30)
+    process.join()
+
+    path = KrbConfig._per_process_ccache_path(process.pid)
+    try:
+        assert result == (path, path)
+        # removed at exit of the child
+        assert not os.path.exists(path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    # the parent is not affected
+    assert KrbTicket.__instances__[config.ccache_name] is ticket
+    assert os.environ.get('KRB5CCNAME') != path
+
+
+def test_fork_unregistered(config):
+    KrbTicket.init_by_config(config)
+    KrbTicketFork.register()
+    KrbTicketFork.unregister()
+
+    queue = multiprocessing.get_context('fork').Queue()
+    process = multiprocessing.get_context('fork').Process(target=_run_child, args=(queue,))
+    process.start()
+    assert isinstance(queue.get(timeout=30), AssertionError)
+    process.join()
+
+
+def test_initializer(config):
+    KrbTicket.init_by_config(config)
+
+    with multiprocessing.get_context('spawn').Pool(
+            1, initializer=KrbTicketFork.initializer, initargs=(config.ccache_name,)) as pool:
+        pid = pool.apply(os.getpid)
+        result = pool.apply(_child_ccache)
+
+    path = KrbConfig._per_process_ccache_path(pid)
+    try:
+        assert result == (path, path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,80 @@
+from krbticket import KrbCommand, KrbTicket, InProcessKrbCommand
+from krbticket.inprocess import _parse_duration
+from helper import *
+from datetime import datetime
+import pytest
+
+STARTING = 1574349790
+EXPIRES = STARTING + 3600
+RENEW_EXPIRES = STARTING + 86400
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+@pytest.mark.parametrize('duration, seconds', [
+    ('3600', 3600),
+    ('4s', 4),
+    ('10m', 600),
+    ('1d2h30m', 95400),
+    ('1:30', 5400),
+    ('1:30:15', 5415),
+    ])
+def test_parse_duration(duration, seconds):
+    assert _parse_duration(duration) == seconds
+
+
+@pytest.mark.parametrize('duration', ['', 'h', '1y', '1:2:3:4'])
+def test_parse_duration_invalid(duration):
+    with pytest.raises(ValueError):
+        _parse_duration(duration)
+
+
+def test_klist(tmp_path):
+    path = str(tmp_path / 'krb5cc')
+    write_ccache(path, DEFAULT_PRINCIPAL, [
+        ('krbtgt/EXAMPLE.COM@EXAMPLE.COM', STARTING, EXPIRES, RENEW_EXPIRES),
+        ])
+    config = default_config(ccache_name=path, command_class=InProcessKrbCommand)
+
+    output = InProcessKrbCommand.klist(config)
+    assert output.splitlines()[0] == 'Ticket cache: FILE:{}'.format(path)
+
+    ticket = KrbTicket.parse_from_klist(config, output)
+    assert ticket.file == path
+    assert ticket.principal == DEFAULT_PRINCIPAL
+    assert ticket.service_principal == 'krbtgt/EXAMPLE.COM@EXAMPLE.COM'
+    assert ticket.starting == datetime.fromtimestamp(STARTING)
+    assert ticket.expires == datetime.fromtimestamp(EXPIRES)
+    assert ticket.renew_expires == datetime.fromtimestamp(RENEW_EXPIRES)
+
+
+def test_command_class(mocker, tmp_path):
+    path = str(tmp_path / 'krb5cc')
+    write_ccache(path, DEFAULT_PRINCIPAL, [
+        ('krbtgt/EXAMPLE.COM@EXAMPLE.COM', STARTING, EXPIRES, RENEW_EXPIRES),
+        ])
+    config = default_config(ccache_name=path, command_class=InProcessKrbCommand)
+    mocker.spy(InProcessKrbCommand, 'klist')
+    mocker.spy(KrbCommand, '_run')
+
+    ticket = KrbTicket.get_by_config(config)
+    assert ticket.principal == DEFAULT_PRINCIPAL
+    assert InProcessKrbCommand.klist.call_count == 1
+    assert KrbCommand._run.call_count == 0
+
+
+def test_kinit(tmp_path):
+    pytest.importorskip('krb5')
+    config = default_config(ccache_name=str(tmp_path / 'krb5cc'), command_class=InProcessKrbCommand)
+
+    ticket = KrbTicket.init_by_config(config)
+    assert ticket.principal == config.principal
+    assert ticket.renew_expires is not None
+
+    ticket.renewal()
+    assert ticket.principal == config.principal
+
+    InProcessKrbCommand.kdestroy(config)
+    assert not InProcessKrbCommand.cache_exists(config)
@@ -0,0 +1,140 @@
+from krbticket import KrbLock, KrbCommand, KrbMetrics
+from helper import *
+from multiprocessing import Process, Event
+import os
+import threading
+
+
+def _hold(path, shared, acquired, release):
+    lock = KrbLock(path)
+    if shared:
+        lock.acquire_shared()
+    else:
+        lock.acquire_exclusive()
+    acquired.set()
+    release.wait(10)
+
+
+def _run_holder(path, shared):
+    acquired, release = Event(), Event()
+    process = Process(target=_hold, args=(path, shared, acquired, release))
+    process.start()
+    assert acquired.wait(10)
+    return process, release
+
+
+def test_lock_per_ccache(config):
+    assert KrbCommand.lock(config) is KrbCommand.lock(default_config())
+    assert KrbCommand.lock(config) is not KrbCommand.lock(default_config(ccache_name='/tmp/krb5cc_other'))
+
+
+def test_shared_lock_in_threads(tmp_path):
+    lock = KrbLock(str(tmp_path / 'lock'))
+    barrier = threading.Barrier(5, timeout=5)
+
+    def read():
+        with lock.shared():
+            barrier.wait()
+
+    threads = [threading.Thread(target=read) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not barrier.broken
+
+    with lock.shared():
+        assert not lock.acquire_exclusive(blocking=False)
+    assert lock.acquire_exclusive(blocking=False)
+    assert not lock.acquire_shared(blocking=False)
+    lock.release_exclusive()
+
+
+def test_shared_lock_between_processes(tmp_path):
+    path = str(tmp_path / 'lock')
+    lock = KrbLock(path)
+
+    process, release = _run_holder(path, shared=True)
+    assert lock.acquire_shared(blocking=False)
+    lock.release_shared()
+    assert not lock.acquire_exclusive(blocking=False)
+    release.set()
+    process.join()
+
+    process, release = _run_holder(path, shared=False)
+    assert not lock.acquire_shared(blocking=False)
+    assert not lock.acquire_exclusive(blocking=False)
+    release.set()
+    process.join()
+    assert lock.acquire_exclusive(blocking=False)
+    lock.release_exclusive()
+
+
+def test_lock_file_kept_open(tmp_path):
+    lock = KrbLock(str(tmp_path / 'lock'))
+    with lock.exclusive():
+        fd = lock._fd
+    with lock.shared():
+        assert lock._fd == fd
+
+    holder = lock.holder()
+    assert holder.pid == os.getpid()
+    assert holder.thread_id == threading.get_ident()
+    assert holder.mode == 'shared'
+
+
+def test_lock_reopened_after_fork(tmp_path):
+    lock = KrbLock(str(tmp_path / 'lock'))
+    with lock.exclusive():
+        pass
+
+    acquired, release = Event(), Event()
+    pid = os.fork()
+    if pid == 0:
+        with lock.exclusive():
+            acquired.set()
+            release.wait(10)
+        os._exit(0)
+
+    try:
+        assert acquired.wait(10)
+        # would be acquired if the child locked the fd shared with the parent
+        assert not lock.acquire_exclusive(blocking=False)
+    finally:
+        release.set()
+        os.waitpid(pid, 0)
+
+
+def test_lock_contended(tmp_path, mocker):
+    path = str(tmp_path / 'lock')
+    observer = KrbMetrics()
+    mocker.patch.object(observer, 'on_lock_contended')
+    KrbMetrics.register(observer)
+    try:
+        process, release = _run_holder(path, shared=False)
+        threading.Timer(0.5, release.set).start()
+        lock = KrbLock(path)
+        with lock.shared():
+            pass
+        process.join()
+    finally:
+        KrbMetrics.unregister(observer)
+
+    (lockfile, mode, holder), _ = observer.on_lock_contended.call_args
+    assert (lockfile, mode) == (path, 'shared')
+    assert holder.pid == process.pid
+    assert holder.mode == 'exclusive'
+    assert holder.thread_name == 'MainThread'
+
+
+def test_non_blocking_while_waiting_for_file_lock(tmp_path):
+    lock = KrbLock(str(tmp_path / 'lock'))
+    # as if another thread is waiting for lockf(3)
+    lock._file_lock.acquire()
+    try:
+        assert not lock.acquire_shared(blocking=False)
+        assert not lock.acquire_exclusive(blocking=False)
+    finally:
+        lock._file_lock.release()
+    assert lock.acquire_exclusive(blocking=False)
+    lock.release_exclusive()
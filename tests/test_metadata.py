@@ -0,0 +1,140 @@
+from krbticket import KrbTicket, KrbCommand, KrbTicketMetadata, KrbCredential
+from helper import *
+from datetime import datetime
+import os
+import threading
+import time
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+def _config(tmp_path, metadata_cache=True, **kwargs):
+    config = default_config(ccache_name=str(tmp_path / 'krb5cc'), metadata_cache=metadata_cache, **kwargs)
+    KrbTicket.init_by_config(config)
+    # out of the racy window of fingerprints
+    mtime = time.time() - 10
+    os.utime(config.ccache_name, (mtime, mtime))
+    # as if in a new process
+    KrbTicket.__instances__.clear()
+    return config
+
+
+def test_get_by_config_with_metadata(tmp_path, mocker):
+    config = _config(tmp_path)
+    ticket = KrbTicket.get_by_config(config)
+    assert os.path.isfile(config.ccache_metafile)
+
+    KrbTicket.__instances__.clear()
+    klist = mocker.spy(KrbCommand, 'klist')
+    loaded = KrbTicket.get_by_config(config)
+    assert klist.call_count == 0
+    assert loaded is not ticket
+    assert loaded.snapshot()[:-1] == ticket.snapshot()[:-1]
+    assert list(loaded.credentials) == list(ticket.credentials)
+    assert loaded._fingerprint == KrbCommand.ccache_fingerprint(config)
+
+
+def test_get_by_config_with_outdated_metadata(tmp_path, mocker):
+    config = _config(tmp_path)
+    KrbTicket.get_by_config(config)
+
+    KrbTicket.__instances__.clear()
+    mtime = time.time() - 5
+    os.utime(config.ccache_name, (mtime, mtime))
+    klist = mocker.spy(KrbCommand, 'klist')
+    KrbTicket.get_by_config(config)
+    assert klist.call_count == 1
+
+    # broken files are ignored
+    KrbTicket.__instances__.clear()
+    with open(config.ccache_metafile, 'w') as f:
+        f.write('{')
+    KrbTicket.get_by_config(config)
+    assert klist.call_count == 2
+
+
+def test_metadata_after_update(tmp_path):
+    # w/o backdating the ccache
+    config = default_config(ccache_name=str(tmp_path / 'krb5cc'), metadata_cache=True)
+    ticket = KrbTicket.init_by_config(config)
+    assert not os.path.exists(config.ccache_metafile)
+    # written after the racy window
+    time.sleep(1.5)
+    assert KrbTicketMetadata.read(config, KrbCommand.ccache_fingerprint(config))
+
+    ticket.renewal()
+    time.sleep(1.5)
+    file, principal, credentials = KrbTicketMetadata.read(config, KrbCommand.ccache_fingerprint(config))
+    assert credentials[0].expires == ticket.expires
+
+
+def test_get_by_config_without_metadata_cache(tmp_path, mocker):
+    config = _config(tmp_path, metadata_cache=False)
+    KrbTicket.get_by_config(config)
+    assert not os.path.exists(config.ccache_metafile)
+
+
+def test_untrusted_metadata(tmp_path, mocker):
+    config = _config(tmp_path)
+    KrbTicket.get_by_config(config)
+    klist = mocker.spy(KrbCommand, 'klist')
+
+    # writable by others
+    os.chmod(config.ccache_metafile, 0o666)
+    KrbTicket.__instances__.clear()
+    KrbTicket.get_by_config(config)
+    assert klist.call_count == 1
+
+    # a symlink to a file looking valid
+    os.chmod(config.ccache_metafile, 0o600)
+    os.rename(config.ccache_metafile, str(tmp_path / 'forged'))
+    os.symlink(str(tmp_path / 'forged'), config.ccache_metafile)
+    KrbTicket.__instances__.clear()
+    KrbTicket.get_by_config(config)
+    assert klist.call_count == 2
+
+
+def test_metadata_file(tmp_path):
+    config = default_config(ccache_name=str(tmp_path / 'krb5cc'))
+    tgt = KrbCredential(principal=DEFAULT_PRINCIPAL, service_principal='krbtgt/EXAMPLE.COM@EXAMPLE.COM',
+                        starting=datetime(2020, 1, 1, 0, 0, 0), expires=datetime(2020, 1, 1, 10, 0, 0, 500),
+                        renew_expires=datetime(2020, 1, 8), flags=0x40e00000)
+    service = KrbCredential(principal=DEFAULT_PRINCIPAL, service_principal='HTTP/www.example.com@EXAMPLE.COM',
+                            starting=datetime(2020, 1, 1, 1, 0, 0), expires=datetime(2020, 1, 1, 10, 0, 0))
+    ticket = KrbTicket(config=config, file=config.ccache_name, principal=DEFAULT_PRINCIPAL,
+                       starting=tgt.starting, expires=tgt.expires, service_principal=tgt.service_principal,
+                       renew_expires=tgt.renew_expires,
+                       credentials={c.service_principal: c for c in (service, tgt)})
+
+    KrbTicketMetadata.write(config, (1, 2, 3), ticket)
+    assert oct(os.stat(config.ccache_metafile).st_mode & 0o777) == oct(0o600)
+    assert KrbTicketMetadata.read(config, (1, 2, 4)) is None
+
+    file, principal, credentials = KrbTicketMetadata.read(config, (1, 2, 3))
+    assert (file, principal) == (config.ccache_name, DEFAULT_PRINCIPAL)
+    # the credential of the ticket attributes comes first
+    assert [_attributes(c) for c in credentials] == [_attributes(tgt), _attributes(service)]
+
+
+def test_concurrent_metadata_write(tmp_path):
+    config = default_config(ccache_name=str(tmp_path / 'krb5cc'))
+    ticket = KrbTicket(config=config, file=config.ccache_name, principal=DEFAULT_PRINCIPAL)
+    threads = [threading.Thread(target=KrbTicketMetadata.write, args=(config, (1, 2, 3), ticket)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert KrbTicketMetadata.read(config, (1, 2, 3))
+    assert os.listdir(str(tmp_path)) == [os.path.basename(config.ccache_metafile)]
+
+    # the temporary file is not removed unless it's created by the write
+    tmp_name = '{}.tmp.{}.{}'.format(config.ccache_metafile, os.getpid(), threading.get_ident())
+    open(tmp_name, 'w').close()
+    KrbTicketMetadata.write(config, (1, 2, 4), ticket)
+    assert os.path.exists(tmp_name)
+
+
+def _attributes(credential):
+    return tuple(getattr(credential, name) for name in KrbCredential.__slots__)
@@ -0,0 +1,78 @@
+from krbticket import KrbTicket, KrbCommand, KrbMetrics, KrbMetricsCollector
+from helper import *
+from datetime import datetime
+import gc
+import subprocess
+import time
+import pytest
+
+
+@pytest.fixture
+def collector():
+    collector = KrbMetricsCollector()
+    KrbMetrics.register(collector)
+    yield collector
+    KrbMetrics.unregister(collector)
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+def test_command_metrics(config, collector, mocker):
+    raise_exception_twice = [
+        subprocess.CalledProcessError(1, ['kinit']),
+        subprocess.CalledProcessError(1, ['kinit']),
+        None]
+    mocker.patch('subprocess.check_output', side_effect=raise_exception_twice)
+    KrbCommand.kinit(config)
+
+    snapshot = collector.snapshot()
+    assert snapshot['command_duration_seconds']['kinit']['count'] == 3
+    assert snapshot['command_errors_total'] == {'kinit': 2}
+    assert snapshot['command_retries_total'] == {'kinit': 2}
+    # the lock is taken per attempt
+    assert snapshot['lock_wait_seconds']['exclusive']['count'] == 3
+
+
+def test_ticket_metrics(config, collector):
+    KrbCommand.kdestroy(config)
+    ticket = KrbTicket.init_by_config(config)
+    ticket.maybe_update()
+    # just after the ticket reaches renewal_threshold, while it's still valid
+    time.sleep(max(0, (ticket.expires - config.renewal_threshold - datetime.now()).total_seconds()) + 0.2)
+    ticket.maybe_update()
+
+    snapshot = collector.snapshot()
+    assert snapshot['updates_total'] == {'renewal': 1}
+    assert snapshot['command_duration_seconds']['renewal']['count'] == 1
+    assert snapshot['tickets'][config.ccache_name]['principal'] == DEFAULT_PRINCIPAL
+    assert snapshot['tickets'][config.ccache_name]['expires_in_seconds'] > 0
+
+    text = collector.to_prometheus()
+    assert 'krbticket_command_duration_seconds_count{command="renewal"} 1' in text
+    assert 'krbticket_updates_total{action="renewal"} 1' in text
+    assert 'krbticket_ticket_expires_in_seconds{{principal="{}",ccache="{}"}}'.format(
+        DEFAULT_PRINCIPAL, config.ccache_name) in text
+
+
+def test_evicted_ticket_metrics(config, collector):
+    ticket = KrbTicket.init_by_config(config)
+    ticket.maybe_update()
+    assert config.ccache_name in collector.snapshot()['tickets']
+
+    del ticket
+    KrbTicket._destroy()
+    gc.collect()
+    assert collector.snapshot()['tickets'] == {}
+
+
+def test_failing_observer(config, mocker):
+    observer = KrbMetrics()
+    mocker.patch.object(observer, 'on_lock_wait', side_effect=Exception)
+    KrbMetrics.register(observer)
+    try:
+        KrbCommand.cache_exists(config)
+        assert observer.on_lock_wait.call_count == 1
+    finally:
+        KrbMetrics.unregister(observer)
@@ -0,0 +1,111 @@
+from krbticket import KrbCCacheReaper
+from helper import *
+from multiprocessing import Process, Event
+import fcntl
+import os
+import subprocess
+import sys
+import time
+
+
+def _exited_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def _create(directory, pid, mtime=None):
+    path = str(directory / 'krb5cc_{}_{}'.format(os.getuid(), pid))
+    for suffix in ('', '.krbticket.lock', '.krbticket.cmd.lock'):
+        with open(path + suffix, 'w'):
+            pass
+        if mtime:
+            os.utime(path + suffix, (mtime, mtime))
+    return path
+
+
+def _exists(path):
+    return [os.path.exists(path + suffix) for suffix in ('', '.krbticket.lock', '.krbticket.cmd.lock')]
+
+
+def test_reap(tmp_path):
+    exited = _create(tmp_path, _exited_pid())
+    other = tmp_path / 'krb5cc_{}_{}'.format(os.getuid() + 1, _exited_pid())
+    other.write_text('')
+    unrelated = tmp_path / 'krb5cc_{}'.format(os.getuid())
+    unrelated.write_text('')
+    # w/o the lock file of krbticket
+    unmarked = tmp_path / 'krb5cc_{}_{}'.format(os.getuid(), _exited_pid())
+    unmarked.write_text('')
+
+    assert KrbCCacheReaper(directory=str(tmp_path), min_age=0).reap() == [exited]
+    assert _exists(exited) == [False, False, False]
+    assert other.exists()
+    assert unrelated.exists()
+    assert unmarked.exists()
+
+
+def test_reap_reused_pid(tmp_path):
+    # modified before this process started
+    path = _create(tmp_path, os.getpid(), mtime=time.time() - 10 ** 7)
+    assert KrbCCacheReaper(directory=str(tmp_path), min_age=0).reap() == [path]
+    assert _exists(path) == [False, False, False]
+
+
+def test_reap_running(tmp_path):
+    path = _create(tmp_path, os.getpid())
+    assert KrbCCacheReaper(directory=str(tmp_path), min_age=0).reap() == []
+    assert _exists(path) == [True, True, True]
+
+
+def test_reap_young(tmp_path):
+    path = _create(tmp_path, _exited_pid())
+    assert KrbCCacheReaper(directory=str(tmp_path)).reap() == []
+    assert _exists(path) == [True, True, True]
+
+
+def _hold(path, acquired, release):
+    with open(path, 'a') as f:
+        # as fasteners.InterProcessLock does
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        acquired.set()
+        release.wait(10)
+
+
+def test_reap_locked(tmp_path):
+    path = _create(tmp_path, _exited_pid())
+    acquired, release = Event(), Event()
+    process = Process(target=_hold, args=(path + '.krbticket.cmd.lock', acquired, release))
+    process.start()
+    try:
+        assert acquired.wait(10)
+        assert KrbCCacheReaper(directory=str(tmp_path), min_age=0).reap() == []
+    finally:
+        release.set()
+        process.join()
+    assert _exists(path) == [True, True, True]
+
+
+def test_maybe_reap_disabled(mocker):
+    mocker.patch.object(KrbCCacheReaper, '__last_reaped__', None)
+    reap = mocker.patch.object(KrbCCacheReaper, 'reap', return_value=[])
+    KrbCCacheReaper.maybe_reap()
+    assert reap.call_count == 0
+
+
+def test_maybe_reap(mocker):
+    mocker.patch.object(KrbCCacheReaper, 'interval', 60)
+    mocker.patch.object(KrbCCacheReaper, '__last_reaped__', None)
+    reap = mocker.patch.object(KrbCCacheReaper, 'reap', return_value=[])
+    KrbCCacheReaper.maybe_reap()
+    KrbCCacheReaper.maybe_reap()
+    assert reap.call_count == 1
+
+
+def test_register_exit(tmp_path):
+    path = _create(tmp_path, os.getpid())
+    script = ("from krbticket import KrbCCacheReaper; "
+              "KrbCCacheReaper.register_exit({!r}); "
+              "KrbCCacheReaper.register_exit({!r})").format(path, path)
+    subprocess.check_call([sys.executable, '-c', script])
+    assert _exists(path) == [False, False, False]
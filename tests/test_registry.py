@@ -0,0 +1,141 @@
+from krbticket import KrbTicket, KrbTicketRegistry, KrbTicketState
+from helper import *
+from datetime import datetime
+import threading
+import time
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+    KrbTicket.configure_registry()
+
+
+def test_registry():
+    registry = KrbTicketRegistry(shards=4)
+    assert registry.setdefault('a', lambda: 1) == 1
+    assert registry.setdefault('a', lambda: 2) == 1
+    registry['b'] = 3
+    assert registry['b'] == 3
+    assert registry.get('c') is None
+    assert 'a' in registry
+    assert len(registry) == 2
+    assert sorted(registry.items()) == [('a', 1), ('b', 3)]
+    del registry['a']
+    assert 'a' not in registry
+    registry.clear()
+    assert not registry.values()
+
+
+def test_eviction_by_size():
+    evicted = []
+    registry = KrbTicketRegistry(shards=1, max_size=2, on_evict=evicted.append)
+    registry['a'] = 1
+    registry['b'] = 2
+    registry.get('a')
+    registry['c'] = 3
+    # b is the least recently used
+    assert evicted == [2]
+    assert sorted(registry.keys()) == ['a', 'c']
+
+
+def test_eviction_by_idle_time():
+    evicted = []
+    registry = KrbTicketRegistry(max_idle=0.1, on_evict=evicted.append)
+    registry['a'] = 1
+    registry['b'] = 2
+    time.sleep(0.2)
+    registry.get('b')
+    assert registry.evict() == [1]
+    assert evicted == [1]
+    assert registry.keys() == ['b']
+
+
+def test_concurrent_setdefault():
+    registry = KrbTicketRegistry()
+    created = []
+
+    def factory():
+        created.append(1)
+        return object()
+
+    def run():
+        for i in range(100):
+            registry.setdefault(i, factory)
+
+    threads = [threading.Thread(target=run) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(created) == 100
+    assert len(registry) == 100
+
+
+def test_eviction_stops_updater(config):
+    KrbTicket.configure_registry(max_idle=0.1)
+    ticket = KrbTicket.init_by_config(config)
+    ticket.updater_start(interval=60)
+    assert ticket.updater().is_alive()
+
+    time.sleep(0.2)
+    assert KrbTicket.__instances__.evict() == [ticket]
+    assert ticket.updater().stop_event.is_set()
+    # kdestroy since _destroy() doesn't know the evicted ticket
+    ticket.config.command_class.kdestroy(ticket.config)
+
+
+def test_updater_keeps_ticket(config):
+    KrbTicket.configure_registry(shards=1, max_idle=0.5)
+    ticket = KrbTicket.init_by_config(config)
+    ticket.updater_start(interval=0.1)
+    # reloads skip the registry lookup once the fingerprint is out of the racy window
+    time.sleep(2)
+    assert ticket.fingerprint_hits > 0
+
+    # lookup of another ccache
+    KrbTicket.__instances__.get('other')
+    assert KrbTicket.__instances__.get(config.ccache_name) is ticket
+    assert ticket.updater().is_alive()
+    ticket.updater().stop()
+
+
+def test_reload_evicted_ticket(config):
+    KrbTicket.configure_registry(max_idle=0.1)
+    ticket = KrbTicket.init_by_config(config)
+    expires = ticket.expires
+    time.sleep(0.2)
+    assert KrbTicket.__instances__.evict() == [ticket]
+
+    time.sleep(1)
+    ticket.config.command_class.kinit(ticket.config)
+    ticket.reload()
+    assert ticket.expires > expires
+    # registered again
+    assert KrbTicket.get_by_config(config) is ticket
+
+
+def test_reload_ticket_replaced_after_eviction(config):
+    KrbTicket.configure_registry(max_idle=0.1)
+    ticket = KrbTicket.init_by_config(config)
+    expires = ticket.expires
+    time.sleep(0.2)
+    KrbTicket.__instances__.evict()
+
+    time.sleep(1)
+    other = KrbTicket.init_by_config(config)
+    assert other is not ticket
+    ticket.reload()
+    assert ticket.expires == other.expires > expires
+
+
+def test_snapshot(config):
+    ticket = KrbTicket.init_by_config(config)
+    snapshot = ticket.snapshot()
+    assert isinstance(snapshot, KrbTicketState)
+    assert snapshot.expires == ticket.expires
+    assert not hasattr(snapshot, '__dict__')
+
+    ticket.update(expires=datetime(2000, 1, 1))
+    assert ticket.expires == datetime(2000, 1, 1)
+    # snapshots are immutable
+    assert snapshot.expires != ticket.expires
@@ -0,0 +1,89 @@
+from krbticket import KrbTicket, KrbCommand, KrbTicketStatusServer, KrbTicketStatusClient
+from helper import *
+from datetime import datetime, timedelta
+import socket
+import subprocess
+import pytest
+
+
+def teardown_function(function):
+    KrbTicket._destroy()
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = KrbTicketStatusServer(str(tmp_path / 'status.sock'))
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_status(config, server):
+    KrbCommand.kdestroy(config)
+    ticket = KrbTicket.init_by_config(config)
+    ticket.maybe_update()
+    client = KrbTicketStatusClient(server.path)
+
+    [status] = client.status()
+    assert status['ccache_name'] == config.ccache_name
+    assert status['principal'] == DEFAULT_PRINCIPAL
+    assert abs(status['expires'] - ticket.expires) < timedelta(seconds=1)
+    assert abs(status['renew_expires'] - ticket.renew_expires) < timedelta(seconds=1)
+    assert status['valid']
+    assert status['last_error'] is None
+    assert status['last_checked'] <= datetime.now()
+
+    assert client.is_valid(principal=DEFAULT_PRINCIPAL)
+    assert client.is_valid(ccache_name=config.ccache_name)
+    assert not client.status(principal='unknown@EXAMPLE.COM')
+    assert not client.is_valid(principal='unknown@EXAMPLE.COM')
+
+
+def test_last_error(config, server, mocker):
+    KrbCommand.kdestroy(config)
+    ticket = KrbTicket.init_by_config(config)
+    mocker.patch.object(ticket, 'reload', side_effect=subprocess.CalledProcessError(1, ['klist']))
+    with pytest.raises(subprocess.CalledProcessError):
+        ticket.maybe_update()
+
+    [status] = KrbTicketStatusClient(server.path).status()
+    assert status['last_error'].startswith('CalledProcessError')
+
+
+def test_cache(config, server, mocker):
+    KrbCommand.kdestroy(config)
+    KrbTicket.init_by_config(config)
+    client = KrbTicketStatusClient(server.path, ttl=60)
+    mocker.spy(client, '_request')
+
+    assert client.status() == client.status()
+    assert client._request.call_count == 1
+    client.status(principal=DEFAULT_PRINCIPAL)
+    assert client._request.call_count == 2
+
+
+def test_no_server(tmp_path):
+    with pytest.raises(OSError):
+        KrbTicketStatusClient(str(tmp_path / 'status.sock')).status()
+
+
+def test_stale_socket(tmp_path):
+    path = str(tmp_path / 'status.sock')
+    # left by a killed process
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+
+    server = KrbTicketStatusServer(path)
+    server.start()
+    try:
+        assert KrbTicketStatusClient(path).status() == []
+    finally:
+        server.stop()
+
+
+def test_live_socket(server):
+    with pytest.raises(OSError):
+        KrbTicketStatusServer(server.path).start()
+    # the running server keeps serving
+    assert KrbTicketStatusClient(server.path).status() == []
@@ -1,9 +1,13 @@
-from krbticket import KrbTicket, KrbCommand, NoCredentialFound
+from krbticket import KrbTicket, KrbCommand, KrbCircuitBreaker, KrbTicketInitError, NoCredentialFound
 from helper import *
 from datetime import datetime
 from freezegun import freeze_time
+import concurrent.futures
 import os
+import pytest
 import subprocess
+import threading
+import time
 
 def teardown_function(function):
     KrbTicket._destroy()
@@ -121,6 +125,87 @@ Valid starting     Expires            Service principal
     assert ticket.expires == datetime(2019, 11, 22, 0, 23, 12)
     assert ticket.renew_expires == datetime(2019, 12, 20, 0, 23, 10)
 
+@freeze_time("2019-11-22 00:00:00")
+def test_parse_klist_output_with_service_tickets(config):
+    output = """
+Ticket cache: FILE:/tmp/krb5cc_1000
+Default principal: user@EXAMPLE.COM
+
+Valid starting     Expires            Service principal
+11/22/19 00:23:10  11/22/19 10:23:10  krbtgt/EXAMPLE.COM@EXAMPLE.COM
+        renew until 12/20/19 00:23:10
+11/22/19 00:24:10  11/22/19 10:23:10  HTTP/nn.example.com@EXAMPLE.COM
+11/21/19 00:24:10  11/21/19 10:23:10  kafka/broker.example.com@EXAMPLE.COM
+""".strip()
+    ticket = KrbTicket.parse_from_klist(config, output)
+    assert ticket.file == '/tmp/krb5cc_1000'
+    assert ticket.service_principal == 'krbtgt/EXAMPLE.COM@EXAMPLE.COM'
+    assert ticket.renew_expires == datetime(2019, 12, 20, 0, 23, 10)
+    assert len(ticket.credentials) == 3
+
+    http = ticket.service_ticket('HTTP/nn.example.com@EXAMPLE.COM')
+    assert http.starting == datetime(2019, 11, 22, 0, 24, 10)
+    assert http.expires == datetime(2019, 11, 22, 10, 23, 10)
+    assert http.renew_expires is None
+    assert ticket.service_ticket('HTTP/nn.example.com') is http
+    assert ticket.service_ticket('HTTP/unknown.example.com') is None
+    assert [c.service_principal for c in ticket.service_tickets()] == [
+        'HTTP/nn.example.com@EXAMPLE.COM', 'kafka/broker.example.com@EXAMPLE.COM']
+
+    assert ticket.is_service_ticket_valid('HTTP/nn.example.com')
+    assert not ticket.is_service_ticket_valid('kafka/broker.example.com')
+    assert not ticket.is_service_ticket_valid('HTTP/unknown.example.com')
+
+
+def test_service_ticket_with_native_reader(tmp_path):
+    path = str(tmp_path / 'krb5cc')
+    starting = int(time.time())
+    write_ccache(path, DEFAULT_PRINCIPAL, [
+        ('krbtgt/EXAMPLE.COM@EXAMPLE.COM', starting, starting + 3600, starting + 7200),
+        ('HTTP/nn.example.com@EXAMPLE.COM', starting, starting + 3600, None),
+        ])
+    config = default_config(ccache_name=path, ccache_reader='native')
+
+    ticket = KrbTicket.get_by_config(config)
+    assert ticket.service_principal == 'krbtgt/EXAMPLE.COM@EXAMPLE.COM'
+    assert ticket.service_ticket('HTTP/nn.example.com').expires == datetime.fromtimestamp(starting + 3600)
+    assert ticket.is_service_ticket_valid('HTTP/nn.example.com')
+
+
+@pytest.mark.parametrize('ccache_reader', ['klist', 'native'])
+def test_refresh_collection(mocker, tmp_path, ccache_reader):
+    starting = int(time.time())
+    principals = ['alice@EXAMPLE.COM', 'bob@EXAMPLE.COM']
+    tickets = []
+    for principal in principals:
+        path = str(tmp_path / 'tkt_{}'.format(principal.split('@')[0]))
+        write_ccache(path, principal, [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', starting, starting + 3600, None)])
+        tickets.append(KrbTicket.get_by_config(default_config(principal=principal, ccache_name='DIR::' + path)))
+    # not in the collection
+    write_ccache(str(tmp_path / 'other'), 'carol@EXAMPLE.COM', [])
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    write_ccache(str(outside / 'tkt_dave'), 'dave@EXAMPLE.COM', [])
+    KrbTicket.get_by_config(default_config(principal='dave@EXAMPLE.COM', ccache_name=str(outside / 'tkt_dave')))
+
+    for (i, principal) in enumerate(principals):
+        write_ccache(str(tmp_path / 'tkt_{}'.format(principal.split('@')[0])), principal, [
+            ('krbtgt/EXAMPLE.COM@EXAMPLE.COM', starting, starting + 7200 + i, None),
+            ('HTTP/nn.example.com@EXAMPLE.COM', starting, starting + 3600, None)])
+    mocker.spy(KrbCommand, '_run')
+    mocker.spy(KrbCommand, '_read_lock')
+
+    collection = default_config(ccache_name='DIR:{}'.format(tmp_path), ccache_reader=ccache_reader)
+    updated = KrbTicket.refresh_collection(collection)
+    assert KrbCommand._run.call_count == (1 if ccache_reader == 'klist' else 0)
+    assert updated == tickets
+    assert KrbCommand._read_lock.call_count == len(tickets)
+    for (i, ticket) in enumerate(tickets):
+        assert ticket.principal == principals[i]
+        assert ticket.expires == datetime.fromtimestamp(starting + 7200 + i)
+        assert ticket.service_ticket('HTTP/nn.example.com')
+
+
 @freeze_time("2019-11-20 00:00:00")
 def test_expires(config):
     ticket = KrbTicket(
@@ -160,3 +245,156 @@ def test_expires(config):
     assert ticket.is_renewalable() == False;
 
 
+
+def test_reload_with_fingerprint_cache(tmp_path, mocker):
+    path = str(tmp_path / 'krb5cc')
+    now = int(time.time())
+    write_ccache(path, DEFAULT_PRINCIPAL, [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', now, now + 3600, None)])
+    os.utime(path, (now - 10, now - 10))
+    config = default_config(ccache_name=path, ccache_reader='native')
+
+    ticket = KrbTicket.get_by_config(config)
+    read_ccache = mocker.spy(KrbCommand, 'read_ccache')
+    ticket.reload()
+    ticket.reload()
+    assert read_ccache.call_count == 0
+    assert ticket.fingerprint_hits == 2
+    assert ticket.fingerprint_misses == 0
+
+    write_ccache(path, DEFAULT_PRINCIPAL, [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', now, now + 7200, None)])
+    ticket.reload()
+    assert read_ccache.call_count == 1
+    assert ticket.fingerprint_misses == 1
+    assert ticket.expires == datetime.fromtimestamp(now + 7200)
+
+
+def test_maybe_update_with_open_circuit(config, mocker):
+    KrbCircuitBreaker.__instances__.clear()
+    config.circuit_breaker_threshold = 1
+    ticket = KrbTicket.init_by_config(config)
+    expires = ticket.expires
+    try:
+        KrbCircuitBreaker.get(config).failure()
+        mocker.patch.object(KrbTicket, 'is_expired', return_value=True)
+        mocker.spy(KrbCommand, '_execute')
+
+        # keeps the cached ticket
+        ticket.maybe_update()
+        assert ticket.expires == expires
+        assert ticket.last_error.startswith('KrbCircuitOpenError')
+        assert not [c for c in KrbCommand._execute.call_args_list if c[0][1][0] == config.kinit_bin]
+    finally:
+        KrbCircuitBreaker.__instances__.clear()
+
+
+def test_current(config, mocker):
+    ticket = KrbTicket.init_by_config(config)
+    mocker.spy(KrbCommand, 'klist')
+
+    # fresh
+    assert ticket.current() is ticket
+    assert not KrbCommand.klist.called
+
+    # stale, but valid: refreshed in background
+    refreshed_at = ticket._refreshed_at
+    assert ticket.current(max_staleness=0) is ticket
+    ticket._refresh_thread.join()
+    assert ticket._refreshed_at > refreshed_at
+
+
+def test_current_with_updater(config, mocker):
+    ticket = KrbTicket.init_by_config(config)
+    ticket.updater_start(interval=60)
+    mocker.patch.object(ticket.updater(), 'wakeup')
+    ticket.current(max_staleness=0)
+    assert ticket.updater().wakeup.called
+    assert not ticket._refresh_thread
+
+
+def test_current_with_expired_ticket(config):
+    ticket = KrbTicket.init_by_config(config)
+    ticket.expires = datetime.now()
+
+    # blocks until the ticket is updated
+    ticket.current()
+    assert ticket.expires > datetime.now()
+
+
+@requires_fake_krb5
+def test_keyring(monkeypatch, tmp_path, mocker):
+    monkeypatch.setenv('FAKE_KRB5_STORE', str(tmp_path))
+    config = default_config(ccache_name='KEYRING:process:krbticket_test', lock_dir=str(tmp_path))
+    with pytest.raises(NoCredentialFound):
+        KrbTicket.get_by_config(config)
+
+    ticket = KrbTicket.init_by_config(config)
+    assert ticket.principal == DEFAULT_PRINCIPAL
+    assert ticket.expires > datetime.now()
+    assert KrbTicket.get_by_config(config) is ticket
+
+    # a single klist checks the existence and reads the ccache
+    execute = mocker.spy(KrbCommand, '_execute')
+    ticket.reload()
+    assert execute.call_count == 1
+
+    # expired tickets are updated instead of NoCredentialFound
+    starting = int(time.time()) - 7200
+    write_ccache(str(tmp_path / 'KEYRING_process_krbticket_test'), DEFAULT_PRINCIPAL,
+                 [('krbtgt/EXAMPLE.COM@EXAMPLE.COM', starting, starting + 3600, None)])
+    ticket.maybe_update()
+    assert ticket.expires > datetime.now()
+
+
+def test_init_many(monkeypatch, tmp_path):
+    monkeypatch.setenv('FAKE_KRB5_LATENCY', '0.5')
+    configs = [default_config(ccache_name=str(tmp_path / 'krb5cc_{}'.format(i))) for i in range(4)]
+
+    started = time.monotonic()
+    tickets = KrbTicket.init_many(configs)
+    # kinit and klist of each config run concurrently
+    assert time.monotonic() - started < 4 * 1.0
+    assert [t.config.ccache_name for t in tickets] == [c.ccache_name for c in configs]
+    assert all(KrbTicket.__instances__[c.ccache_name] is t for (c, t) in zip(configs, tickets))
+
+    with pytest.raises(ValueError):
+        KrbTicket.init_many([configs[0], configs[0]])
+
+
+def test_init_many_with_errors(tmp_path):
+    configs = [default_config(ccache_name=str(tmp_path / 'krb5cc_0')),
+               default_config(ccache_name=str(tmp_path / 'krb5cc_1'), keytab=str(tmp_path / 'nonexistent'),
+                              retry_options={'stop_max_attempt_number': 1})]
+    with pytest.raises(KrbTicketInitError) as e:
+        KrbTicket.init_many(configs)
+    assert list(e.value.errors) == [configs[1].ccache_name]
+    assert isinstance(e.value.errors[configs[1].ccache_name], subprocess.CalledProcessError)
+    assert e.value.tickets[0].principal == DEFAULT_PRINCIPAL
+    assert e.value.tickets[1] is None
+
+
+def test_init_many_with_timeout(tmp_path, mocker):
+    release = threading.Event()
+    init_by_config = KrbTicket.init_by_config
+
+    def init(config):
+        if config.ccache_name.endswith('_1'):
+            release.wait(10)
+        return init_by_config(config)
+
+    mocker.patch.object(KrbTicket, 'init_by_config', side_effect=init)
+    configs = [default_config(ccache_name=str(tmp_path / 'krb5cc_{}'.format(i))) for i in range(3)]
+    try:
+        with pytest.raises(KrbTicketInitError) as e:
+            KrbTicket.init_many(configs, max_workers=2, timeout=0.5)
+    finally:
+        release.set()
+    assert list(e.value.errors) == [configs[1].ccache_name]
+    assert isinstance(e.value.errors[configs[1].ccache_name], concurrent.futures.TimeoutError)
+    assert e.value.tickets[2] is not None
+
+    # the timed out kinit registers the ticket when it finishes
+    for i in range(50):
+        if configs[1].ccache_name in KrbTicket.__instances__:
+            break
+        time.sleep(0.1)
+    assert configs[1].ccache_name in KrbTicket.__instances__
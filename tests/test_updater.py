@@ -1,6 +1,11 @@
-from krbticket import KrbTicket, KrbCommand
+from krbticket import KrbTicket, KrbCommand, KrbTicketUpdater
 from krbticket import SimpleKrbTicketUpdater, SingleProcessKrbTicketUpdater, MultiProcessKrbTicketUpdater
+from krbticket import SharedKrbTicketUpdater, KrbTicketScheduler, LeaderKrbTicketUpdater, KrbTicketLease
 from helper import *
+from datetime import datetime
+from freezegun import freeze_time
+import os
+import threading
 import time
 import pytest
 from multiprocessing import Process
@@ -47,7 +52,9 @@ def test_updater_start(config):
 @pytest.mark.parametrize('config', [
     default_config(updater_class=SimpleKrbTicketUpdater),
     default_config(updater_class=MultiProcessKrbTicketUpdater),
-    default_config(updater_class=SingleProcessKrbTicketUpdater)
+    default_config(updater_class=SingleProcessKrbTicketUpdater),
+    default_config(updater_class=SharedKrbTicketUpdater),
+    default_config(updater_class=LeaderKrbTicketUpdater)
 ])
 def test_renewal(config):
     """
@@ -85,7 +92,8 @@ def test_renewal(config):
 @pytest.mark.parametrize('config_str', [
     'default_config(updater_class=SimpleKrbTicketUpdater)',
     'default_config(updater_class=MultiProcessKrbTicketUpdater)',
-    'default_config(updater_class=SingleProcessKrbTicketUpdater)'
+    'default_config(updater_class=SingleProcessKrbTicketUpdater)',
+    'default_config(updater_class=LeaderKrbTicketUpdater)'
 ])
 def test_multiprocessing_renewal(config_str, caplog):
     KrbCommand.kdestroy(eval(config_str))
@@ -201,3 +209,156 @@ def _updater_run(config):
     updater = ticket.updater(interval=0.5)
     updater.start()
     updater.start()
+
+
+@freeze_time("2019-11-20 00:00:00")
+def test_next_interval(config):
+    ticket = KrbTicket(
+            config,
+            starting=datetime(2019, 11, 19, 23, 0, 0),
+            expires=datetime(2019, 11, 20, 0, 10, 0),
+            renew_expires=datetime(2019, 11, 21, 0, 0, 0))
+
+    assert KrbTicketUpdater(ticket, interval=60).next_interval() == 60
+
+    updater = KrbTicketUpdater(ticket, interval=60, schedule=KrbTicketUpdater.SCHEDULE_DEADLINE)
+    # expires - renewal_threshold(1 sec), regardless of interval
+    assert updater.next_interval() == 599
+
+    updater = KrbTicketUpdater(ticket, interval=60, schedule=KrbTicketUpdater.SCHEDULE_DEADLINE, max_interval=300)
+    assert updater.next_interval() == 300
+
+    ticket.expires = datetime(2019, 11, 19, 23, 59, 0)
+    updater = KrbTicketUpdater(ticket, interval=60, schedule=KrbTicketUpdater.SCHEDULE_DEADLINE, min_interval=5)
+    assert updater.next_interval() == 5
+
+    # the lifetime is not longer than renewal_threshold
+    ticket.starting = datetime(2019, 11, 19, 23, 59, 59, 500000)
+    updater = KrbTicketUpdater(ticket, interval=60, schedule=KrbTicketUpdater.SCHEDULE_DEADLINE)
+    assert updater.next_interval() == 60
+
+
+def test_stop_interrupts_wait(config, mocker):
+    ticket = KrbTicket(config)
+    mocker.patch.object(ticket, 'maybe_update')
+    updater = ticket.updater(interval=60)
+    updater.start()
+    updater.stop()
+    updater.join(timeout=5)
+    assert not updater.is_alive()
+
+
+def test_update_failure(config, mocker):
+    ticket = KrbTicket(config)
+    mocker.patch.object(ticket, 'maybe_update', side_effect=[RuntimeError('KDC is unreachable')] + [None] * 100)
+    updater = ticket.updater(interval=0.1)
+    updater.start()
+    time.sleep(0.5)
+    try:
+        assert updater.is_alive()
+        assert ticket.maybe_update.call_count >= 2
+    finally:
+        updater.stop()
+        updater.join(timeout=5)
+
+
+@pytest.mark.parametrize('updater_class', [SimpleKrbTicketUpdater, SharedKrbTicketUpdater])
+def test_wakeup(updater_class, mocker):
+    mocker.patch.object(SharedKrbTicketUpdater, 'scheduler', KrbTicketScheduler())
+    ticket = KrbTicket(default_config(updater_class=updater_class))
+    mocker.patch.object(ticket, 'maybe_update')
+    updater = ticket.updater(interval=60)
+    updater.start()
+    time.sleep(0.2)
+    assert ticket.maybe_update.call_count == 1
+
+    updater.wakeup()
+    time.sleep(0.2)
+    assert ticket.maybe_update.call_count == 2
+    updater.stop()
+
+
+@pytest.mark.parametrize('max_workers', [None, 2])
+def test_shared_updater(max_workers, mocker):
+    scheduler = KrbTicketScheduler(max_workers=max_workers)
+    mocker.patch.object(SharedKrbTicketUpdater, 'scheduler', scheduler)
+    tickets = [KrbTicket(default_config(ccache_name='/tmp/krb5cc_shared_{}'.format(i),
+                                        updater_class=SharedKrbTicketUpdater)) for i in range(10)]
+    for ticket in tickets:
+        mocker.patch.object(ticket, 'maybe_update')
+
+    threads = threading.active_count()
+    for ticket in tickets:
+        ticket.updater_start(interval=0.1)
+        ticket.updater_start(interval=0.1)
+    assert all(ticket.updater().is_alive() for ticket in tickets)
+    assert threading.active_count() <= threads + 1 + (max_workers or 0)
+
+    time.sleep(0.5)
+    for ticket in tickets:
+        assert ticket.maybe_update.call_count >= 2
+        ticket.updater().stop()
+        assert not ticket.updater().is_alive()
+    assert not scheduler.updaters()
+
+
+def test_jitter(config):
+    ticket = KrbTicket(config)
+    assert KrbTicketUpdater(ticket, interval=60).next_interval() == 60
+    intervals = [KrbTicketUpdater(ticket, interval=60, jitter=0.5).next_interval() for i in range(100)]
+    assert all(30 <= i <= 60 for i in intervals)
+    assert len(set(intervals)) > 1
+
+
+def _acquire_lease(path, queue):
+    lease = KrbTicketLease(path, timeout=1)
+    queue.put((lease.acquire(), lease.is_expired()))
+
+
+def test_lease(tmp_path):
+    from multiprocessing import Queue
+    path = str(tmp_path / 'krb5cc.krbticket.lease')
+    lease = KrbTicketLease(path, timeout=1)
+    assert lease.is_expired()
+    assert lease.acquire()
+    assert lease.acquire()
+    lease.heartbeat()
+    assert lease.holder()[0] == os.getpid()
+
+    # another process is a follower while the leader keeps the heartbeat
+    queue = Queue()
+    p = Process(target=_acquire_lease, args=(path, queue))
+    p.start()
+    p.join()
+    assert queue.get() == (False, False)
+
+    # the leader doesn't respond
+    time.sleep(1.5)
+    assert lease.is_expired()
+
+    lease.release()
+    p = Process(target=_acquire_lease, args=(path, queue))
+    p.start()
+    p.join()
+    assert queue.get()[0]
+
+
+def test_leader_updater(config, mocker):
+    ticket = KrbTicket(config)
+    mocker.patch.object(ticket, 'maybe_update')
+    mocker.patch.object(ticket, 'reload')
+    leader = LeaderKrbTicketUpdater(ticket, interval=60)
+    leader.update()
+    assert ticket.maybe_update.call_count == 1
+
+    follower = LeaderKrbTicketUpdater(ticket, interval=60)
+    mocker.patch.object(follower.lease, 'acquire', return_value=False)
+    mocker.patch.object(ticket, 'is_expired', return_value=True)
+    follower.update()
+    assert ticket.reload.call_count == 1
+    assert ticket.maybe_update.call_count == 1
+
+    mocker.patch.object(follower.lease, 'is_expired', return_value=True)
+    follower.update()
+    assert ticket.maybe_update.call_count == 2
+    leader.stop()